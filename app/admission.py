@@ -0,0 +1,302 @@
+"""
+Контроль допуска запросов (admission control) перед обращением к БД.
+
+Когда PostgreSQL замедляется, потоки воркера один за другим застревают
+в вызовах app.db, и под перестаёт отвечать даже на пробы. Контроль допуска
+ограничивает число запросов, которые воркер обрабатывает одновременно:
+- не больше ADMISSION_MAX_INFLIGHT запросов в работе;
+- ещё до ADMISSION_QUEUE_SIZE запросов ждут свободного места не дольше
+  ADMISSION_QUEUE_TIMEOUT_MS, остальные сразу получают 503 с Retry-After;
+- у каждого клиента свой «бочонок с токенами» (ADMISSION_RATE запросов
+  в секунду, всплеск до ADMISSION_BURST), сверх него — 429 с Retry-After.
+
+В адаптивном режиме (ADMISSION_ADAPTIVE=1) предел подстраивается под
+задержку БД: раз в ADMISSION_ADJUST_SECONDS средняя длительность операции
+БД сравнивается с ADMISSION_TARGET_DB_MS; выше цели предел уменьшается
+на четверть (не ниже ADMISSION_MIN_INFLIGHT), иначе растёт на единицу
+до ADMISSION_MAX_INFLIGHT.
+
+Все ограничения действуют внутри одного воркера gunicorn: общий предел
+пода — сумма пределов воркеров. Служебные endpoint'ы (пробы, /metrics)
+и поток /events не ограничиваются.
+
+Если ни ADMISSION_MAX_INFLIGHT, ни ADMISSION_RATE не заданы, install()
+ничего не регистрирует.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+
+from app import metrics, timing
+from app.logger import app_logger
+
+OVERLOADED_MESSAGE = "Сервер перегружен, повторите запрос позже"
+RATE_LIMITED_MESSAGE = "Слишком много запросов, повторите позже"
+
+
+def get_admission_config():
+    """
+    Читает настройки контроля допуска из переменных окружения.
+
+    - ADMISSION_MAX_INFLIGHT — запросов в работе на воркер (0 — без предела)
+    - ADMISSION_QUEUE_SIZE — сколько запросов может ждать места (по умолчанию — как предел)
+    - ADMISSION_QUEUE_TIMEOUT_MS — сколько запрос ждёт места, миллисекунды
+    - ADMISSION_RETRY_AFTER — значение Retry-After ответа 503, секунды
+    - ADMISSION_RATE — запросов в секунду на клиента (0 — без ограничения)
+    - ADMISSION_BURST — размер всплеска на клиента (по умолчанию — 2 × ADMISSION_RATE)
+    - ADMISSION_CLIENT_HEADER — заголовок с адресом клиента (X-Forwarded-For за ingress);
+      по умолчанию — адрес соединения
+    - ADMISSION_MAX_CLIENTS — сколько клиентов помнить (самые давние забываются)
+    - ADMISSION_ADAPTIVE — подстраивать предел под задержку БД
+    - ADMISSION_TARGET_DB_MS — целевая средняя длительность операции БД
+    - ADMISSION_MIN_INFLIGHT — нижняя граница адаптивного предела
+    - ADMISSION_ADJUST_SECONDS — как часто пересматривать предел
+    """
+    max_inflight = int(os.getenv("ADMISSION_MAX_INFLIGHT", "0"))
+    rate = float(os.getenv("ADMISSION_RATE", "0"))
+    return {
+        "max_inflight": max_inflight,
+        "queue_size": int(os.getenv("ADMISSION_QUEUE_SIZE") or max_inflight),
+        "queue_timeout": float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "100")) / 1000,
+        "retry_after": int(os.getenv("ADMISSION_RETRY_AFTER", "1")),
+        "rate": rate,
+        "burst": float(os.getenv("ADMISSION_BURST") or max(1.0, 2 * rate)),
+        "client_header": os.getenv("ADMISSION_CLIENT_HEADER", ""),
+        "max_clients": int(os.getenv("ADMISSION_MAX_CLIENTS", "10000")),
+        "adaptive": os.getenv("ADMISSION_ADAPTIVE", "0").lower() in ("1", "true", "yes"),
+        "target_db": float(os.getenv("ADMISSION_TARGET_DB_MS", "50")) / 1000,
+        "min_inflight": int(os.getenv("ADMISSION_MIN_INFLIGHT", "1")),
+        "adjust_interval": float(os.getenv("ADMISSION_ADJUST_SECONDS", "1")),
+    }
+
+
+class ConcurrencyLimiter:
+    """
+    Предел одновременных запросов с короткой очередью ожидания.
+
+    Args:
+        limit: Сколько запросов может быть в работе
+        queue_size: Сколько запросов может ждать места
+        queue_timeout: Сколько секунд запрос ждёт места
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Занимает место, если нужно — ждёт его в очереди.
+
+        Returns:
+            Пара (причина отказа или None, сколько секунд запрос ждал)
+        """
+        with self._cond:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return None, 0.0
+            if self.waiting >= self.queue_size:
+                return "queue_full", 0.0
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return "queue_timeout", time.monotonic() - started
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return None, time.monotonic() - started
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def set_limit(self, limit: int):
+        with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+
+class TokenBuckets:
+    """
+    «Бочонки с токенами» по клиентам: rate токенов в секунду, не больше burst.
+
+    Args:
+        rate: Скорость пополнения, токенов в секунду
+        burst: Ёмкость бочонка
+        max_clients: Сколько клиентов помнить
+        clock: Источник времени (для тестов)
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client: str) -> float:
+        """
+        Берёт токен клиента.
+
+        Returns:
+            0, если токен был, иначе через сколько секунд он появится
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdaptiveLimit:
+    """
+    Подстраивает предел ConcurrencyLimiter под среднюю длительность операций БД
+    (уменьшение на четверть выше цели, рост на единицу ниже неё).
+    """
+
+    def __init__(self, limiter: ConcurrencyLimiter, minimum: int, maximum: int, target: float,
+                 interval: float, clock=time.monotonic):
+        self.limiter = limiter
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.interval = interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._window_started = clock()
+        self._db_seconds = 0.0
+        self._db_ops = 0
+
+    def observe(self, db_seconds: float, db_ops: int):
+        if not db_ops:
+            return
+        with self._lock:
+            self._db_seconds += db_seconds
+            self._db_ops += db_ops
+            now = self.clock()
+            if now - self._window_started < self.interval:
+                return
+            average = self._db_seconds / self._db_ops
+            self._window_started, self._db_seconds, self._db_ops = now, 0.0, 0
+            current = self.limiter.limit
+            if average > self.target:
+                limit = max(self.minimum, int(current * 0.75))
+            else:
+                limit = min(self.maximum, current + 1)
+            if limit == current:
+                return
+        self.limiter.set_limit(limit)
+        metrics.admission_limit.set(limit)
+        if limit < current:
+            app_logger.warning(
+                "Задержка БД %.1f мс выше цели %.1f мс, предел запросов снижен: %d -> %d",
+                average * 1000, self.target * 1000, current, limit,
+            )
+
+
+def _client_key(header: str) -> str:
+    if header:
+        value = request.headers.get(header, "")
+        # X-Forwarded-For: клиент — первый адрес в списке
+        client = value.split(",")[0].strip()
+        if client:
+            return client
+    return request.remote_addr or "-"
+
+
+def _reject(status: int, message: str, retry_after: float):
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+    # Ответ без обращения к БД и шаблонам: отказ должен стоить как можно меньше
+    if request.path.startswith("/api/"):
+        return jsonify({"error": message}), status, headers
+    headers["Content-Type"] = "text/plain; charset=utf-8"
+    return message, status, headers
+
+
+def install(app, exempt=frozenset(), config: dict = None):
+    """
+    Подключает контроль допуска к приложению, если он включён настройками.
+
+    Вызывается в create_app() после хуков учёта времени: так отклонённые
+    запросы попадают в метрики запросов, а освобождение места видит время БД.
+
+    Args:
+        app: Приложение Flask
+        exempt: Endpoint'ы, которые не ограничиваются
+        config: Настройки (по умолчанию — get_admission_config())
+
+    Returns:
+        Пара (ConcurrencyLimiter или None, TokenBuckets или None) или None, если всё выключено
+    """
+    cfg = config or get_admission_config()
+    if cfg["max_inflight"] <= 0 and cfg["rate"] <= 0:
+        return None
+    exempt = frozenset(exempt) | {"static"}
+
+    limiter = adaptive = buckets = None
+    if cfg["max_inflight"] > 0:
+        limiter = ConcurrencyLimiter(cfg["max_inflight"], cfg["queue_size"], cfg["queue_timeout"])
+        metrics.admission_limit.set(cfg["max_inflight"])
+        if cfg["adaptive"]:
+            adaptive = AdaptiveLimit(
+                limiter, min(cfg["min_inflight"], cfg["max_inflight"]), cfg["max_inflight"],
+                cfg["target_db"], cfg["adjust_interval"],
+            )
+    if cfg["rate"] > 0:
+        buckets = TokenBuckets(cfg["rate"], cfg["burst"], cfg["max_clients"])
+
+    def _admit():
+        if request.endpoint in exempt:
+            return None
+        if buckets is not None:
+            wait = buckets.take(_client_key(cfg["client_header"]))
+            if wait:
+                metrics.admission_rejected_total.labels(reason="rate_limited").inc()
+                return _reject(429, RATE_LIMITED_MESSAGE, wait)
+        if limiter is None:
+            return None
+        reason, waited = limiter.acquire()
+        metrics.admission_queue_seconds.observe(waited)
+        if reason is not None:
+            metrics.admission_rejected_total.labels(reason=reason).inc()
+            return _reject(503, OVERLOADED_MESSAGE, cfg["retry_after"])
+        g.admission_slot = True
+        metrics.admission_in_flight.inc()
+        return None
+
+    def _release(exc):
+        if not g.pop("admission_slot", False):
+            return
+        limiter.release()
+        metrics.admission_in_flight.dec()
+        request_timing = timing.current()
+        if adaptive is not None and request_timing is not None:
+            db_seconds = sum(request_timing["db_" + phase] for phase in timing.DB_PHASES)
+            adaptive.observe(db_seconds, request_timing["db_ops"])
+
+    app.before_request(_admit)
+    app.teardown_request(_release)
+    return limiter, buckets
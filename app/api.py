@@ -0,0 +1,204 @@
+"""
+JSON REST API для контактов с ETag и условными GET-запросами.
+"""
+import hashlib
+import os
+
+import psycopg2
+from flask import Blueprint, jsonify, make_response, request, url_for
+
+from app import db
+from app.logger import app_logger
+from app.validation import validate_email
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+# Предел числа операций в одном запросе /api/contacts/batch
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "5000"))
+
+
+def _serialize(contact):
+    return {"id": contact["id"], "name": contact["name"], "email": contact["email"]}
+
+
+def _list_etag(version: str, params: tuple) -> str:
+    """
+    ETag списка: версия страницы (db.get_page_version) + параметры запроса.
+    """
+    digest = hashlib.sha1(repr(params).encode("utf-8")).hexdigest()[:16]
+    return f"p{version}-{digest}"
+
+
+def _not_modified(etag: str):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    return response
+
+
+def _error(message: str, status: int):
+    return jsonify({"error": message}), status
+
+
+def _read_contact_payload():
+    """
+    Возвращает (name, email, ошибка) из JSON тела запроса.
+    """
+    return _validate_contact(request.get_json(silent=True))
+
+
+def _validate_contact(payload):
+    """
+    Возвращает (name, email, ошибка) из JSON-объекта контакта.
+    """
+    if not isinstance(payload, dict):
+        return None, None, "Ожидается JSON-объект"
+    name = str(payload.get("name") or "").strip()
+    email = str(payload.get("email") or "").strip()
+    if not name or not email:
+        return None, None, "Имя и email обязательны для заполнения"
+    if not validate_email(email):
+        return None, None, "Некорректный формат email адреса"
+    return name, email, None
+
+
+@api.route("/contacts", methods=["GET"])
+def list_contacts():
+    params = (
+        request.args.get("limit", db.DEFAULT_PAGE_SIZE, type=int),
+        request.args.get("after", type=int),
+        request.args.get("before", type=int),
+        request.args.get("name_prefix", "").strip() or None,
+        request.args.get("email_prefix", "").strip() or None,
+    )
+    # Версию читаем до данных и до сериализации: на 304 страница не загружается.
+    # Если запись попадёт между запросами, клиент получит более свежие данные
+    # со старым ETag и просто перечитает их позже
+    etag = _list_etag(db.get_page_version(*params), params)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    limit, after_id, before_id, name_prefix, email_prefix = params
+    page = db.list_contacts(
+        limit=limit,
+        after_id=after_id,
+        before_id=before_id,
+        name_prefix=name_prefix,
+        email_prefix=email_prefix,
+        use_cache=False,
+    )
+    response = jsonify(
+        {
+            "contacts": [_serialize(c) for c in page["contacts"]],
+            "next_after": page["next_after"],
+            "prev_before": page["prev_before"],
+        }
+    )
+    response.set_etag(etag)
+    return response
+
+
+@api.route("/contacts/<int:contact_id>", methods=["GET"])
+def get_contact(contact_id: int):
+    contact = db.get_contact(contact_id)
+    if contact is None:
+        return _error("Контакт не найден", 404)
+    etag = f"{contact['id']}-{contact['row_version']}"
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    response = jsonify(_serialize(contact))
+    response.set_etag(etag)
+    return response
+
+
+@api.route("/contacts", methods=["POST"])
+def create_contact():
+    name, email, error = _read_contact_payload()
+    if error:
+        return _error(error, 400)
+    # Повтор запроса безопасен: контакт с тем же email обновляется, а не дублируется
+    contact_id, status = db.upsert_contact(name, email)
+    app_logger.info("API: добавлен контакт id=%s (%s)", contact_id, status)
+    response = jsonify({"id": contact_id, "name": name, "email": email, "status": status})
+    response.status_code = 201 if status == "created" else 200
+    response.headers["Location"] = url_for("api.get_contact", contact_id=contact_id)
+    return response
+
+
+@api.route("/contacts/<int:contact_id>", methods=["PUT"])
+def update_contact(contact_id: int):
+    name, email, error = _read_contact_payload()
+    if error:
+        return _error(error, 400)
+    try:
+        found = db.update_contact(contact_id, name, email)
+    except psycopg2.errors.UniqueViolation:
+        return _error("Контакт с таким email уже существует", 409)
+    if not found:
+        return _error("Контакт не найден", 404)
+    app_logger.info("API: обновлён контакт id=%s", contact_id)
+    return jsonify({"id": contact_id, "name": name, "email": email})
+
+
+@api.route("/contacts/<int:contact_id>", methods=["DELETE"])
+def delete_contact(contact_id: int):
+    if not db.delete_contact(contact_id):
+        return _error("Контакт не найден", 404)
+    app_logger.info("API: удалён контакт id=%s", contact_id)
+    return "", 204
+
+
+def _validate_batch_operation(item):
+    """
+    Возвращает (операция для db.apply_batch, ошибка).
+    """
+    if not isinstance(item, dict):
+        return None, "Ожидается JSON-объект"
+    op = item.get("op")
+    if op not in db.BATCH_OPERATIONS:
+        return None, f"Поле op должно быть одним из: {', '.join(db.BATCH_OPERATIONS)}"
+    operation = {"op": op}
+    if op != "create":
+        contact_id = item.get("id")
+        if not isinstance(contact_id, int) or isinstance(contact_id, bool):
+            return None, "Поле id должно быть целым числом"
+        operation["id"] = contact_id
+    if op != "delete":
+        name, email, error = _validate_contact(item)
+        if error:
+            return None, error
+        operation.update(name=name, email=email)
+    return operation, None
+
+
+@api.route("/contacts/batch", methods=["POST"])
+def batch_contacts():
+    """
+    Пакет операций create/update/delete в одной транзакции.
+
+    Тело: {"operations": [{"op": "create", "name": ..., "email": ...},
+    {"op": "update", "id": 1, ...}, {"op": "delete", "id": 2}]}.
+    Если хотя бы одна операция некорректна, ничего не выполняется (400);
+    если изменение email совпадает с email другого контакта — тоже (409).
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get("operations") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return _error("Ожидается JSON-объект с массивом operations", 400)
+    if len(items) > BATCH_MAX_OPERATIONS:
+        return _error(f"Не больше {BATCH_MAX_OPERATIONS} операций в одном запросе", 413)
+
+    operations, errors = [], []
+    for index, item in enumerate(items):
+        operation, error = _validate_batch_operation(item)
+        if error:
+            errors.append({"index": index, "error": error})
+        operations.append(operation)
+    if errors:
+        return jsonify({"error": "Некорректные операции, пакет не выполнен", "errors": errors}), 400
+
+    try:
+        results = db.apply_batch(operations)
+    except psycopg2.errors.UniqueViolation:
+        return _error("Контакт с таким email уже существует, пакет не выполнен (изменения отменены)", 409)
+    app_logger.info("API: пакет из %d операций выполнен", len(results))
+    return jsonify({"results": results})
@@ -1,10 +1,27 @@
 import tkinter as tk
+import tkinter.font as tkfont
 from tkinter import messagebox, simpledialog
 
-from app.db import init_db, get_all_contacts, add_contact, update_contact, delete_contact
+from app import notify
+from app.db import count_contacts, upsert_contact, update_contact, delete_contact
+from app.migrate import SchemaOutdatedError, check_schema
+from app.virtual_list import BackgroundWorker, ContactWindow
+
+# Как часто главный поток забирает результаты фоновых запросов к БД
+POLL_INTERVAL_MS = 30
 
 
 class ContactsApp(tk.Tk):
+    """
+    Окно со списком контактов.
+
+    Все запросы к БД выполняются в фоновом потоке (BackgroundWorker), а их
+    результаты применяются в главном потоке через after(), поэтому окно не
+    замирает на больших таблицах и медленной сети. Список виртуальный:
+    в Listbox только видимые строки, данные догружаются блоками при прокрутке.
+    Изменения других клиентов применяются построчно по уведомлениям из app.notify.
+    """
+
     def __init__(self):
         super().__init__()
 
@@ -12,8 +29,35 @@ class ContactsApp(tk.Tk):
         self.geometry("500x400")
 
         # Виджеты
-        self.listbox = tk.Listbox(self, height=15)
-        self.listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        search_frame = tk.Frame(self)
+        search_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(search_frame, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.search_entry.bind("<Return>", lambda event: self.search_ui())
+
+        self.btn_search = tk.Button(search_frame, text="Найти", command=self.search_ui)
+        self.btn_search.pack(side=tk.LEFT, padx=(5, 0))
+
+        self.btn_reset = tk.Button(search_frame, text="Сбросить", command=self.reset_search_ui)
+        self.btn_reset.pack(side=tk.LEFT, padx=(5, 0))
+
+        list_frame = tk.Frame(self)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.scrollbar = tk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.listbox = tk.Listbox(list_frame, height=15, activestyle="none", exportselection=False)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.listbox.bind("<Configure>", self._on_resize)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", self._on_mousewheel)
+        self.listbox.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll_by(3))
+        self.listbox.bind("<Prior>", lambda event: self.scroll_by(-self.visible_rows))
+        self.listbox.bind("<Next>", lambda event: self.scroll_by(self.visible_rows))
 
         btn_frame = tk.Frame(self)
         btn_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
@@ -31,26 +75,204 @@ class ContactsApp(tk.Tk):
         self.status_bar = tk.Label(self, textvariable=self.status_var, anchor="w")
         self.status_bar.pack(fill=tk.X, padx=10, pady=(0, 5))
 
-        self.contacts_cache = []
+        self.worker = BackgroundWorker()
+        self.window = ContactWindow()
+        # Позиция первой видимой строки и число строк, помещающихся в Listbox
+        self.first = 0
+        self.visible_rows = int(self.listbox.cget("height"))
+        self.selected_id = None
+        font = tkfont.Font(font=self.listbox.cget("font"))
+        self._line_height = font.metrics("linespace") + 2 * int(self.listbox.cget("selectborderwidth"))
+
+        # Изменения от других клиентов приходят через LISTEN/NOTIFY (app.notify)
+        self.subscription = notify.subscribe()
 
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(POLL_INTERVAL_MS, self._poll_worker)
         self.refresh_contacts()
 
     def set_status(self, text: str):
         self.status_var.set(text)
 
+    # --- фоновые запросы ---
+
+    def _poll_worker(self):
+        self.worker.poll()
+        changes = self.subscription.drain()
+        if changes:
+            self._on_changes(changes)
+        self.after(POLL_INTERVAL_MS, self._poll_worker)
+
+    def _on_close(self):
+        self.subscription.close()
+        notify.stop_listener()
+        self.worker.stop()
+        self.destroy()
+
+    def _on_changes(self, changes):
+        """
+        Применяет изменения, сделанные другими клиентами, без перечитывания списка.
+        """
+        for event in changes:
+            if not self.window.apply_change(event):
+                self.refresh_contacts()
+                return
+        if self.selected_id is not None and self.window.find(self.selected_id) is None:
+            self.selected_id = None
+        self._clamp_first()
+        self._render()
+        self._request_visible()
+
+    def _show_error(self, message: str):
+        def handler(error):
+            messagebox.showerror("Ошибка", f"{message}:\n{error}")
+            self.set_status(message)
+        return handler
+
     def refresh_contacts(self):
-        try:
-            self.contacts_cache = get_all_contacts()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить контакты:\n{e}")
-            self.set_status("Ошибка загрузки контактов")
+        """
+        Начинает показ списка заново (все контакты или результаты поиска).
+        """
+        query = self.search_var.get().strip() or None
+        window = self.window = ContactWindow(query=query)
+        self.first = 0
+        self.selected_id = None
+        self.set_status("Загрузка…")
+        if query is None:
+            self.worker.submit(
+                count_contacts,
+                on_done=lambda total: self._on_total(window, total),
+                on_error=self._show_error("Не удалось загрузить контакты"),
+            )
+        else:
+            # Число результатов поиска заранее неизвестно — начинаем с первого блока
+            self._on_total(window, 1)
+
+    def _on_total(self, window: ContactWindow, total: int):
+        if window is not self.window:
             return
-
+        window.set_total(total)
+        self._render()
+        self._request_visible()
+
+    def _request_visible(self):
+        """
+        Загружает недостающие блоки для видимых строк (и немного вперёд).
+        """
+        window = self.window
+        ahead = window.block_size // 2
+        for block_no in window.missing_blocks(self.first, self.visible_rows + ahead):
+            plan = window.plan(block_no)
+            self.worker.submit(
+                ContactWindow.load,
+                plan,
+                on_done=lambda result, plan=plan: self._on_block_loaded(window, plan, result),
+                on_error=self._show_error("Не удалось загрузить контакты"),
+            )
+
+    def _on_block_loaded(self, window: ContactWindow, plan, result):
+        if window is not self.window:
+            return
+        if window.apply(plan, result):
+            self._clamp_first()
+            self._render()
+        self._request_visible()
+
+    # --- отображение ---
+
+    def _format(self, index: int) -> str:
+        c = self.window.row(index)
+        if c is None:
+            return "…"
+        return f"{c['id']}: {c['name']} <{c['email']}>"
+
+    def _render(self):
+        """
+        Перерисовывает видимые строки, ползунок и строку состояния.
+        """
+        total = self.window.total
+        last = min(self.first + self.visible_rows, total)
         self.listbox.delete(0, tk.END)
-        for c in self.contacts_cache:
-            self.listbox.insert(tk.END, f"{c['id']}: {c['name']} <{c['email']}>")
+        for index in range(self.first, last):
+            self.listbox.insert(tk.END, self._format(index))
+        self._restore_selection()
+
+        if total:
+            self.scrollbar.set(self.first / total, last / total)
+            self.set_status(f"Записей: {total}, показаны {self.first + 1}–{last}")
+        else:
+            self.scrollbar.set(0, 1)
+            self.set_status("Ничего не найдено" if self.window.query else "Пока нет ни одного контакта")
+
+    def _render_line(self, index: int):
+        """
+        Перерисовывает одну строку, если она видна.
+        """
+        line = index - self.first
+        if 0 <= line < self.listbox.size():
+            self.listbox.delete(line)
+            self.listbox.insert(line, self._format(index))
+            self._restore_selection()
+
+    def _restore_selection(self):
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected_id is None:
+            return
+        index = self.window.find(self.selected_id)
+        if index is not None and 0 <= index - self.first < self.listbox.size():
+            self.listbox.selection_set(index - self.first)
+
+    # --- прокрутка ---
+
+    def _clamp_first(self):
+        self.first = max(0, min(self.first, self.window.total - self.visible_rows))
+
+    def scroll_to(self, first: int):
+        previous = self.first
+        self.first = first
+        self._clamp_first()
+        if self.first != previous:
+            self._render()
+            self._request_visible()
+
+    def scroll_by(self, rows: int):
+        self.scroll_to(self.first + rows)
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(value) * self.window.total))
+        elif action == tk.SCROLL:
+            step = self.visible_rows if unit == tk.PAGES else 1
+            self.scroll_by(int(value) * step)
+
+    def _on_mousewheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_resize(self, event):
+        rows = max(1, event.height // max(1, self._line_height))
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._clamp_first()
+            self._render()
+            self._request_visible()
+
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            row = self.window.row(self.first + selection[0])
+            self.selected_id = row["id"] if row else None
+
+    # --- поиск ---
+
+    def search_ui(self):
+        self.refresh_contacts()
 
-        self.set_status(f"Загружено записей: {len(self.contacts_cache)}")
+    def reset_search_ui(self):
+        self.search_var.set("")
+        self.refresh_contacts()
+
+    # --- изменение данных ---
 
     def _ask_contact_data(self, title: str, name_default: str = "", email_default: str = ""):
         name = simpledialog.askstring(title, "Имя:", initialvalue=name_default, parent=self)
@@ -66,20 +288,42 @@ class ContactsApp(tk.Tk):
         if not name or not email:
             return
 
-        try:
-            add_contact(name, email)
+        window = self.window
+        self.worker.submit(
+            upsert_contact,
+            name,
+            email,
+            on_done=lambda result: self._on_added(window, {"id": result[0], "name": name, "email": email}, result[1]),
+            on_error=self._show_error("Не удалось добавить контакт"),
+        )
+
+    def _on_added(self, window: ContactWindow, contact: dict, status: str):
+        if window is not self.window:
+            return
+        if status == "created":
+            # Новый контакт попадает в конец списка; в режиме поиска список не меняется
+            window.append(contact)
+            self._render()
+            self._request_visible()
             self.set_status("Контакт добавлен")
-            self.refresh_contacts()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось добавить контакт:\n{e}")
+            return
+        if status == "unchanged":
+            # Такой контакт уже сохранён: список перерисовывать незачем
+            self.set_status("Такой контакт уже есть")
+            return
+        # Контакт с таким email уже был: upsert обновил его на месте
+        index = window.patch(contact)
+        if index is not None:
+            self._render_line(index)
+        self._request_visible()
+        self.set_status("Контакт с таким email уже был — данные обновлены")
 
     def _get_selected_contact(self):
-        try:
-            index = self.listbox.curselection()[0]
-        except IndexError:
+        index = self.window.find(self.selected_id) if self.selected_id is not None else None
+        if index is None:
             messagebox.showwarning("Нет выбора", "Сначала выберите контакт в списке.")
             return None
-        return self.contacts_cache[index]
+        return dict(self.window.row(index))
 
     def edit_contact_ui(self):
         contact = self._get_selected_contact()
@@ -92,12 +336,29 @@ class ContactsApp(tk.Tk):
         if not name or not email:
             return
 
-        try:
-            update_contact(contact["id"], name, email)
-            self.set_status("Контакт обновлён")
-            self.refresh_contacts()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось обновить контакт:\n{e}")
+        window = self.window
+        updated = {"id": contact["id"], "name": name, "email": email}
+        self.worker.submit(
+            update_contact,
+            contact["id"],
+            name,
+            email,
+            on_done=lambda found: self._on_updated(window, updated, found),
+            on_error=self._show_error("Не удалось обновить контакт"),
+        )
+
+    def _on_updated(self, window: ContactWindow, contact: dict, found: bool):
+        if window is not self.window:
+            return
+        if not found:
+            # Контакт уже удалён другим клиентом
+            self._on_deleted(window, contact["id"], True)
+            return
+        index = window.patch(contact)
+        if index is not None:
+            self._render_line(index)
+        self._request_visible()
+        self.set_status("Контакт обновлён")
 
     def delete_contact_ui(self):
         contact = self._get_selected_contact()
@@ -107,22 +368,38 @@ class ContactsApp(tk.Tk):
         if not messagebox.askyesno("Подтверждение", f"Удалить контакт {contact['name']}?"):
             return
 
-        try:
-            delete_contact(contact["id"])
-            self.set_status("Контакт удалён")
-            self.refresh_contacts()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось удалить контакт:\n{e}")
+        window = self.window
+        self.worker.submit(
+            delete_contact,
+            contact["id"],
+            on_done=lambda found: self._on_deleted(window, contact["id"], found),
+            on_error=self._show_error("Не удалось удалить контакт"),
+        )
+
+    def _on_deleted(self, window: ContactWindow, contact_id: int, found: bool):
+        if window is not self.window:
+            return
+        window.remove(contact_id)
+        if self.selected_id == contact_id:
+            self.selected_id = None
+        self._clamp_first()
+        self._render()
+        self._request_visible()
+        self.set_status("Контакт удалён" if found else "Контакт уже был удалён")
 
 
 def main():
-    # Инициализация БД (создание таблицы, если её нет)
+    # Только проверка схемы: миграции (DDL) применяются при развёртывании
+    # командой python -m app.migrate, а не с учётной записью пользователя
     try:
-        init_db()
+        check_schema()
+    except SchemaOutdatedError as e:
+        tk.messagebox.showerror("Схема БД устарела", str(e))
+        return
     except Exception as e:
         tk.messagebox.showerror(
             "Ошибка подключения",
-            f"Не удалось инициализировать базу данных.\n"
+            f"Не удалось подключиться к базе данных.\n"
             f"Проверьте настройки подключения в переменных окружения.\n\n{e}",
         )
         return
@@ -133,4 +410,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,278 @@
+"""
+Асинхронный слой БД для ASGI-варианта приложения (app.async_web_app).
+
+Повторяет API app.db для веб-маршрутов (list_contacts, search_contacts,
+upsert_contact, update_contact, delete_contact и т.д.) поверх пула asyncpg:
+пока запрос ждёт PostgreSQL, цикл событий обслуживает остальные, и один
+процесс держит столько одновременных медленных запросов, сколько соединений
+в пуле, а не сколько у него потоков.
+
+SQL общий с app.db (_contacts_page_query, _search_query, UPSERT_CONTACT_SQL):
+плейсхолдеры psycopg2 переводятся в нумерованные параметры asyncpg функцией
+db.convert_query. Настройки подключения и пула — те же PG_* переменные.
+Время операций попадает в те же метрики, Server-Timing и лог медленных операций.
+
+Отличия от app.db: кэша процесса (contacts_cache) нет, чтение всегда идёт
+с основного сервера (реплики из PG_REPLICA_HOSTS не используются).
+"""
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from app import db
+from app.db import convert_query
+from app.pool import PoolTimeoutError
+
+
+def _instrumented(operation: str):
+    """
+    Асинхронный вариант app.db._instrumented: время фаз и число строк операции.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            op = db._Operation(operation)
+            token = db._current_operation.set(op)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                db._current_operation.reset(token)
+                db._finish_operation(op)
+        return wrapper
+    return decorator
+
+
+_pool = None
+_pool_loop = None
+_pool_lock = None
+_waiting = 0
+_wait_time_total = 0.0
+
+
+async def open_pool():
+    """
+    Создаёт пул asyncpg для текущего цикла событий (вызывается при старте сервера).
+    """
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        # Пул другого (уже завершённого) цикла событий закрыть штатно нельзя
+        if _pool is not None:
+            _pool.terminate()
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            cfg = db.get_db_config()
+            pool_cfg = db.get_pool_config()
+            _pool = await asyncpg.create_pool(
+                host=cfg["host"],
+                port=int(cfg["port"]),
+                database=cfg["dbname"],
+                user=cfg["user"],
+                password=cfg["password"],
+                min_size=pool_cfg["minconn"],
+                max_size=pool_cfg["maxconn"],
+                max_inactive_connection_lifetime=pool_cfg["max_idle"],
+            )
+    return _pool
+
+
+async def close_pool():
+    global _pool, _pool_loop
+    if _pool is not None and _pool_loop is asyncio.get_running_loop():
+        await _pool.close()
+    _pool, _pool_loop = None, None
+
+
+def pool_stats():
+    """
+    Статистика пула в формате app.db.pool_stats() или None, если пула нет.
+    """
+    if _pool is None:
+        return None
+    idle = _pool.get_idle_size()
+    return {
+        "minconn": _pool.get_min_size(),
+        "maxconn": _pool.get_max_size(),
+        "in_use": _pool.get_size() - idle,
+        "idle": idle,
+        "waiting": _waiting,
+        "wait_time_total": _wait_time_total,
+    }
+
+
+@asynccontextmanager
+async def get_connection():
+    """
+    Соединение из пула; ожидание свободного соединения учитывается как фаза connect.
+    """
+    global _waiting, _wait_time_total
+    pool = await open_pool()
+    timeout = db.get_pool_config()["timeout"]
+    started = time.perf_counter()
+    _waiting += 1
+    try:
+        conn = await pool.acquire(timeout=timeout)
+    except asyncio.TimeoutError:
+        raise PoolTimeoutError(f"Нет свободного соединения в пуле за {timeout} с") from None
+    finally:
+        _waiting -= 1
+        waited = time.perf_counter() - started
+        _wait_time_total += waited
+        db._record("connect", waited)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def _fetch(conn, sql: str, params=()):
+    query, args = convert_query(sql, params)
+    started = time.perf_counter()
+    rows = await conn.fetch(query, *args)
+    db._record("execute", time.perf_counter() - started, len(rows))
+    return [dict(row) for row in rows]
+
+
+async def _fetchrow(conn, sql: str, params=()):
+    rows = await _fetch(conn, sql, params)
+    return rows[0] if rows else None
+
+
+async def _execute(conn, sql: str, params=()) -> int:
+    """
+    Выполняет команду без результата и возвращает число затронутых строк.
+    """
+    query, args = convert_query(sql, params)
+    started = time.perf_counter()
+    status = await conn.execute(query, *args)
+    db._record("execute", time.perf_counter() - started)
+    # Статус вида "UPDATE 1" / "DELETE 0"
+    return int(status.rsplit(" ", 1)[-1])
+
+
+@_instrumented("ping")
+async def ping() -> float:
+    """
+    Выполняет SELECT 1 и возвращает время ответа в секундах.
+    """
+    started = time.perf_counter()
+    async with get_connection() as conn:
+        await _fetch(conn, "SELECT 1;")
+    return time.perf_counter() - started
+
+
+@_instrumented("get_all_contacts")
+async def get_all_contacts():
+    async with get_connection() as conn:
+        return await _fetch(conn, "SELECT id, name, email FROM contacts ORDER BY id;")
+
+
+@_instrumented("list_contacts")
+async def list_contacts(
+    limit: int = db.DEFAULT_PAGE_SIZE,
+    after_id: int = None,
+    before_id: int = None,
+    name_prefix: str = None,
+    email_prefix: str = None,
+):
+    """
+    Страница контактов с keyset-пагинацией, см. app.db.list_contacts.
+    """
+    limit = max(1, min(int(limit), db.MAX_PAGE_SIZE))
+    sql, params = db._contacts_page_query(limit, after_id, before_id, name_prefix, email_prefix)
+    async with get_connection() as conn:
+        rows = await _fetch(conn, sql, params)
+        if before_id is not None and not rows:
+            # Перед курсором ничего нет — показываем первую страницу
+            sql, params = db._contacts_page_query(limit, None, None, name_prefix, email_prefix)
+            return db._contacts_page(await _fetch(conn, sql, params), limit, None, None)
+    return db._contacts_page(rows, limit, after_id, before_id)
+
+
+@_instrumented("search_contacts")
+async def search_contacts(query: str, limit: int = db.DEFAULT_PAGE_SIZE, page: int = 1):
+    """
+    Поиск по имени и email, см. app.db.search_contacts.
+    """
+    query = (query or "").strip().lower()
+    limit = max(1, min(int(limit), db.MAX_PAGE_SIZE))
+    max_page = db.SEARCH_MAX_OFFSET // limit + 1
+    page = max(1, min(int(page), max_page))
+    if not query:
+        return {"contacts": [], "page": page, "has_next": False}
+    async with get_connection() as conn:
+        if db._trigram_check_due():
+            db._remember_trigram((await _fetchrow(conn, db.TRIGRAM_CHECK_SQL))["available"])
+        sql, params = db._search_query(query, limit, page, db._trigram["available"])
+        rows = await _fetch(conn, sql, params)
+    has_next = len(rows) > limit and page < max_page
+    return {"contacts": rows[:limit], "page": page, "has_next": has_next}
+
+
+@_instrumented("count_contacts")
+async def count_contacts() -> int:
+    async with get_connection() as conn:
+        row = await _fetchrow(conn, "SELECT count(*) AS total FROM contacts;")
+    return row["total"]
+
+
+@_instrumented("get_contact")
+async def get_contact(contact_id: int):
+    """
+    Контакт по id вместе с row_version (xmin строки) или None.
+    """
+    async with get_connection() as conn:
+        return await _fetchrow(
+            conn, "SELECT id, name, email, xmin::text AS row_version FROM contacts WHERE id = %s;", (contact_id,)
+        )
+
+
+@_instrumented("add_contact")
+async def add_contact(name: str, email: str) -> int:
+    async with get_connection() as conn:
+        row = await _fetchrow(conn, "INSERT INTO contacts (name, email) VALUES (%s, %s) RETURNING id;", (name, email))
+    return row["id"]
+
+
+@_instrumented("upsert_contact")
+async def upsert_contact(name: str, email: str):
+    """
+    Добавляет контакт или обновляет контакт с тем же email, см. app.db.upsert_contact.
+
+    Returns:
+        Пара (id, статус), статус — created, updated или unchanged
+    """
+    params = {"name": name, "email": email, "key": db.email_key(email)}
+    async with get_connection() as conn:
+        row = await _fetchrow(conn, db.UPSERT_CONTACT_SQL, params)
+        if row is None:
+            # Конфликтующая строка зафиксирована после начала команды и не видна в её снимке
+            row = await _fetchrow(conn, db.UPSERT_FALLBACK_SQL, params)
+    return row["id"], row["status"]
+
+
+@_instrumented("update_contact")
+async def update_contact(contact_id: int, name: str, email: str) -> bool:
+    """
+    Обновляет контакт. Возвращает False, если контакта с таким id нет.
+
+    Занятый email — asyncpg.UniqueViolationError.
+    """
+    async with get_connection() as conn:
+        updated = await _execute(
+            conn, "UPDATE contacts SET name = %s, email = %s WHERE id = %s;", (name, email, contact_id)
+        )
+    return updated > 0
+
+
+@_instrumented("delete_contact")
+async def delete_contact(contact_id: int) -> bool:
+    async with get_connection() as conn:
+        deleted = await _execute(conn, "DELETE FROM contacts WHERE id = %s;", (contact_id,))
+    return deleted > 0
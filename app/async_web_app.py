@@ -0,0 +1,312 @@
+"""
+ASGI-вариант веб-приложения: те же страницы, шаблоны и метрики, что
+у app.web_app, на Quart и асинхронном слое БД app.async_db.
+
+Запуск:
+    uvicorn app.async_web_app:app --host 0.0.0.0 --port 5000 --workers 2
+
+Маршруты: /, /search, /add, /edit, /delete, /events, /healthz, /readyz, /metrics.
+JSON API (/api), импорт и выгрузка остаются в WSGI-приложении app.web_app:
+они построены на потоковых генераторах и COPY psycopg2.
+"""
+import asyncio
+import json
+import os
+import time
+
+import asyncpg
+from quart import Quart, Response, flash, jsonify, redirect, render_template, request, url_for
+
+from app import async_db, db, health, metrics, notify, timing
+from app.logger import accept_request_id, app_logger, set_request_id
+from app.validation import validate_email
+from app.web_app import (
+    _ADD_MESSAGES, REQUEST_ID_HEADER, SSE_KEEPALIVE_SECONDS, SSE_MAX_SECONDS, SSE_RETRY_SECONDS, UNMETERED_ENDPOINTS,
+)
+
+# Как часто /events забирает события подписки: очередь app.notify синхронная,
+# и ждать её в цикле событий нельзя
+SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", "0.25"))
+
+
+class AsyncReadinessCheck:
+    """
+    Кэшируемая проверка готовности для пула asyncpg, см. app.health.ReadinessCheck.
+    """
+
+    def __init__(self, interval: float = health.READY_CHECK_INTERVAL, max_waiting: int = None):
+        self.interval = interval
+        self.max_waiting = max_waiting
+        self._lock = asyncio.Lock()
+        self._database = None
+        self._checked_at = None
+
+    async def database_status(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.interval:
+            # Пока одна проверка идёт, остальные получают прошлый результат
+            if self._database is None or not self._lock.locked():
+                async with self._lock:
+                    if self._checked_at is None or time.monotonic() - self._checked_at >= self.interval:
+                        self._database = await self._ping()
+                        self._checked_at = time.monotonic()
+        status = dict(self._database)
+        status["age"] = round(time.monotonic() - self._checked_at, 3)
+        return status
+
+    async def _ping(self):
+        try:
+            latency = await async_db.ping()
+        except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+            return {"ok": False, "error": str(e).strip()}
+        return {"ok": True, "latency_ms": round(latency * 1000, 2)}
+
+    async def status(self):
+        checks = {}
+        stats = async_db.pool_stats()
+        if stats is not None:
+            limit = self.max_waiting if self.max_waiting is not None else stats["maxconn"]
+            checks["pool"] = {
+                "ok": stats["waiting"] <= limit,
+                "in_use": stats["in_use"],
+                "maxconn": stats["maxconn"],
+                "waiting": stats["waiting"],
+            }
+        if "pool" not in checks or checks["pool"]["ok"]:
+            checks["database"] = await self.database_status()
+        ready = all(check["ok"] for check in checks.values()) and "database" in checks
+        return ready, {"status": "ready" if ready else "unavailable", "checks": checks}
+
+
+async def _render(template: str, **context):
+    # Время рендеринга для заголовка Server-Timing
+    started = time.perf_counter()
+    try:
+        return await render_template(template, **context)
+    finally:
+        timing.add("render", time.perf_counter() - started)
+
+
+def create_app():
+    """
+    Фабрика приложения Quart.
+    """
+    template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+    app = Quart(__name__, template_folder=template_dir)
+    app.config["SECRET_KEY"] = "dev-secret-key"
+    readiness = AsyncReadinessCheck(
+        max_waiting=int(health.READY_MAX_POOL_WAITING) if health.READY_MAX_POOL_WAITING else None,
+    )
+
+    @app.before_serving
+    async def open_pool():
+        try:
+            await async_db.open_pool()
+        except (asyncpg.PostgresError, OSError) as e:
+            # Приложение стартует и без БД; /readyz покажет, что оно не готово
+            app_logger.error("Не удалось открыть пул соединений: %s", e)
+
+    @app.after_serving
+    async def close_pool():
+        await async_db.close_pool()
+        notify.stop_listener()
+
+    @app.before_request
+    async def before_request():
+        request.start_time = time.time()
+        request.request_id = accept_request_id(request.headers.get(REQUEST_ID_HEADER))
+        set_request_id(request.request_id)
+        timing.begin()
+
+    @app.after_request
+    async def after_request(response):
+        if hasattr(request, "request_id"):
+            response.headers[REQUEST_ID_HEADER] = request.request_id
+        if request.endpoint in UNMETERED_ENDPOINTS or not hasattr(request, "start_time"):
+            return response
+        duration = time.time() - request.start_time
+        request_timing = timing.current()
+        if request_timing is not None:
+            response.headers["Server-Timing"] = timing.server_timing_header(request_timing, duration)
+        metrics.observe_request(request.method, request.url_rule, response.status_code, duration)
+        metrics.update_pool_metrics(async_db.pool_stats())
+        return response
+
+    @app.teardown_request
+    async def end_timing(exc):
+        timing.end()
+        set_request_id(None)
+
+    @app.route("/metrics", endpoint="metrics_endpoint")
+    async def metrics_endpoint():
+        metrics.update_pool_metrics(async_db.pool_stats())
+        body, content_type = metrics.render_latest()
+        return body, 200, {"Content-Type": content_type}
+
+    @app.route("/healthz", methods=["GET"])
+    async def healthz():
+        return jsonify({"status": "ok"})
+
+    @app.route("/readyz", methods=["GET"])
+    async def readyz():
+        ready, body = await readiness.status()
+        return jsonify(body), 200 if ready else 503
+
+    @app.route("/", methods=["GET"])
+    async def index():
+        filters = {
+            "name_prefix": request.args.get("name_prefix", "").strip(),
+            "email_prefix": request.args.get("email_prefix", "").strip(),
+        }
+        page = {"contacts": [], "next_after": None, "prev_before": None}
+        try:
+            page = await async_db.list_contacts(
+                limit=request.args.get("limit", db.DEFAULT_PAGE_SIZE, type=int),
+                after_id=request.args.get("after", type=int),
+                before_id=request.args.get("before", type=int),
+                name_prefix=filters["name_prefix"] or None,
+                email_prefix=filters["email_prefix"] or None,
+            )
+            app_logger.info("Загружено контактов: %d", len(page["contacts"]), extra={"log_key": "contacts.loaded"})
+        except Exception as e:
+            app_logger.error("Ошибка при загрузке контактов: %s", e)
+            await flash(f"Ошибка при загрузке контактов: {str(e)}", "error")
+        filters = {key: value for key, value in filters.items() if value}
+        return await _render(
+            "index.html",
+            contacts=page["contacts"],
+            next_after=page["next_after"],
+            prev_before=page["prev_before"],
+            filters=filters,
+        )
+
+    @app.route("/search", methods=["GET"])
+    async def search():
+        query = request.args.get("q", "").strip()
+        result = {"contacts": [], "page": 1, "has_next": False}
+        try:
+            result = await async_db.search_contacts(
+                query,
+                limit=request.args.get("limit", db.DEFAULT_PAGE_SIZE, type=int),
+                page=request.args.get("page", 1, type=int),
+            )
+            app_logger.info(
+                "Поиск контактов: q='%s', найдено на странице: %d", query, len(result["contacts"]),
+                extra={"log_key": "contacts.search"},
+            )
+        except Exception as e:
+            app_logger.error("Ошибка при поиске контактов: q='%s', error=%s", query, e)
+            await flash(f"Ошибка при поиске контактов: {str(e)}", "error")
+        return await _render(
+            "index.html",
+            contacts=result["contacts"],
+            filters={},
+            search_query=query,
+            page=result["page"],
+            has_next=result["has_next"],
+        )
+
+    async def _contact_form():
+        """
+        Имя и email из формы или None (с flash-сообщением), если они некорректны.
+        """
+        form = await request.form
+        name = form.get("name", "").strip()
+        email = form.get("email", "").strip()
+        if not name or not email:
+            await flash("Имя и email обязательны для заполнения", "error")
+            return None
+        if not validate_email(email):
+            await flash("Некорректный формат email адреса", "error")
+            return None
+        return name, email
+
+    @app.route("/add", methods=["POST"])
+    async def add():
+        contact = await _contact_form()
+        if contact is None:
+            return redirect(url_for("index"))
+        name, email = contact
+        try:
+            contact_id, status = await async_db.upsert_contact(name, email)
+            app_logger.info("Добавлен контакт (%s): id=%s, name='%s', email='%s'", status, contact_id, name, email)
+            await flash(_ADD_MESSAGES[status], "success")
+        except Exception as e:
+            app_logger.error("Ошибка при добавлении контакта: name='%s', email='%s', error=%s", name, email, e)
+            await flash(f"Ошибка при добавлении контакта: {str(e)}", "error")
+        return redirect(url_for("index"))
+
+    @app.route("/edit/<int:contact_id>", methods=["POST"])
+    async def edit(contact_id: int):
+        contact = await _contact_form()
+        if contact is None:
+            return redirect(url_for("index"))
+        name, email = contact
+        try:
+            await async_db.update_contact(contact_id, name, email)
+            app_logger.info("Обновлён контакт: id=%s, name='%s', email='%s'", contact_id, name, email)
+            await flash("Контакт обновлён", "success")
+        except asyncpg.UniqueViolationError:
+            await flash(f"Контакт с email {email} уже существует", "error")
+        except Exception as e:
+            app_logger.error(
+                "Ошибка при обновлении контакта: id=%s, name='%s', email='%s', error=%s",
+                contact_id, name, email, e,
+            )
+            await flash(f"Ошибка при обновлении контакта: {str(e)}", "error")
+        return redirect(url_for("index"))
+
+    @app.route("/delete/<int:contact_id>", methods=["POST"])
+    async def delete(contact_id: int):
+        try:
+            await async_db.delete_contact(contact_id)
+            app_logger.info("Удалён контакт: id=%s", contact_id)
+            await flash("Контакт удалён", "success")
+        except Exception as e:
+            app_logger.error("Ошибка при удалении контакта: id=%s, error=%s", contact_id, e)
+            await flash(f"Ошибка при удалении контакта: {str(e)}", "error")
+        return redirect(url_for("index"))
+
+    @app.route("/events", methods=["GET"])
+    async def events():
+        """
+        Server-Sent Events с изменениями контактов (см. app/notify.py).
+        """
+        # Первая подписка запускает поток LISTEN и подключается к БД — не в цикле событий
+        subscription = await asyncio.to_thread(notify.subscribe)
+        reconnected = request.headers.get("Last-Event-ID") is not None
+
+        async def stream():
+            try:
+                yield f"retry: {SSE_RETRY_SECONDS * 1000}\n\n"
+                if reconnected:
+                    yield 'event: reload\ndata: {"op": "reload"}\n\n'
+                started = time.monotonic()
+                last_sent = started
+                while time.monotonic() - started < SSE_MAX_SECONDS:
+                    events = subscription.drain()
+                    for event in events:
+                        yield f"id: {event['seq']}\nevent: {event['op']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    now = time.monotonic()
+                    if events:
+                        last_sent = now
+                    elif now - last_sent >= SSE_KEEPALIVE_SECONDS:
+                        yield ": keepalive\n\n"
+                        last_sent = now
+                    await asyncio.sleep(SSE_POLL_SECONDS)
+            finally:
+                subscription.close()
+
+        response = Response(
+            stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Поток ограничен SSE_MAX_SECONDS, а не таймаутом ответа Quart
+        response.timeout = None
+        return response
+
+    return app
+
+
+app = create_app()
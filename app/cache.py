@@ -0,0 +1,152 @@
+"""
+Кэш результатов чтения контактов с TTL, LRU-вытеснением и поколениями.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+# Метрики Prometheus
+cache_hits_total = Counter(
+    'contacts_cache_hits_total',
+    'Number of contact reads served from the cache'
+)
+
+cache_misses_total = Counter(
+    'contacts_cache_misses_total',
+    'Number of contact reads that went to the database'
+)
+
+cache_evictions_total = Counter(
+    'contacts_cache_evictions_total',
+    'Number of entries evicted from the contacts cache',
+    ['reason']
+)
+
+cache_entries = Gauge(
+    'contacts_cache_entries',
+    'Number of entries currently held in the contacts cache',
+    multiprocess_mode='livesum'
+)
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш с ограничением по времени жизни, числу записей и строк.
+
+    Каждая запись помечена поколением (generation). Запись сохраняется только
+    если поколение не изменилось с момента начала чтения из БД, поэтому
+    результат, прочитанный до записи в БД, не попадёт в кэш после неё.
+
+    Args:
+        ttl: Время жизни записи в секундах (0 — кэш выключен)
+        max_entries: Максимальное число записей
+        max_rows: Максимальное суммарное число строк во всех записях
+    """
+
+    def __init__(self, ttl=0.0, max_entries=256, max_rows=50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, generation, rows)
+        self._data = OrderedDict()
+        self._rows = 0
+        self._generation = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        Создаёт кэш по переменным окружения CONTACTS_CACHE_TTL,
+        CONTACTS_CACHE_MAX_ENTRIES и CONTACTS_CACHE_MAX_ROWS.
+        """
+        return cls(
+            ttl=float(os.getenv("CONTACTS_CACHE_TTL", "0")),
+            max_entries=int(os.getenv("CONTACTS_CACHE_MAX_ENTRIES", "256")),
+            max_rows=int(os.getenv("CONTACTS_CACHE_MAX_ROWS", "50000")),
+        )
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get_or_load(self, key, loader):
+        """
+        Возвращает значение из кэша или загружает его через loader().
+
+        Значение отдаётся без копирования — его нельзя изменять.
+        """
+        if not self.enabled:
+            return loader()
+
+        generation = self._generation
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, entry_generation, _ = entry
+                if expires_at > now and entry_generation == generation:
+                    self._data.move_to_end(key)
+                    cache_hits_total.inc()
+                    return value
+                self._remove(key, "ttl")
+        cache_misses_total.inc()
+
+        value = loader()
+        self._store(key, value, generation)
+        return value
+
+    def invalidate(self):
+        """
+        Сбрасывает кэш после изменения данных.
+        """
+        with self._lock:
+            self._generation += 1
+            dropped = len(self._data)
+            self._data.clear()
+            self._rows = 0
+        if dropped:
+            cache_evictions_total.labels(reason="invalidate").inc(dropped)
+        cache_entries.set(0)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "rows": self._rows, "generation": self._generation}
+
+    def _store(self, key, value, generation):
+        rows = _count_rows(value)
+        if rows > self.max_rows:
+            return
+        with self._lock:
+            # Пока шёл запрос, данные изменились — результат мог устареть
+            if generation != self._generation:
+                return
+            if key in self._data:
+                self._remove(key, "replace")
+            self._data[key] = (value, time.monotonic() + self.ttl, generation, rows)
+            self._rows += rows
+            while len(self._data) > self.max_entries or self._rows > self.max_rows:
+                oldest = next(iter(self._data))
+                self._remove(oldest, "lru" if len(self._data) > self.max_entries else "size")
+            size = len(self._data)
+        cache_entries.set(size)
+
+    def _remove(self, key, reason):
+        _, _, _, rows = self._data.pop(key)
+        self._rows -= rows
+        if reason != "replace":
+            cache_evictions_total.labels(reason=reason).inc()
+
+
+def _count_rows(value):
+    if isinstance(value, dict) and "contacts" in value:
+        return len(value["contacts"])
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return 1
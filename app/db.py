@@ -1,13 +1,297 @@
+import contextvars
+import csv
+import functools
+import hashlib
+import inspect
+import io
+import logging
 import os
+import queue
+import re
+import threading
+import time
 from contextlib import contextmanager
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from dotenv import load_dotenv
 
+from app import metrics, replicas, timing
+from app.cache import TTLCache
+from app.pool import ConnectionPool, PoolTimeoutError  # noqa: F401
+
 
 load_dotenv()
 
+# Дочерний логгер web_app: записи уходят в обработчики app.logger, если он настроен
+logger = logging.getLogger("web_app.db")
+
+# Операции дольше этого порога (мс) пишутся в лог как медленные; 0 — выключено
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+
+class _Operation:
+    """
+    Накопленное время одной операции app.db по фазам и число полученных строк.
+    """
+
+    __slots__ = ("name", "phases", "rows")
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = {}
+        self.rows = 0
+
+
+_current_operation = contextvars.ContextVar("db_operation", default=None)
+
+
+def _record(phase: str, seconds: float, rows: int = 0):
+    op = _current_operation.get()
+    if op is not None:
+        op.phases[phase] = op.phases.get(phase, 0.0) + seconds
+        op.rows += rows
+    timing.add("db_" + phase, seconds)
+
+
+def _finish_operation(op: _Operation):
+    # Ответ из кэша не обращался к БД — такую операцию не учитываем
+    if not op.phases:
+        return
+    metrics.observe_db_operation(op.name, op.phases, op.rows)
+    timing.add("db_ops", 1)
+    total_ms = sum(op.phases.values()) * 1000
+    if SLOW_QUERY_MS and total_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            "Медленная операция БД: %s %.1f мс (connect=%.1f, execute=%.1f, fetch=%.1f мс, строк=%d)",
+            op.name, total_ms,
+            op.phases.get("connect", 0.0) * 1000,
+            op.phases.get("execute", 0.0) * 1000,
+            op.phases.get("fetch", 0.0) * 1000,
+            op.rows,
+        )
+
+
+def _instrumented(operation: str):
+    """
+    Декоратор: учитывает время connect/execute/fetch и число строк операции,
+    пишет их в метрики, в Server-Timing текущего запроса и в лог медленных операций.
+    Поддерживает и обычные функции, и генераторы.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                op = _Operation(operation)
+                gen = func(*args, **kwargs)
+                try:
+                    while True:
+                        token = _current_operation.set(op)
+                        try:
+                            item = next(gen)
+                        except StopIteration:
+                            return
+                        finally:
+                            _current_operation.reset(token)
+                        yield item
+                finally:
+                    token = _current_operation.set(op)
+                    try:
+                        gen.close()
+                    finally:
+                        _current_operation.reset(token)
+                    _finish_operation(op)
+            return gen_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            op = _Operation(operation)
+            token = _current_operation.set(op)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_operation.reset(token)
+                _finish_operation(op)
+        return wrapper
+    return decorator
+
+
+# %s, %(name)s и экранированный %% в SQL в стиле psycopg2
+_PLACEHOLDER_RE = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(sql: str):
+    names = []
+
+    def replace(match):
+        text = match.group(0)
+        if text == "%%":
+            return "%"
+        name = match.group(1)
+        # Именованный параметр, встреченный повторно, получает тот же номер
+        if name is not None and name in names:
+            return f"${names.index(name) + 1}"
+        names.append(name)
+        return f"${len(names)}"
+
+    text = _PLACEHOLDER_RE.sub(replace, sql)
+    name = "alvs_" + hashlib.blake2b(sql.encode(), digest_size=8).hexdigest()
+    return text, tuple(names), name
+
+
+def convert_query(sql: str, params=()):
+    """
+    Переводит запрос в стиле psycopg2 в запрос с нумерованными параметрами ($1, $2, ...).
+
+    Returns:
+        Пара (SQL с $1, $2, ..., список аргументов)
+    """
+    text, names, _ = _compile(sql)
+    if isinstance(params, dict):
+        return text, [params[name] for name in names]
+    return text, list(params or ())
+
+
+def _prepared_enabled():
+    # С pgbouncer в режиме transaction подготовленные операторы не работают
+    return os.getenv("PG_PREPARED_STATEMENTS", "1").lower() not in ("0", "false", "no")
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """
+    Соединение, которое помнит имена подготовленных на нём операторов.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class _TimedCursorMixin:
+    """
+    Учёт времени выполнения и выборки строк для курсоров app.db.
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record("execute", time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record("execute", time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record("execute", time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        _record("fetch", time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        _record("fetch", time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        _record("fetch", time.perf_counter() - started, len(rows))
+        return rows
+
+    def __iter__(self):
+        # Время и строки копим локально и записываем один раз — итерация бывает очень длинной
+        spent = 0.0
+        rows = 0
+        it = super().__iter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    spent += time.perf_counter() - started
+                rows += 1
+                yield row
+        finally:
+            _record("fetch", spent, rows)
+
+    def execute_prepared(self, query, vars=None):
+        """
+        Выполняет запрос как подготовленный оператор соединения.
+
+        При первом вызове на соединении запрос проходит PREPARE (разбор и
+        анализ на сервере), затем только EXECUTE с параметрами. Имя оператора —
+        хэш текста запроса, поэтому каждый вариант SQL готовится отдельно.
+        Без PreparingConnection или с PG_PREPARED_STATEMENTS=0 — обычный execute.
+        """
+        prepared = getattr(self.connection, "prepared_statements", None)
+        if prepared is None or not _prepared_enabled():
+            return self.execute(query, vars)
+        text, args = convert_query(query, vars)
+        name = _compile(query)[2]
+        if name not in prepared:
+            # PREPARE не откатывается вместе с транзакцией: оператор живёт до закрытия соединения
+            self.execute(f"PREPARE {name} AS {text}")
+            prepared.add(name)
+        if not args:
+            return self.execute(f"EXECUTE {name}")
+        return self.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+
+
+class InstrumentedCursor(_TimedCursorMixin, RealDictCursor):
+    """
+    RealDictCursor, который учитывает время выполнения и выборки строк.
+    """
+
+
+class TupleCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    """
+    Курсор со строками-кортежами (лёгкий режим, см. Contact).
+    """
+
+
+class Contact:
+    """
+    Строка контакта в лёгком режиме: объект со __slots__ вместо словаря на строку.
+
+    Поля доступны и как атрибуты (c.id в шаблоне), и по имени (row["id"]).
+    """
+
+    __slots__ = ("id", "name", "email")
+
+    def __init__(self, id, name, email):
+        self.id = id
+        self.name = name
+        self.email = email
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        return isinstance(other, Contact) and (self.id, self.name, self.email) == (other.id, other.name, other.email)
+
+    def __repr__(self):
+        return f"Contact(id={self.id!r}, name={self.name!r}, email={self.email!r})"
+
+    def as_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "email": self.email}
+
 
 def get_db_config():
     """
@@ -29,71 +313,1096 @@ def get_db_config():
     }
 
 
-@contextmanager
-def get_connection():
+def get_pool_config():
+    """
+    Читает настройки пула соединений из переменных окружения.
+
+    - PG_POOL_ENABLED (по умолчанию 1; 0 — новое соединение на каждый вызов)
+    - PG_POOL_MIN, PG_POOL_MAX — минимальный и максимальный размер пула
+    - PG_POOL_TIMEOUT — сколько секунд ждать свободного соединения
+    - PG_POOL_MAX_AGE — через сколько секунд соединение пересоздаётся
+    - PG_POOL_MAX_IDLE — сколько секунд может простаивать соединение сверх PG_POOL_MIN
+    - PG_POOL_PING_INTERVAL — после скольких секунд простоя проверять соединение
+    """
+    return {
+        "enabled": _pool_enabled(),
+        "minconn": int(os.getenv("PG_POOL_MIN", "1")),
+        "maxconn": int(os.getenv("PG_POOL_MAX", "5")),
+        "timeout": float(os.getenv("PG_POOL_TIMEOUT", "5")),
+        "max_age": float(os.getenv("PG_POOL_MAX_AGE", "1800")),
+        "max_idle": float(os.getenv("PG_POOL_MAX_IDLE", "600")),
+        "ping_interval": float(os.getenv("PG_POOL_PING_INTERVAL", "30")),
+    }
+
+
+def _pool_enabled():
+    return os.getenv("PG_POOL_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def _connect(host=None, port=None, **kwargs):
+    """
+    Открывает соединение с основным сервером или, если заданы host/port, с репликой.
+    """
     cfg = get_db_config()
-    conn = psycopg2.connect(
-        host=cfg["host"],
-        port=cfg["port"],
+    return psycopg2.connect(
+        host=host or cfg["host"],
+        port=port or cfg["port"],
         dbname=cfg["dbname"],
         user=cfg["user"],
         password=cfg["password"],
-        cursor_factory=RealDictCursor,
+        connection_factory=PreparingConnection,
+        cursor_factory=InstrumentedCursor,
+        **kwargs,
     )
+
+
+def _new_pool(connect):
+    cfg = get_pool_config()
+    return ConnectionPool(
+        connect,
+        minconn=cfg["minconn"],
+        maxconn=cfg["maxconn"],
+        timeout=cfg["timeout"],
+        max_age=cfg["max_age"],
+        max_idle=cfg["max_idle"],
+        ping_interval=cfg["ping_interval"],
+    )
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Соединения, унаследованные от родительского процесса после fork().
+# Их нельзя закрывать: сокет общий с родителем, и PQfinish оборвал бы его сессию.
+_inherited_pools = []
+
+
+def get_pool():
+    """
+    Возвращает пул соединений текущего процесса, создавая его при первом обращении.
+
+    Пул привязан к PID: после fork() (например, в воркере gunicorn)
+    создаётся новый пул, а соединения родителя не используются.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            _pool = _new_pool(_connect)
+            _pool_pid = pid
+    return _pool
+
+
+def close_pool():
+    """
+    Закрывает пул текущего процесса и пулы реплик (например, при остановке воркера).
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
+    close_replicas()
+
+
+def pool_stats():
+    """
+    Возвращает статистику пула текущего процесса или None, если пул не используется.
+    """
+    if _pool is None or _pool_pid != os.getpid():
+        return None
+    return _pool.stats()
+
+
+_replicas = None
+_replicas_pid = None
+# LSN последней записи сессии: чтение с реплики, которая до него не дошла,
+# вернуло бы данные без только что сделанных изменений (read-your-writes)
+_session_lsn = contextvars.ContextVar("db_session_lsn", default=0)
+_primary_only = contextvars.ContextVar("db_primary_only", default=False)
+
+
+def get_replicas():
+    """
+    Реплики текущего процесса (ReplicaSet) или None, если PG_REPLICA_HOSTS не задан.
+
+    Как и пул, привязаны к PID; поток проверки запускается при первом обращении.
+    """
+    global _replicas, _replicas_pid
+    pid = os.getpid()
+    if _replicas_pid == pid:
+        return _replicas
+    with _pool_lock:
+        if _replicas_pid != pid:
+            if _replicas is not None:
+                _inherited_pools.extend(replica.pool for replica in _replicas.replicas)
+            cfg = replicas.get_replica_config()
+            _replicas = None
+            if cfg["hosts"]:
+                members = []
+                for host, port in cfg["hosts"]:
+                    connect = functools.partial(_connect, host, port, connect_timeout=cfg["connect_timeout"])
+                    members.append(replicas.Replica(f"{host}:{port}", _new_pool(connect) if _pool_enabled() else connect))
+                _replicas = replicas.ReplicaSet(members, cfg["max_lag"], cfg["check_interval"])
+                _replicas.start()
+            _replicas_pid = pid
+    return _replicas
+
+
+def close_replicas():
+    global _replicas, _replicas_pid
+    with _pool_lock:
+        replica_set, owned = _replicas, _replicas_pid == os.getpid()
+        _replicas = None
+        _replicas_pid = None
+    if replica_set is not None and owned:
+        replica_set.close()
+
+
+def replica_stats():
+    """
+    Состояние реплик текущего процесса или None, если реплики не настроены.
+    """
+    replica_set = get_replicas()
+    return None if replica_set is None else replica_set.stats()
+
+
+def get_session_lsn() -> str:
+    """
+    LSN последней записи текущей сессии ('' — записей не было или реплик нет).
+    """
+    lsn = _session_lsn.get()
+    return replicas.format_lsn(lsn) if lsn else ""
+
+
+def set_session_lsn(lsn):
+    """
+    Задаёт LSN последней записи сессии, например из cookie предыдущего запроса.
+
+    Действует в текущем контексте (запрос Flask, поток Tk-клиента).
+    Без реплик и при некорректном значении LSN сбрасывается.
+    """
+    try:
+        value = replicas.parse_lsn(lsn) if get_replicas() is not None else 0
+    except ValueError:
+        value = 0
+    _session_lsn.set(value)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Внутри блока чтение идёт только с основного сервера.
+
+    Нужно, когда данные должны быть видны сразу после чужой записи,
+    например при дочитывании строк по уведомлению LISTEN/NOTIFY.
+    """
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def _primary_fallback(func):
+    """
+    Декоратор чтения: если реплика оборвала запрос, он повторяется на основном сервере.
+
+    Не подходит для генераторов — часть строк к моменту ошибки уже отдана.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except replicas.ReplicaReadError:
+            with primary_reads():
+                return func(*args, **kwargs)
+    return wrapper
+
+
+def _remember_write_lsn(conn):
+    # Позиция журнала после коммита: реплика, дошедшая до неё, видит запись
+    if conn.closed or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_current_wal_lsn()::text AS lsn;")
+        lsn = replicas.parse_lsn(cur.fetchone()["lsn"])
+    conn.rollback()
+    _session_lsn.set(max(_session_lsn.get(), lsn))
+
+
+def _reset_pool_after_fork():
+    global _pool, _pool_pid, _pool_lock, _replicas, _replicas_pid
+    # Блокировка могла быть захвачена другим потоком родителя в момент fork()
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_pid = None
+    # Потока проверки реплик в дочернем процессе нет: создадим реплики заново
+    if _replicas is not None:
+        _inherited_pools.extend(replica.pool for replica in _replicas.replicas)
+    _replicas = None
+    _replicas_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+@contextmanager
+def get_connection(read_only: bool = False):
+    """
+    Выдаёт соединение из пула и возвращает его обратно по выходу из блока.
+
+    Незакоммиченная транзакция при возврате откатывается.
+
+    Args:
+        read_only: Блок только читает: соединение может быть взято с реплики
+                   (см. app.replicas), если она доступна и не отстаёт
+    """
+    started = time.perf_counter()
+    replica_set = get_replicas()
+    if read_only and replica_set is not None and not _primary_only.get():
+        replica = replica_set.choose(_session_lsn.get())
+        if replica is not None:
+            try:
+                conn = replica.acquire()
+            except PoolTimeoutError:
+                # Пул реплики занят — этот запрос прочитает с основного сервера
+                pass
+            except psycopg2.OperationalError as e:
+                replica_set.mark_down(replica, e)
+            else:
+                _record("connect", time.perf_counter() - started)
+                metrics.db_reads_total.labels(target="replica").inc()
+                broken = False
+                try:
+                    yield conn
+                except psycopg2.OperationalError as e:
+                    # Реплика упала посреди запроса: следующие чтения пойдут на основной
+                    broken = True
+                    replica_set.mark_down(replica, e)
+                    raise replicas.ReplicaReadError(str(e)) from e
+                finally:
+                    replica.release(conn, discard=broken)
+                return
+    if read_only:
+        metrics.db_reads_total.labels(target="primary").inc()
+
+    if not _pool_enabled():
+        conn = _connect()
+        _record("connect", time.perf_counter() - started)
+        try:
+            yield conn
+            if not read_only and replica_set is not None:
+                _remember_write_lsn(conn)
+        finally:
+            conn.close()
+        return
+
+    pool = get_pool()
+    conn = pool.getconn()
+    _record("connect", time.perf_counter() - started)
     try:
         yield conn
+        if not read_only and replica_set is not None:
+            _remember_write_lsn(conn)
     finally:
-        conn.close()
+        pool.putconn(conn)
+
+
+# Кэш чтения контактов (выключен, пока CONTACTS_CACHE_TTL не задан)
+contacts_cache = TTLCache.from_env()
 
 
 def init_db():
     """
-    Создает простую таблицу contacts, если её ещё нет.
+    Приводит схему БД к актуальной версии (см. app.migrate).
+
+    Оставлена для совместимости: веб-приложение больше не вызывает её
+    на запросах, миграции запускаются командой python -m app.migrate до gunicorn.
+    """
+    from app.migrate import run_migrations
+    return run_migrations()
+
+
+@_instrumented("get_all_contacts")
+@_primary_fallback
+def get_all_contacts(lean: bool = False):
     """
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS contacts (
-        id SERIAL PRIMARY KEY,
-        name TEXT NOT NULL,
-        email TEXT NOT NULL
-    );
+    Возвращает все контакты по возрастанию id.
+
+    С lean=True строки — объекты Contact, а не словари (см. _fetch_rows).
     """
-    with get_connection() as conn:
+    if _session_lsn.get():
+        return _fetch_all_contacts(lean)
+    return contacts_cache.get_or_load(("all", lean), lambda: _fetch_all_contacts(lean))
+
+
+def _fetch_rows(conn, sql, params=None, lean: bool = False):
+    """
+    Выполняет подготовленный запрос id, name, email и возвращает строки.
+
+    В лёгком режиме строки приходят кортежами и упаковываются в Contact:
+    на строку создаётся один объект со __slots__ вместо словаря.
+    """
+    if not lean:
         with conn.cursor() as cur:
-            cur.execute(create_table_sql)
-        conn.commit()
+            cur.execute_prepared(sql, params)
+            return cur.fetchall()
+    with conn.cursor(cursor_factory=TupleCursor) as cur:
+        cur.execute_prepared(sql, params)
+        return [Contact(*row) for row in cur.fetchall()]
 
 
-def get_all_contacts():
-    with get_connection() as conn:
+def _fetch_all_contacts(lean: bool = False):
+    with get_connection(read_only=True) as conn:
+        return _fetch_rows(conn, "SELECT id, name, email FROM contacts ORDER BY id;", lean=lean)
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _like_prefix(prefix: str) -> str:
+    """
+    Превращает строку в шаблон LIKE "начинается с", экранируя спецсимволы.
+    """
+    escaped = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+@_instrumented("list_contacts")
+@_primary_fallback
+def list_contacts(
+    limit: int = DEFAULT_PAGE_SIZE,
+    after_id: int = None,
+    before_id: int = None,
+    name_prefix: str = None,
+    email_prefix: str = None,
+    use_cache: bool = True,
+    lean: bool = False,
+):
+    """
+    Возвращает одну страницу контактов с keyset-пагинацией по id.
+
+    Стоимость запроса не зависит от номера страницы: вместо OFFSET
+    используется условие id > after_id (или id < before_id для шага назад).
+
+    Args:
+        limit: Размер страницы (1..MAX_PAGE_SIZE)
+        after_id: Вернуть контакты с id больше указанного
+        before_id: Вернуть контакты с id меньше указанного (предыдущая страница)
+        name_prefix: Фильтр по началу имени (без учёта регистра)
+        email_prefix: Фильтр по началу email (без учёта регистра)
+        use_cache: Разрешить ответ из кэша процесса (contacts_cache); после записи
+                   в сессии с репликами кэш не используется, см. get_connection
+        lean: Вернуть контакты объектами Contact, а не словарями (для
+              страниц, которые только выводят строки, как index())
+
+    Returns:
+        Словарь с ключами contacts, next_after (курсор следующей страницы
+        или None) и prev_before (курсор предыдущей страницы или None)
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if not use_cache or _session_lsn.get():
+        return _fetch_contacts_page(limit, after_id, before_id, name_prefix, email_prefix, lean)
+    key = ("page", limit, after_id, before_id, name_prefix, email_prefix, lean)
+    return contacts_cache.get_or_load(
+        key, lambda: _fetch_contacts_page(limit, after_id, before_id, name_prefix, email_prefix, lean)
+    )
+
+
+def _contacts_page_query(limit, after_id, before_id, name_prefix, email_prefix, columns: str = "id, name, email"):
+    """
+    SQL и параметры страницы list_contacts (общие с app.async_db).
+    """
+    conditions = []
+    params = []
+    if name_prefix:
+        conditions.append("lower(name) LIKE %s")
+        params.append(_like_prefix(name_prefix))
+    if email_prefix:
+        conditions.append("lower(email) LIKE %s")
+        params.append(_like_prefix(email_prefix))
+
+    backward = before_id is not None
+    if backward:
+        conditions.append("id < %s")
+        params.append(before_id)
+    elif after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    order = "DESC" if backward else "ASC"
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    sql = f"SELECT {columns} FROM contacts {where}ORDER BY id {order} LIMIT %s;"
+    params.append(limit + 1)
+    return sql, params
+
+
+def _contacts_page(rows, limit, after_id, before_id):
+    """
+    Страница list_contacts из строк, выбранных запросом _contacts_page_query.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before_id is not None:
+        rows.reverse()
+        prev_before = rows[0]["id"] if has_more else None
+        next_after = rows[-1]["id"] if rows else None
+    else:
+        next_after = rows[-1]["id"] if has_more else None
+        prev_before = rows[0]["id"] if after_id is not None and rows else None
+
+    return {"contacts": rows, "next_after": next_after, "prev_before": prev_before}
+
+
+def _fetch_contacts_page(limit, after_id, before_id, name_prefix, email_prefix, lean=False):
+    sql, params = _contacts_page_query(limit, after_id, before_id, name_prefix, email_prefix)
+    with get_connection(read_only=True) as conn:
+        rows = _fetch_rows(conn, sql, params, lean)
+
+    if before_id is not None and not rows:
+        # Перед курсором ничего нет — показываем первую страницу
+        return _fetch_contacts_page(limit, None, None, name_prefix, email_prefix, lean)
+    return _contacts_page(rows, limit, after_id, before_id)
+
+
+@_instrumented("get_page_version")
+@_primary_fallback
+def get_page_version(
+    limit: int = DEFAULT_PAGE_SIZE,
+    after_id: int = None,
+    before_id: int = None,
+    name_prefix: str = None,
+    email_prefix: str = None,
+) -> str:
+    """
+    Версия страницы list_contacts с теми же параметрами — для ETag в JSON API.
+
+    Выбирает те же строки, что и страница (с лишней строкой для курсора), но
+    только id и xmin: число строк, крайние id и сумма xmin меняются при любой
+    вставке, изменении и удалении строки страницы. Общего счётчика версий нет,
+    поэтому записи в contacts не ждут друг друга.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    with get_connection(read_only=True) as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, name, email FROM contacts ORDER BY id;")
+            for cursor in ((after_id, before_id), (None, None)):
+                page_sql, params = _contacts_page_query(limit, *cursor, name_prefix, email_prefix, columns="id, xmin")
+                cur.execute_prepared(
+                    "SELECT count(*) AS total, coalesce(min(id), 0) AS first_id, coalesce(max(id), 0) AS last_id, "
+                    "coalesce(sum(xmin::text::bigint), 0) AS xmin_sum "
+                    f"FROM ({page_sql.rstrip(';')}) AS page;",
+                    params,
+                )
+                row = cur.fetchone()
+                # Как в _fetch_contacts_page: перед курсором пусто — первая страница
+                if row["total"] or before_id is None:
+                    break
+    return f"{row['total']}-{row['first_id']}-{row['last_id']}-{row['xmin_sum']}"
+
+
+# Минимальная длина запроса для триграммного поиска: у более коротких строк
+# нет ни одной полной триграммы, и индекс pg_trgm не используется
+SEARCH_MIN_TRIGRAM_LENGTH = 3
+# Предел глубины выдачи: ранжированный поиск идёт через OFFSET
+SEARCH_MAX_OFFSET = 1000
+
+# Установлено ли pg_trgm: без расширения миграция 0004 пропускается, и поиск
+# идёт только по LIKE. Пока расширения нет, проверка повторяется не чаще
+# раза в TRIGRAM_CHECK_SECONDS секунд
+TRIGRAM_CHECK_SECONDS = 60
+TRIGRAM_CHECK_SQL = "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS available;"
+_trigram = {"available": False, "checked": None}
+
+
+def _trigram_check_due() -> bool:
+    checked = _trigram["checked"]
+    return not _trigram["available"] and (checked is None or time.monotonic() - checked >= TRIGRAM_CHECK_SECONDS)
+
+
+def _remember_trigram(available: bool):
+    _trigram["available"] = bool(available)
+    _trigram["checked"] = time.monotonic()
+
+
+def _like_substring(query: str) -> str:
+    """
+    Превращает строку в шаблон LIKE "содержит", экранируя спецсимволы.
+    """
+    return "%" + _like_prefix(query)
+
+
+@_instrumented("search_contacts")
+@_primary_fallback
+def search_contacts(query: str, limit: int = DEFAULT_PAGE_SIZE, page: int = 1, use_cache: bool = True):
+    """
+    Ищет контакты по имени и email: начало строки, подстрока и нечёткое совпадение.
+
+    Запросы от SEARCH_MIN_TRIGRAM_LENGTH символов используют триграммные
+    GIN-индексы (миграция 0004): LIKE '%подстрока%' и оператор похожести %
+    из pg_trgm. Результаты упорядочены по рангу: совпадение с началом строки
+    выше подстроки, подстрока выше нечёткого совпадения. Более короткие
+    запросы ищутся только по началу строки через индексы из миграции 0003.
+    Если pg_trgm на сервере нет, нечёткого совпадения нет, а подстрока
+    ищется полным просмотром таблицы.
+
+    Args:
+        query: Строка поиска (без учёта регистра)
+        limit: Размер страницы (1..MAX_PAGE_SIZE)
+        page: Номер страницы, начиная с 1
+        use_cache: Разрешить ответ из кэша процесса (contacts_cache); после записи
+                   в сессии с репликами кэш не используется, см. get_connection
+
+    Returns:
+        Словарь с ключами contacts, page и has_next
+    """
+    query = (query or "").strip().lower()
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    max_page = SEARCH_MAX_OFFSET // limit + 1
+    page = max(1, min(int(page), max_page))
+    if not query:
+        return {"contacts": [], "page": page, "has_next": False}
+    if not use_cache or _session_lsn.get():
+        return _fetch_search_page(query, limit, page, max_page)
+    key = ("search", query, limit, page)
+    return contacts_cache.get_or_load(key, lambda: _fetch_search_page(query, limit, page, max_page))
+
+
+def _search_query(query, limit, page, trigram: bool = True):
+    """
+    SQL и параметры страницы search_contacts (общие с app.async_db).
+
+    С trigram=False (pg_trgm не установлено) длинные запросы ищутся только
+    по подстроке, без оператора похожести.
+    """
+    params = {
+        "query": query,
+        "prefix": _like_prefix(query),
+        "substring": _like_substring(query),
+        "limit": limit + 1,
+        "offset": (page - 1) * limit,
+    }
+    if len(query) < SEARCH_MIN_TRIGRAM_LENGTH:
+        sql = """
+            SELECT id, name, email, 1.0::real AS rank
+            FROM contacts
+            WHERE lower(name) LIKE %(prefix)s OR lower(email) LIKE %(prefix)s
+            ORDER BY id
+            LIMIT %(limit)s OFFSET %(offset)s;
+        """
+    elif not trigram:
+        sql = """
+            SELECT id, name, email,
+                   CASE
+                       WHEN lower(name) LIKE %(prefix)s OR lower(email) LIKE %(prefix)s THEN 2
+                       ELSE 1
+                   END::real AS rank
+            FROM contacts
+            WHERE lower(name) LIKE %(substring)s OR lower(email) LIKE %(substring)s
+            ORDER BY rank DESC, id
+            LIMIT %(limit)s OFFSET %(offset)s;
+        """
+    else:
+        # %% — оператор похожести pg_trgm (% экранирован для psycopg2)
+        sql = """
+            SELECT id, name, email,
+                   CASE
+                       WHEN lower(name) LIKE %(prefix)s OR lower(email) LIKE %(prefix)s THEN 2
+                       WHEN lower(name) LIKE %(substring)s OR lower(email) LIKE %(substring)s THEN 1
+                       ELSE 0
+                   END
+                   + greatest(similarity(lower(name), %(query)s::text), similarity(lower(email), %(query)s::text)) AS rank
+            FROM contacts
+            WHERE lower(name) LIKE %(substring)s OR lower(email) LIKE %(substring)s
+               OR lower(name) %% %(query)s::text OR lower(email) %% %(query)s::text
+            ORDER BY rank DESC, id
+            LIMIT %(limit)s OFFSET %(offset)s;
+        """
+    return sql, params
+
+
+def _fetch_search_page(query, limit, page, max_page):
+    with get_connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            if _trigram_check_due():
+                cur.execute_prepared(TRIGRAM_CHECK_SQL)
+                _remember_trigram(cur.fetchone()["available"])
+            sql, params = _search_query(query, limit, page, _trigram["available"])
+            cur.execute_prepared(sql, params)
             rows = cur.fetchall()
-    return rows
 
+    has_next = len(rows) > limit and page < max_page
+    return {"contacts": rows[:limit], "page": page, "has_next": has_next}
+
+
+@_instrumented("get_contacts_by_ids")
+@_primary_fallback
+def get_contacts_by_ids(contact_ids):
+    """
+    Возвращает существующие контакты с указанными id (по возрастанию id).
+    """
+    ids = list(contact_ids)
+    if not ids:
+        return []
+    with get_connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute_prepared("SELECT id, name, email FROM contacts WHERE id = ANY(%s) ORDER BY id;", (ids,))
+            return cur.fetchall()
+
+
+@_instrumented("count_contacts")
+@_primary_fallback
+def count_contacts() -> int:
+    """
+    Возвращает число контактов в таблице.
+    """
+    with get_connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute_prepared("SELECT count(*) AS total FROM contacts;")
+            return cur.fetchone()["total"]
+
+
+@_instrumented("get_contacts_window")
+@_primary_fallback
+def get_contacts_window(offset: int, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Возвращает limit контактов начиная с позиции offset в порядке id.
 
-def add_contact(name: str, email: str):
+    Нужна для перехода к произвольному месту списка (ползунок прокрутки);
+    для последовательного чтения дешевле list_contacts с after_id.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    with get_connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute_prepared(
+                "SELECT id, name, email FROM contacts ORDER BY id OFFSET %s LIMIT %s;",
+                (max(0, int(offset)), limit),
+            )
+            return cur.fetchall()
+
+
+@_instrumented("get_contact")
+@_primary_fallback
+def get_contact(contact_id: int):
+    """
+    Возвращает контакт по id вместе с row_version (xmin строки) или None.
+
+    xmin меняется при каждом изменении строки, поэтому подходит для ETag.
+    """
+    with get_connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute_prepared(
+                "SELECT id, name, email, xmin::text AS row_version FROM contacts WHERE id = %s;",
+                (contact_id,),
+            )
+            return cur.fetchone()
+
+
+@_instrumented("add_contact")
+def add_contact(name: str, email: str) -> int:
+    """
+    Добавляет контакт и возвращает его id.
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO contacts (name, email) VALUES (%s, %s);",
+            cur.execute_prepared(
+                "INSERT INTO contacts (name, email) VALUES (%s, %s) RETURNING id;",
                 (name, email),
             )
+            contact_id = cur.fetchone()["id"]
         conn.commit()
+    contacts_cache.invalidate()
+    return contact_id
+
+
+# Выражение уникального индекса contacts_email_unique_idx (миграция 0006)
+EMAIL_KEY_SQL = "lower(btrim(email))"
+
+
+def email_key(email: str) -> str:
+    """
+    Нормализованный email, по которому контакты уникальны.
+    """
+    return email.strip().lower()
 
 
-def update_contact(contact_id: int, name: str, email: str):
+# Вставка или обновление по уникальному индексу; строка без изменений не
+# переписывается и возвращается со статусом unchanged
+UPSERT_CONTACT_SQL = f"""
+    WITH upserted AS (
+        INSERT INTO contacts (name, email) VALUES (%(name)s, %(email)s)
+        ON CONFLICT (({EMAIL_KEY_SQL})) DO UPDATE
+            SET name = EXCLUDED.name, email = EXCLUDED.email
+            WHERE (contacts.name, contacts.email) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.email)
+        RETURNING id, xmax = 0 AS created
+    )
+    SELECT id, CASE WHEN created THEN 'created' ELSE 'updated' END AS status FROM upserted
+    UNION ALL
+    SELECT id, 'unchanged' FROM contacts
+    WHERE {EMAIL_KEY_SQL} = %(key)s AND NOT EXISTS (SELECT 1 FROM upserted);
+"""
+UPSERT_FALLBACK_SQL = f"SELECT id, 'unchanged' AS status FROM contacts WHERE {EMAIL_KEY_SQL} = %(key)s;"
+# Группа создания в apply_batch: тот же upsert для многих строк (ключи в группе
+# различны). Для unchanged id читается из снимка команды; если строки в нём
+# нет (зафиксирована параллельно), id будет NULL — тогда нужен UPSERT_FALLBACK_SQL
+UPSERT_BATCH_SQL = f"""
+    WITH v (key, new_name, new_email) AS (VALUES %s),
+    upserted AS (
+        INSERT INTO contacts (name, email) SELECT new_name, new_email FROM v
+        ON CONFLICT (({EMAIL_KEY_SQL})) DO UPDATE
+            SET name = EXCLUDED.name, email = EXCLUDED.email
+            WHERE (contacts.name, contacts.email) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.email)
+        RETURNING id, {EMAIL_KEY_SQL} AS key, xmax = 0 AS created
+    )
+    SELECT v.key,
+           coalesce(u.id, (SELECT id FROM contacts WHERE {EMAIL_KEY_SQL} = v.key)) AS id,
+           CASE WHEN u.created THEN 'created' WHEN u.id IS NOT NULL THEN 'updated' ELSE 'unchanged' END AS status
+    FROM v LEFT JOIN upserted u ON u.key = v.key;
+"""
+
+
+@_instrumented("upsert_contact")
+def upsert_contact(name: str, email: str):
+    """
+    Добавляет контакт или обновляет существующий с тем же email (без учёта
+    регистра и пробелов по краям) одной командой по уникальному индексу.
+
+    Повтор с теми же данными строку не переписывает.
+
+    Returns:
+        Пара (id, статус), статус — created, updated или unchanged
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
+            cur.execute_prepared(UPSERT_CONTACT_SQL, {"name": name, "email": email, "key": email_key(email)})
+            row = cur.fetchone()
+        conn.commit()
+    if row is None:
+        # Конфликтующая строка зафиксирована другой транзакцией после начала
+        # команды и не видна в её снимке — читаем её отдельным запросом
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute_prepared(UPSERT_FALLBACK_SQL, {"key": email_key(email)})
+                row = cur.fetchone()
+    if row["status"] != "unchanged":
+        contacts_cache.invalidate()
+    return row["id"], row["status"]
+
+
+@_instrumented("update_contact")
+def update_contact(contact_id: int, name: str, email: str) -> bool:
+    """
+    Обновляет контакт. Возвращает False, если контакта с таким id нет.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute_prepared(
                 "UPDATE contacts SET name = %s, email = %s WHERE id = %s;",
                 (name, email, contact_id),
             )
+            updated = cur.rowcount > 0
         conn.commit()
+    contacts_cache.invalidate()
+    return updated
+
+
+@_instrumented("delete_contact")
+def delete_contact(contact_id: int) -> bool:
+    """
+    Удаляет контакт. Возвращает False, если контакта с таким id нет.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute_prepared("DELETE FROM contacts WHERE id = %s;", (contact_id,))
+            deleted = cur.rowcount > 0
+        conn.commit()
+    contacts_cache.invalidate()
+    return deleted
+
+
+BATCH_OPERATIONS = ("create", "update", "delete")
+
+
+def _batch_runs(operations):
+    """
+    Делит операции на подряд идущие группы одного типа.
+
+    Группа прерывается и на повторном ключе (id, а для create — email):
+    одна команда меняет строку только один раз, а порядок операций важен.
+    """
+    runs = []
+    for index, operation in enumerate(operations):
+        op = operation["op"]
+        if op not in BATCH_OPERATIONS:
+            raise ValueError(f"Неизвестная операция: {op!r}")
+        key = email_key(operation["email"]) if op == "create" else operation["id"]
+        run = runs[-1] if runs else None
+        if run is None or run[0] != op or key in run[2]:
+            run = (op, [], set())
+            runs.append(run)
+        run[1].append(index)
+        run[2].add(key)
+    return [(op, indexes) for op, indexes, _ in runs]
+
+
+@_instrumented("apply_batch")
+def apply_batch(operations):
+    """
+    Выполняет список операций над контактами в одной транзакции.
+
+    Подряд идущие операции одного типа отправляются одной командой
+    (execute_values), поэтому на тысячу операций приходится несколько
+    запросов и один COMMIT. При ошибке БД откатываются все операции.
+
+    Args:
+        operations: Список словарей {"op": "create", "name", "email"},
+            {"op": "update", "id", "name", "email"} или {"op": "delete", "id"}
+
+    Returns:
+        Список результатов в порядке операций: {"op", "id", "status"},
+        где status — created, updated, deleted или not_found
+        (create с уже существующим email обновляет контакт — updated)
+    """
+    operations = list(operations)
+    results = [None] * len(operations)
+    # При ошибке соединение вернётся в пул, и незакоммиченная транзакция откатится
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for op, indexes in _batch_runs(operations):
+                batch = [operations[i] for i in indexes]
+                if op == "create":
+                    # Создание — upsert по email, как и в upsert_contact: совпадающая
+                    # строка не переписывается, её статус — unchanged
+                    rows = execute_values(cur, UPSERT_BATCH_SQL, [
+                        (email_key(o["email"]), o["name"], o["email"]) for o in batch
+                    ], template="(%s::text, %s::text, %s::text)", page_size=len(batch), fetch=True)
+                    by_key = {row["key"]: row for row in rows}
+                    for i, o in zip(indexes, batch):
+                        row = by_key[email_key(o["email"])]
+                        if row["id"] is None:
+                            # Строка зафиксирована другой транзакцией после начала команды
+                            cur.execute_prepared(UPSERT_FALLBACK_SQL, {"key": row["key"]})
+                            row = cur.fetchone()
+                        results[i] = {"op": op, "id": row["id"], "status": row["status"]}
+                    continue
+                if op == "update":
+                    rows = execute_values(
+                        cur,
+                        "UPDATE contacts AS c SET name = v.name, email = v.email "
+                        "FROM (VALUES %s) AS v (id, name, email) WHERE c.id = v.id RETURNING c.id;",
+                        [(o["id"], o["name"], o["email"]) for o in batch],
+                        template="(%s::integer, %s::text, %s::text)",
+                        page_size=len(batch),
+                        fetch=True,
+                    )
+                    status = "updated"
+                else:
+                    cur.execute(
+                        "DELETE FROM contacts WHERE id = ANY(%s) RETURNING id;",
+                        ([o["id"] for o in batch],),
+                    )
+                    rows = cur.fetchall()
+                    status = "deleted"
+                found = {row["id"] for row in rows}
+                for i, o in zip(indexes, batch):
+                    results[i] = {"op": op, "id": o["id"], "status": status if o["id"] in found else "not_found"}
+        conn.commit()
+    if operations:
+        contacts_cache.invalidate()
+    return results
+
+
+class _CsvRowReader(io.TextIOBase):
+    """
+    Файлоподобный объект для COPY FROM STDIN: кодирует строки в CSV по мере чтения.
 
+    В памяти держится только текущий фрагмент, а не весь набор строк.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self.count = 0
+
+    def readable(self):
+        return True
 
-def delete_contact(contact_id: int):
+    def read(self, size=-1):
+        target = size if size and size > 0 else 64 * 1024
+        while self._buffer.tell() < target:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.count += 1
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+@_instrumented("copy_contacts")
+def copy_contacts(rows) -> int:
+    """
+    Загружает контакты потоком через COPY FROM STDIN в одной транзакции.
+
+    Строки сначала попадают во временную таблицу, затем сливаются в contacts
+    одной командой: из повторов email внутри загрузки берётся последний,
+    существующие контакты с тем же email обновляются. Поэтому повторный
+    импорт того же файла не создаёт дублей.
+
+    Args:
+        rows: Итерируемый источник пар (name, email); читается лениво
+
+    Returns:
+        Количество добавленных и изменённых контактов: повторы внутри загрузки
+        и строки, совпадающие с уже сохранёнными, не учитываются
+    """
+    reader = _CsvRowReader(rows)
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM contacts WHERE id = %s;", (contact_id,))
+            cur.execute(
+                "CREATE TEMP TABLE contacts_import ("
+                "position BIGINT GENERATED ALWAYS AS IDENTITY, name TEXT NOT NULL, email TEXT NOT NULL"
+                ") ON COMMIT DROP;"
+            )
+            cur.copy_expert("COPY contacts_import (name, email) FROM STDIN WITH (FORMAT csv);", reader)
+            cur.execute(
+                f"""
+                INSERT INTO contacts (name, email)
+                SELECT DISTINCT ON ({EMAIL_KEY_SQL}) name, email
+                FROM contacts_import
+                ORDER BY {EMAIL_KEY_SQL}, position DESC
+                ON CONFLICT (({EMAIL_KEY_SQL})) DO UPDATE
+                    SET name = EXCLUDED.name, email = EXCLUDED.email
+                    WHERE (contacts.name, contacts.email) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.email);
+                """
+            )
+            merged = cur.rowcount
         conn.commit()
+    contacts_cache.invalidate()
+    return merged
+
+
+EXPORT_BATCH_SIZE = 2000
+
+
+@_instrumented("iter_contacts")
+def iter_contacts(batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Лениво перебирает все контакты через именованный (серверный) курсор.
+
+    Строки приходят с сервера пачками по batch_size, поэтому потребление
+    памяти не зависит от размера таблицы. Соединение занято, пока генератор
+    не исчерпан или не закрыт.
+    """
+    with get_connection(read_only=True) as conn:
+        with conn.cursor(name="contacts_export") as cur:
+            cur.itersize = batch_size
+            cur.execute("SELECT id, name, email FROM contacts ORDER BY id;")
+            for row in cur:
+                yield row
 
+
+class _ExportCancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """
+    Приёмник для COPY TO STDOUT: копит вывод и передаёт его пачками в очередь.
+    """
+
+    def __init__(self, out_queue, stop_event, chunk_size):
+        self._queue = out_queue
+        self._stop = stop_event
+        self._chunk_size = chunk_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, data):
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            chunk = b"".join(self._parts)
+            self._parts = []
+            self._size = 0
+            _put_until_stopped(self._queue, chunk, self._stop)
+
+
+def _put_until_stopped(out_queue, item, stop_event):
+    while True:
+        if stop_event.is_set():
+            raise _ExportCancelled()
+        try:
+            out_queue.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+_COPY_DONE = object()
+
+
+@_instrumented("copy_contacts_out")
+def copy_contacts_out(chunk_size: int = 64 * 1024):
+    """
+    Самый быстрый вариант выгрузки: COPY ... TO STDOUT в формате CSV с заголовком.
+
+    COPY выполняется в фоновом потоке, а генератор отдаёт готовые фрагменты
+    (bytes в кодировке соединения). Очередь ограничена, поэтому медленный клиент притормаживает
+    выгрузку, а не накапливает её в памяти.
+    """
+    out_queue = queue.Queue(maxsize=8)
+    stop = threading.Event()
+
+    def worker():
+        try:
+            writer = _QueueWriter(out_queue, stop, chunk_size)
+            with get_connection(read_only=True) as conn:
+                with conn.cursor() as cur:
+                    cur.copy_expert(
+                        "COPY (SELECT id, name, email FROM contacts ORDER BY id) "
+                        "TO STDOUT WITH (FORMAT csv, HEADER);",
+                        writer,
+                    )
+            writer.flush()
+            _put_until_stopped(out_queue, _COPY_DONE, stop)
+        except _ExportCancelled:
+            pass
+        except Exception as e:
+            try:
+                _put_until_stopped(out_queue, e, stop)
+            except _ExportCancelled:
+                pass
+
+    # Копия контекста передаёт в поток текущую операцию для учёта времени COPY
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(worker,), name="contacts-copy-out", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _COPY_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,100 @@
+"""
+Разовое слияние контактов-дублей по нормализованному email.
+
+Группа дублей — контакты с одинаковым lower(btrim(email)). В каждой группе
+остаётся строка с наименьшим id (на неё могут ссылаться клиенты), ей
+достаются имя и email самой новой строки, остальные удаляются. Группы
+обрабатываются пачками, каждая пачка — отдельная короткая транзакция.
+
+Миграция 0006 применяет то же правило перед созданием уникального индекса;
+на больших таблицах удобнее заранее запустить этот инструмент.
+
+Использование:
+    python -m app.dedup --dry-run   # показать группы дублей
+    python -m app.dedup             # слить дубли
+"""
+import argparse
+import json
+import sys
+
+from psycopg2.extras import execute_values
+
+from app import db
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def find_duplicate_groups():
+    """
+    Возвращает группы дублей: список списков id по возрастанию.
+    """
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT array_agg(id ORDER BY id) AS ids
+                FROM contacts
+                GROUP BY {db.EMAIL_KEY_SQL}
+                HAVING count(*) > 1
+                ORDER BY min(id);
+                """
+            )
+            return [row["ids"] for row in cur.fetchall()]
+
+
+def merge_groups(groups, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Сливает группы дублей пачками по batch_size групп.
+
+    Returns:
+        Число удалённых строк
+    """
+    removed = 0
+    for start in range(0, len(groups), batch_size):
+        batch = groups[start:start + batch_size]
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, name, email FROM contacts WHERE id = ANY(%s);",
+                    ([ids[-1] for ids in batch],),
+                )
+                latest = {row["id"]: row for row in cur.fetchall()}
+                # Сначала удаляем лишние строки, потом переносим данные: если
+                # уникальный индекс уже есть (хотя бы недействительный), обратный
+                # порядок нарушил бы его
+                cur.execute(
+                    "DELETE FROM contacts WHERE id = ANY(%s);",
+                    ([contact_id for ids in batch for contact_id in ids[1:]],),
+                )
+                removed += cur.rowcount
+                execute_values(
+                    cur,
+                    "UPDATE contacts AS c SET name = v.name, email = v.email "
+                    "FROM (VALUES %s) AS v (id, name, email) WHERE c.id = v.id;",
+                    [(ids[0], latest[ids[-1]]["name"], latest[ids[-1]]["email"]) for ids in batch if ids[-1] in latest],
+                    template="(%s::integer, %s::text, %s::text)",
+                    page_size=len(batch),
+                )
+            conn.commit()
+    db.contacts_cache.invalidate()
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Слияние контактов с одинаковым email")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать группы дублей")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Групп в одной транзакции")
+    args = parser.parse_args(argv)
+
+    groups = find_duplicate_groups()
+    report = {"groups": len(groups), "duplicates": sum(len(ids) - 1 for ids in groups)}
+    if args.dry_run:
+        report["examples"] = groups[:20]
+    else:
+        report["removed"] = merge_groups(groups, args.batch_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Потоковая выгрузка контактов в CSV/NDJSON.
+"""
+import csv
+import io
+import json
+
+from app import db
+
+# Примерный размер фрагмента ответа в символах
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(rows, chunk_size: int = CHUNK_SIZE):
+    """
+    Кодирует строки в CSV с заголовком, отдавая текст фрагментами.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(("id", "name", "email"))
+    for row in rows:
+        writer.writerow((row["id"], row["name"], row["email"]))
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, chunk_size: int = CHUNK_SIZE):
+    """
+    Кодирует строки в NDJSON (по объекту на строку), отдавая текст фрагментами.
+    """
+    parts = []
+    size = 0
+    for row in rows:
+        line = json.dumps(
+            {"id": row["id"], "name": row["name"], "email": row["email"]}, ensure_ascii=False
+        )
+        parts.append(line)
+        size += len(line) + 1
+        if size >= chunk_size:
+            yield "\n".join(parts) + "\n"
+            parts = []
+            size = 0
+    if parts:
+        yield "\n".join(parts) + "\n"
+
+
+def export_csv(use_copy: bool = False):
+    """
+    Генератор CSV-выгрузки: через серверный курсор или через COPY TO STDOUT.
+    """
+    if use_copy:
+        return db.copy_contacts_out(CHUNK_SIZE)
+    return iter_csv(db.iter_contacts())
+
+
+def export_ndjson():
+    """
+    Генератор NDJSON-выгрузки через серверный курсор.
+    """
+    return iter_ndjson(db.iter_contacts())
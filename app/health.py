@@ -0,0 +1,102 @@
+"""
+Проверки для проб Kubernetes и HEALTHCHECK Docker.
+
+/healthz (liveness) отвечает, пока процесс способен обрабатывать запросы,
+и не обращается к БД: недоступная БД не повод перезапускать под.
+
+/readyz (readiness) проверяет БД запросом SELECT 1 и загрузку пула соединений.
+Результат кэшируется на READY_CHECK_INTERVAL секунд, и одновременно
+выполняется не больше одной проверки на процесс, так что частые пробы
+от нескольких источников не нагружают PostgreSQL.
+"""
+import os
+import threading
+import time
+
+import psycopg2
+
+from app import db
+
+# Не чаще одного SELECT 1 за столько секунд на процесс
+READY_CHECK_INTERVAL = float(os.getenv("READY_CHECK_INTERVAL", "2"))
+# Под не готов, если соединения пула ждут больше запросов, чем это число
+# (по умолчанию — больше, чем соединений в пуле)
+READY_MAX_POOL_WAITING = os.getenv("READY_MAX_POOL_WAITING")
+
+
+class ReadinessCheck:
+    """
+    Кэшируемая проверка готовности: БД отвечает и пул не перегружен.
+    """
+
+    def __init__(self, interval: float = READY_CHECK_INTERVAL, max_waiting: int = None):
+        self.interval = interval
+        self.max_waiting = max_waiting
+        self._lock = threading.Lock()
+        self._database = None
+        self._checked_at = None
+
+    def pool_status(self):
+        """
+        Состояние пула или None, если пул не используется.
+        """
+        stats = db.pool_stats()
+        if stats is None:
+            return None
+        limit = self.max_waiting if self.max_waiting is not None else stats["maxconn"]
+        return {
+            "ok": stats["waiting"] <= limit,
+            "in_use": stats["in_use"],
+            "maxconn": stats["maxconn"],
+            "waiting": stats["waiting"],
+        }
+
+    def database_status(self):
+        """
+        Результат последнего SELECT 1, при необходимости обновлённый.
+
+        Пока один поток выполняет проверку, остальные получают прошлый результат.
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.interval:
+            if self._lock.acquire(blocking=self._database is None):
+                try:
+                    if self._checked_at is None or time.monotonic() - self._checked_at >= self.interval:
+                        self._database = self._ping()
+                        self._checked_at = time.monotonic()
+                finally:
+                    self._lock.release()
+        status = dict(self._database)
+        status["age"] = round(time.monotonic() - self._checked_at, 3)
+        return status
+
+    def _ping(self):
+        started = time.perf_counter()
+        try:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                    cur.fetchone()
+                conn.rollback()
+        except psycopg2.Error as e:
+            return {"ok": False, "error": str(e).strip()}
+        return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def status(self):
+        """
+        Возвращает (готов ли процесс, подробности для ответа /readyz).
+        """
+        checks = {}
+        pool = self.pool_status()
+        if pool is not None:
+            checks["pool"] = pool
+        # Перегруженный пул не проверяем запросом: он встал бы в ту же очередь
+        if pool is None or pool["ok"]:
+            checks["database"] = self.database_status()
+        ready = all(check["ok"] for check in checks.values()) and "database" in checks
+        return ready, {"status": "ready" if ready else "unavailable", "checks": checks}
+
+
+readiness = ReadinessCheck(
+    max_waiting=int(READY_MAX_POOL_WAITING) if READY_MAX_POOL_WAITING else None,
+)
@@ -0,0 +1,181 @@
+"""
+Потоковый импорт контактов из CSV/NDJSON через COPY.
+
+Использование из командной строки:
+    python -m app.importer contacts.csv
+    python -m app.importer --format ndjson contacts.ndjson
+    cat contacts.csv | python -m app.importer -
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+import time
+
+from app import db
+from app.validation import validate_email
+
+FORMATS = ("csv", "ndjson")
+# Сколько причин отказа сохранять в отчёте
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportStats:
+    """
+    Счётчики импорта: прочитанные, загруженные и отклонённые строки, время.
+
+    read — корректные строки файла, imported — сколько контактов реально
+    добавлено или изменено (повторы и совпадающие с базой строки не входят).
+    """
+
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    def reject(self, line_no: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": reason})
+
+    def finish(self, imported: int):
+        self.imported = imported
+        self.seconds = time.monotonic() - self.started
+
+    def as_dict(self):
+        seconds = self.seconds or 1e-9
+        return {
+            "read": self.read,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "seconds": round(self.seconds, 3),
+            "imported_per_sec": round(self.imported / seconds, 1),
+            "rejected_per_sec": round(self.rejected / seconds, 1),
+            "errors": self.errors,
+        }
+
+
+def detect_format(filename: str = None, content_type: str = None) -> str:
+    """
+    Определяет формат по имени файла или Content-Type (по умолчанию CSV).
+    """
+    if content_type and "ndjson" in content_type:
+        return "ndjson"
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def _iter_text_lines(stream, encoding="utf-8-sig"):
+    """
+    Лениво декодирует бинарный поток в строки текста.
+    """
+    if isinstance(stream, io.TextIOBase):
+        yield from stream
+        return
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    tail = ""
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        tail += decoder.decode(chunk)
+        # Последняя строка может быть не дочитана — оставляем её до следующего блока
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def parse_csv(lines):
+    """
+    Разбирает CSV с заголовком name,email. Возвращает пары (номер строки, запись).
+    """
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def parse_ndjson(lines):
+    """
+    Разбирает NDJSON: по одному JSON-объекту на строку.
+    """
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+            continue
+        yield line_no, record
+
+
+def validate_records(records, stats: ImportStats):
+    """
+    Пропускает только корректные записи, отклонённые учитывает в stats.
+    """
+    for line_no, record in records:
+        if not isinstance(record, dict):
+            stats.reject(line_no, f"Некорректная запись: {record}")
+            continue
+        name = str(record.get("name") or "").strip()
+        email = str(record.get("email") or "").strip()
+        if not name or not email:
+            stats.reject(line_no, "Имя и email обязательны для заполнения")
+            continue
+        if not validate_email(email):
+            stats.reject(line_no, f"Некорректный формат email адреса: {email}")
+            continue
+        stats.read += 1
+        yield name, email
+
+
+def import_stream(stream, fmt: str = "csv") -> dict:
+    """
+    Импортирует контакты из потока в постоянной памяти.
+
+    Args:
+        stream: Бинарный или текстовый файлоподобный объект
+        fmt: Формат данных: csv или ndjson
+
+    Returns:
+        Отчёт: read, imported, rejected, seconds, imported_per_sec, rejected_per_sec, errors
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    stats = ImportStats()
+    lines = _iter_text_lines(stream)
+    records = parse_csv(lines) if fmt == "csv" else parse_ndjson(lines)
+    imported = db.copy_contacts(validate_records(records, stats))
+    stats.finish(imported)
+    return stats.as_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовый импорт контактов через COPY")
+    parser.add_argument("path", help="Путь к файлу или '-' для stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Формат файла (по умолчанию по расширению)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+    if args.path == "-":
+        report = import_stream(sys.stdin.buffer, fmt)
+    else:
+        with open(args.path, "rb") as f:
+            report = import_stream(f, fmt)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,346 @@
 """
 Модуль для настройки логирования приложения.
+
+Формат строк — LOG_FORMAT: text (по умолчанию) или json (одна JSON-запись
+на строку для Loki/promtail). К каждой записи, сделанной во время запроса,
+добавляется его идентификатор (см. set_request_id), так что выборочно
+записанные строки можно связать с остальными строками запроса.
+
+Частые сообщения можно прореживать правилами LOG_SAMPLING, см. SamplingFilter.
 """
+import atexit
+import contextvars
+import json
 import logging
 import os
+import queue
+import re
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Идентификатор текущего запроса (заголовок X-Request-ID или сгенерированный)
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def set_request_id(request_id):
+    """
+    Задаёт идентификатор запроса для записей текущего контекста (None — сбросить).
+    """
+    _request_id.set(request_id)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def accept_request_id(header_value: str = None) -> str:
+    """
+    Идентификатор запроса из заголовка клиента или прокси, если он похож
+    на идентификатор (не длиннее 128 символов, без пробелов и кавычек), иначе новый.
+    """
+    if header_value and _REQUEST_ID_RE.match(header_value):
+        return header_value
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Добавляет к записи атрибут request_id из контекста, в котором она создана.
+
+    Стоит на обработчике верхнего уровня: в режиме очереди запись форматирует
+    фоновый поток, где контекста запроса уже нет.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+_SAMPLING_RULE_RE = re.compile(r"^\s*(?P<key>[^=\s]+)\s*=\s*(?P<count>\d+)\s*/\s*(?P<unit>\d+|s)\s*$")
+
+
+def parse_sampling_rules(text: str) -> dict:
+    """
+    Разбирает правила LOG_SAMPLING: "ключ=1/N" (одна запись из N) или
+    "ключ=K/s" (не больше K записей в секунду), через запятую.
+
+    Returns:
+        Словарь ключ -> ("every", N) или ("per_second", K)
+
+    Raises:
+        ValueError: правило записано неверно
+    """
+    rules = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        match = _SAMPLING_RULE_RE.match(item)
+        if match is None:
+            raise ValueError(f"Неверное правило LOG_SAMPLING: {item.strip()!r} (ожидается ключ=1/N или ключ=K/s)")
+        count = int(match["count"])
+        if match["unit"] == "s":
+            rules[match["key"]] = ("per_second", count)
+        elif count == 1 and int(match["unit"]) >= 1:
+            rules[match["key"]] = ("every", int(match["unit"]))
+        else:
+            raise ValueError(f"Неверное правило LOG_SAMPLING: {item.strip()!r} (для доли — только 1/N)")
+    return rules
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживает частые сообщения по ключу.
+
+    Ключ записи — атрибут log_key (logger.info(..., extra={"log_key": "contacts.loaded"}))
+    или, если его нет, шаблон сообщения. Правило "*" действует на все ключи без
+    своего правила. Записи уровня ERROR и выше не прореживаются никогда.
+
+    Первая запись после пропущенных получает атрибут suppressed — сколько
+    записей с тем же ключом было пропущено перед ней.
+
+    Args:
+        rules: Словарь из parse_sampling_rules
+        clock: Источник времени (для тестов)
+    """
+
+    def __init__(self, rules: dict = None, clock=time.monotonic):
+        super().__init__()
+        self.rules = dict(rules or {})
+        self.clock = clock
+        self._lock = threading.Lock()
+        # ключ -> [записано/начало окна, записей в окне, пропущено]
+        self._state = {}
+
+    def filter(self, record):
+        # Один фильтр стоит на нескольких обработчиках: решение принимается один раз
+        decision = getattr(record, "_sampling_decision", None)
+        if decision is not None:
+            return decision
+        record._sampling_decision = decision = self._decide(record)
+        return decision
+
+    def _decide(self, record) -> bool:
+        if record.levelno >= logging.ERROR or not self.rules:
+            return True
+        key = getattr(record, "log_key", None) or record.msg
+        rule = self.rules.get(key) or self.rules.get("*")
+        if rule is None:
+            return True
+        kind, limit = rule
+        with self._lock:
+            state = self._state.setdefault(key, [0.0, 0, 0])
+            if kind == "every":
+                state[1] += 1
+                passed = state[1] % limit == 1 or limit == 1
+            else:
+                now = self.clock()
+                if now - state[0] >= 1.0:
+                    state[0], state[1] = now, 0
+                state[1] += 1
+                passed = state[1] <= limit
+            if not passed:
+                state[2] += 1
+                return False
+            suppressed, state[2] = state[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Текстовый формат; идентификатор запроса и число пропущенных записей — в конце строки.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        suppressed = getattr(record, "suppressed", 0)
+        if request_id:
+            line += f" [request_id={request_id}]"
+        if suppressed:
+            line += f" [пропущено похожих: {suppressed}]"
+        return line
 
 
-def setup_logger(name: str = "web_app", log_file: str = "app.log", level: int = logging.INFO):
+class JsonFormatter(logging.Formatter):
+    """
+    Одна JSON-запись на строку: time, level, logger, message, pid и, если есть,
+    request_id, log_key, suppressed и exception.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for field in ("request_id", "log_key", "suppressed"):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+LOG_FORMATS = ("text", "json")
+
+
+def _make_formatter(log_format: str) -> logging.Formatter:
+    if log_format == "json":
+        return JsonFormatter()
+    if log_format != "text":
+        raise ValueError(f"LOG_FORMAT должен быть одним из {', '.join(LOG_FORMATS)}: {log_format!r}")
+    # Формат логов: время, уровень, сообщение
+    return TextFormatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Кладёт записи в ограниченную очередь, не блокируя поток запроса.
+
+    Политики при переполнении очереди:
+    - drop: запись отбрасывается и учитывается в счётчике dropped;
+    - block: поток ждёт освобождения места не дольше block_timeout секунд.
+    Записи уровня ERROR и выше всегда ждут места, а не отбрасываются сразу.
+    О потерянных записях сообщается предупреждением при следующей успешной записи.
+    """
+
+    def __init__(self, log_queue, policy: str = "drop", block_timeout: float = 1.0):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._unreported = 0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Очередь внутри процесса: форматирование сообщения откладываем до потока-слушателя
+        return record
+
+    def enqueue(self, record):
+        block = self.policy == "block" or record.levelno >= logging.ERROR
+        try:
+            if block:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+                self._unreported += 1
+            return
+        if self._unreported:
+            self._report_drops(record.name)
+
+    def _report_drops(self, logger_name):
+        with self._drop_lock:
+            count, self._unreported = self._unreported, 0
+        if not count:
+            return
+        warning = logging.LogRecord(
+            logger_name, logging.WARNING, __file__, 0,
+            "Очередь логов переполнена, отброшено записей: %d", (count,), None,
+        )
+        try:
+            self.queue.put_nowait(warning)
+        except queue.Full:
+            with self._drop_lock:
+                self._unreported += count
+
+
+# Обработчики-очереди всех логгеров; у каждого свой поток-слушатель
+_queue_handlers = []
+
+
+def _start_listener(handler: BoundedQueueHandler, targets):
+    handler.listener = QueueListener(handler.queue, *targets, respect_handler_level=True)
+    handler.listener.start()
+
+
+def stop_log_listener():
+    """
+    Дописывает все записи из очередей и останавливает фоновые потоки логирования.
+
+    Вызывается при завершении процесса (atexit) и из хука worker_exit gunicorn.
+    """
+    for handler in _queue_handlers:
+        listener = getattr(handler, "listener", None)
+        handler.listener = None
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+
+
+# Фильтры прореживания всех логгеров (их блокировки сбрасываются после fork)
+_sampling_filters = []
+
+
+def _restart_listeners_after_fork():
+    # В дочернем процессе потоков-слушателей нет, а очередь могла остаться
+    # с захваченной блокировкой — создаём всё заново
+    for sampling_filter in _sampling_filters:
+        sampling_filter.reset_after_fork()
+    for handler in _queue_handlers:
+        listener = getattr(handler, "listener", None)
+        if listener is None:
+            continue
+        handler.queue = queue.Queue(maxsize=handler.queue.maxsize)
+        handler._drop_lock = threading.Lock()
+        _start_listener(handler, listener.handlers)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+atexit.register(stop_log_listener)
+
+
+def _queue_enabled() -> bool:
+    return os.getenv("LOG_QUEUE", "0").lower() in ("1", "true", "yes")
+
+
+def setup_logger(name: str = "web_app", log_file: str = "app.log", level: int = logging.INFO,
+                 use_queue: bool = None, log_format: str = None, sampling: str = None):
     """
     Настраивает и возвращает логгер с ротацией файлов.
 
+    В режиме очереди (use_queue или LOG_QUEUE=1) логгер только кладёт записи
+    в ограниченную очередь, а запись в файл и консоль выполняет фоновый поток.
+    Размер очереди и политика переполнения задаются через LOG_QUEUE_SIZE
+    и LOG_QUEUE_POLICY (drop или block).
+
     Args:
         name: Имя логгера
         log_file: Путь к файлу логов
         level: Уровень логирования
+        use_queue: Включить режим очереди (по умолчанию — из LOG_QUEUE)
+        log_format: text или json (по умолчанию — из LOG_FORMAT)
+        sampling: Правила прореживания (по умолчанию — из LOG_SAMPLING)
 
     Returns:
         Настроенный логгер
     """
+    if use_queue is None:
+        use_queue = _queue_enabled()
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
@@ -26,11 +348,10 @@ def setup_logger(name: str = "web_app", log_file: str = "app.log", level: int =
     if logger.handlers:
         return logger
 
-    # Формат логов: время, уровень, сообщение
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    formatter = _make_formatter((log_format or os.getenv("LOG_FORMAT", "text")).lower())
+    sampling_filter = SamplingFilter(parse_sampling_rules(
+        sampling if sampling is not None else os.getenv("LOG_SAMPLING", "")
+    ))
 
     # Проверка и создание файла логов, если нужно
     log_dir = os.path.dirname(log_file) if os.path.dirname(log_file) else "."
@@ -74,6 +395,26 @@ def setup_logger(name: str = "web_app", log_file: str = "app.log", level: int =
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
 
+    if use_queue:
+        targets = list(logger.handlers)
+        for handler in targets:
+            logger.removeHandler(handler)
+        queue_handler = BoundedQueueHandler(
+            queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))),
+            policy=os.getenv("LOG_QUEUE_POLICY", "drop"),
+        )
+        logger.addHandler(queue_handler)
+        _queue_handlers.append(queue_handler)
+        _start_listener(queue_handler, targets)
+
+    # Фильтры стоят на обработчиках верхнего уровня: они видят и записи дочерних
+    # логгеров (web_app.db), и в режиме очереди работают в потоке, создавшем запись
+    request_id_filter = RequestIdFilter()
+    for handler in logger.handlers:
+        handler.addFilter(request_id_filter)
+        handler.addFilter(sampling_filter)
+    _sampling_filters.append(sampling_filter)
+
     return logger
 
 
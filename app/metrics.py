@@ -0,0 +1,194 @@
+"""
+Метрики Prometheus приложения и поддержка многопроцессного режима gunicorn.
+
+Если задана переменная PROMETHEUS_MULTIPROC_DIR (до запуска процесса),
+prometheus_client пишет значения каждого воркера в файлы этого каталога,
+а /metrics собирает их со всех воркеров, а не только с ответившего.
+Очистку каталога и файлов завершившихся воркеров выполняют хуки
+в config/gunicorn/gunicorn.conf.py.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Значение метки path для запросов, не совпавших ни с одним маршрутом
+UNMATCHED_PATH = "<unmatched>"
+
+http_requests_total = Counter(
+    'http_requests_total',
+    'Total number of HTTP requests',
+    ['method', 'path', 'status']
+)
+
+http_request_duration_seconds = Histogram(
+    'http_request_duration_seconds',
+    'Duration of HTTP requests in seconds',
+    ['method', 'path'],
+    buckets=[0.01, 0.05, 0.1, 0.5, 1, 2, 5]
+)
+
+http_response_time_seconds = Gauge(
+    'http_response_time_seconds',
+    'Last HTTP response time in seconds',
+    ['method', 'path'],
+    multiprocess_mode='mostrecent'
+)
+
+db_pool_connections = Gauge(
+    'db_pool_connections',
+    'Number of pooled PostgreSQL connections by state',
+    ['state'],
+    multiprocess_mode='livesum'
+)
+
+db_pool_wait_seconds_total = Gauge(
+    'db_pool_wait_seconds_total',
+    'Total time spent waiting for a pooled connection',
+    multiprocess_mode='livesum'
+)
+
+db_reads_total = Counter(
+    'db_reads_total',
+    'Read operations by server that served them (primary, replica)',
+    ['target']
+)
+
+db_replica_up = Gauge(
+    'db_replica_up',
+    'Whether a read replica passed its last health check',
+    ['replica'],
+    multiprocess_mode='min'
+)
+
+db_replica_lag_seconds = Gauge(
+    'db_replica_lag_seconds',
+    'Replication lag of a read replica at its last health check',
+    ['replica'],
+    multiprocess_mode='max'
+)
+
+db_operation_duration_seconds = Histogram(
+    'db_operation_duration_seconds',
+    'Time spent in app.db operations by phase (connect, execute, fetch)',
+    ['operation', 'phase'],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+)
+
+db_rows_returned_total = Counter(
+    'db_rows_returned_total',
+    'Number of rows fetched from PostgreSQL by app.db operation',
+    ['operation']
+)
+
+write_behind_queue_depth = Gauge(
+    'write_behind_queue_depth',
+    'Contacts waiting in the write-behind queue',
+    multiprocess_mode='livesum'
+)
+
+write_behind_batch_size = Histogram(
+    'write_behind_batch_size',
+    'Number of contacts committed by one write-behind group commit',
+    buckets=[1, 2, 5, 10, 20, 50, 100, 200, 500]
+)
+
+write_behind_flush_seconds = Histogram(
+    'write_behind_flush_seconds',
+    'Write-behind group commit duration by stage (commit, enqueue_to_commit)',
+    ['stage'],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+)
+
+admission_in_flight = Gauge(
+    'admission_in_flight',
+    'Requests admitted and being processed',
+    multiprocess_mode='livesum'
+)
+
+admission_limit = Gauge(
+    'admission_limit',
+    'Current in-flight request limit (sum over workers)',
+    multiprocess_mode='livesum'
+)
+
+admission_rejected_total = Counter(
+    'admission_rejected_total',
+    'Requests rejected by admission control by reason (queue_full, queue_timeout, rate_limited, sse_streams)',
+    ['reason']
+)
+
+admission_queue_seconds = Histogram(
+    'admission_queue_seconds',
+    'Time a request waited for an in-flight slot',
+    buckets=[0, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+)
+
+
+def multiprocess_dir():
+    """
+    Каталог многопроцессного режима или None, если режим выключен.
+    """
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def route_label(url_rule) -> str:
+    """
+    Метка path по шаблону маршрута (/edit/<int:contact_id>), а не по фактическому пути.
+
+    Так число временных рядов ограничено числом маршрутов приложения.
+    """
+    return url_rule.rule if url_rule is not None else UNMATCHED_PATH
+
+
+def observe_request(method: str, url_rule, status: int, duration: float):
+    path = route_label(url_rule)
+    http_requests_total.labels(method=method, path=path, status=str(status)).inc()
+    http_request_duration_seconds.labels(method=method, path=path).observe(duration)
+    http_response_time_seconds.labels(method=method, path=path).set(duration)
+
+
+def observe_db_operation(operation: str, phases: dict, rows: int):
+    for phase, seconds in phases.items():
+        db_operation_duration_seconds.labels(operation=operation, phase=phase).observe(seconds)
+    if rows:
+        db_rows_returned_total.labels(operation=operation).inc(rows)
+
+
+def observe_write_behind_flush(batch_size: int, commit_seconds: float, oldest_wait_seconds: float):
+    write_behind_batch_size.observe(batch_size)
+    write_behind_flush_seconds.labels(stage='commit').observe(commit_seconds)
+    # Сколько ждал самый ранний контакт группы от постановки в очередь до коммита
+    write_behind_flush_seconds.labels(stage='enqueue_to_commit').observe(oldest_wait_seconds)
+
+
+def update_pool_metrics(stats):
+    if stats is None:
+        return
+    for state in ('in_use', 'idle', 'waiting'):
+        db_pool_connections.labels(state=state).set(stats[state])
+    db_pool_wait_seconds_total.set(stats['wait_time_total'])
+
+
+def update_replica_metrics(replica):
+    db_replica_up.labels(replica=replica.name).set(1 if replica.healthy else 0)
+    if replica.lag is not None:
+        db_replica_lag_seconds.labels(replica=replica.name).set(replica.lag)
+
+
+def render_latest():
+    """
+    Возвращает (тело, content-type) для ответа /metrics.
+    """
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
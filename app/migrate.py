@@ -0,0 +1,294 @@
+"""
+Версионированные миграции схемы БД.
+
+Миграции — файлы app/migrations/NNNN_описание.sql, применяются по порядку
+номеров и записываются в таблицу schema_migrations. Одновременно мигрирует
+только один процесс: остальные ждут advisory lock, опрашивая его через
+pg_try_advisory_lock вне транзакции. Ждать в pg_advisory_lock нельзя: пока
+команда ждёт, у процесса открыт снимок, и CREATE INDEX CONCURRENTLY
+у владельца блокировки ждал бы его — взаимная блокировка.
+
+Если первая строка файла — "-- migrate:no-transaction", команды выполняются
+по одной вне транзакции (нужно для CREATE INDEX CONCURRENTLY). В таких файлах
+каждая команда должна заканчиваться ";" в конце строки.
+
+Строка "-- migrate:requires-extension ИМЯ" в начале файла делает миграцию
+необязательной: если расширения нет среди pg_available_extensions, миграция
+пропускается (не записывается в schema_migrations) и будет применена при
+следующем запуске, когда расширение установят. Приложение в это время
+работает без неё (см. db.search_contacts).
+
+Использование:
+    python -m app.migrate            # применить новые миграции
+    python -m app.migrate --status   # показать применённые и ожидающие
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+
+from app import db
+from app.logger import app_logger
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+REQUIRES_EXTENSION_MARKER = "-- migrate:requires-extension"
+# Ключ advisory lock, общий для всех процессов приложения
+LOCK_KEY = 734_002_611
+# Как часто ждущий процесс пробует взять блокировку
+LOCK_POLL_SECONDS = 0.5
+
+_FILE_PATTERN = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+
+
+class Migration:
+    def __init__(self, version: str, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.sql = f.read()
+        self.required_extension = None
+        checksum_lines = []
+        for line in self.sql.splitlines(keepends=True):
+            if line.startswith(REQUIRES_EXTENSION_MARKER):
+                self.required_extension = line[len(REQUIRES_EXTENSION_MARKER):].strip()
+            else:
+                checksum_lines.append(line)
+        # Директива requires-extension не входит в контрольную сумму: её можно
+        # добавить к уже применённой миграции без предупреждения об изменении
+        self.checksum = hashlib.sha256("".join(checksum_lines).encode("utf-8")).hexdigest()
+        self.transactional = not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self):
+        """
+        Команды файла по одной (для миграций вне транзакции).
+        """
+        statements, current = [], []
+        for line in self.sql.splitlines():
+            if line.strip().startswith("--") and not current:
+                continue
+            current.append(line)
+            if line.rstrip().endswith(";"):
+                statements.append("\n".join(current).strip())
+                current = []
+        if "".join(current).strip():
+            statements.append("\n".join(current).strip())
+        return statements
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR):
+    """
+    Возвращает миграции из каталога, отсортированные по версии.
+    """
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILE_PATTERN.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Повторяющиеся номера миграций в {directory}")
+    return migrations
+
+
+def _ensure_schema_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """
+    )
+
+
+def _applied_versions(cur):
+    cur.execute("SELECT version, checksum FROM schema_migrations ORDER BY version;")
+    return {row["version"]: row["checksum"] for row in cur.fetchall()}
+
+
+def _available_extensions(cur):
+    cur.execute("SELECT name FROM pg_available_extensions;")
+    return {row["name"] for row in cur.fetchall()}
+
+
+def _skipped(migration: Migration, extensions) -> bool:
+    return migration.required_extension is not None and migration.required_extension not in extensions
+
+
+def _apply(conn, migration: Migration):
+    with conn.cursor() as cur:
+        if migration.transactional:
+            cur.execute("BEGIN;")
+            try:
+                cur.execute(migration.sql)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s);",
+                    (migration.version, migration.name, migration.checksum),
+                )
+                cur.execute("COMMIT;")
+            except Exception:
+                cur.execute("ROLLBACK;")
+                raise
+        else:
+            for statement in migration.statements():
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s);",
+                (migration.version, migration.name, migration.checksum),
+            )
+
+
+def _acquire_lock(conn, timeout: float):
+    # Каждая попытка — отдельная короткая команда в autocommit: между попытками
+    # у соединения нет снимка, который задержал бы CREATE INDEX CONCURRENTLY
+    deadline = time.monotonic() + timeout
+    waiting_logged = False
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (LOCK_KEY,))
+            if cur.fetchone()["locked"]:
+                return
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Не дождались блокировки миграций за {timeout:.0f} с")
+        if not waiting_logged:
+            app_logger.info("Миграции выполняет другой процесс, ожидание")
+            waiting_logged = True
+        time.sleep(LOCK_POLL_SECONDS)
+
+
+def run_migrations(directory: str = MIGRATIONS_DIR):
+    """
+    Применяет все ещё не применённые миграции.
+
+    Сколько ждать процесса, который мигрирует сейчас, задаёт MIGRATION_LOCK_TIMEOUT
+    (секунды, по умолчанию 600). Список применённых миграций читается уже под
+    блокировкой, поэтому применённое другим процессом повторно не выполняется.
+
+    Returns:
+        Список применённых версий
+    """
+    migrations = load_migrations(directory)
+    conn = db._connect()
+    # autocommit: advisory lock сессионный, а транзакциями управляем сами
+    conn.autocommit = True
+    applied_now = []
+    try:
+        _acquire_lock(conn, float(os.getenv("MIGRATION_LOCK_TIMEOUT", "600")))
+        try:
+            with conn.cursor() as cur:
+                _ensure_schema_table(cur)
+                applied = _applied_versions(cur)
+                extensions = _available_extensions(cur)
+            for migration in migrations:
+                if migration.version in applied:
+                    if applied[migration.version] != migration.checksum:
+                        app_logger.warning(
+                            "Миграция %s_%s изменена после применения", migration.version, migration.name
+                        )
+                    continue
+                if _skipped(migration, extensions):
+                    app_logger.warning(
+                        "Миграция %s_%s пропущена: на сервере нет расширения %s",
+                        migration.version, migration.name, migration.required_extension,
+                    )
+                    continue
+                app_logger.info("Применяется миграция %s_%s", migration.version, migration.name)
+                _apply(conn, migration)
+                applied_now.append(migration.version)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (LOCK_KEY,))
+    finally:
+        conn.close()
+    db.contacts_cache.invalidate()
+    return applied_now
+
+
+def migration_status(directory: str = MIGRATIONS_DIR):
+    """
+    Возвращает список (версия, имя, состояние): applied, pending или
+    skipped (нужное расширение не установлено на сервере).
+    """
+    migrations = load_migrations(directory)
+    conn = db._connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            _ensure_schema_table(cur)
+            applied = _applied_versions(cur)
+            extensions = _available_extensions(cur)
+    finally:
+        conn.close()
+    status = []
+    for m in migrations:
+        if m.version in applied:
+            state = "applied"
+        elif _skipped(m, extensions):
+            state = "skipped"
+        else:
+            state = "pending"
+        status.append((m.version, m.name, state))
+    return status
+
+
+class SchemaOutdatedError(RuntimeError):
+    """
+    Схема БД старее кода: есть неприменённые миграции.
+    """
+
+
+def check_schema(directory: str = MIGRATIONS_DIR):
+    """
+    Проверяет, что все миграции применены, ничего не меняя в БД.
+
+    Для клиентов, которые не должны выполнять DDL (настольное приложение):
+    миграции применяются при развёртывании командой python -m app.migrate.
+
+    Raises:
+        SchemaOutdatedError: есть неприменённые миграции
+    """
+    migrations = load_migrations(directory)
+    conn = db._connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present;")
+            applied = _applied_versions(cur) if cur.fetchone()["present"] else {}
+            extensions = _available_extensions(cur)
+    finally:
+        conn.close()
+    pending = [
+        f"{m.version}_{m.name}" for m in migrations
+        if m.version not in applied and not _skipped(m, extensions)
+    ]
+    if pending:
+        raise SchemaOutdatedError(
+            f"Схема БД не обновлена, не применены миграции: {', '.join(pending)}. "
+            "Выполните python -m app.migrate."
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("--status", action="store_true", help="Показать состояние миграций")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        labels = {"applied": "применена", "pending": "ожидает", "skipped": "пропущена (нет расширения)"}
+        for version, name, state in migration_status():
+            print(f"{version}_{name}: {labels[state]}")
+        return 0
+
+    applied = run_migrations()
+    print(f"Применено миграций: {len(applied)}" + (f" ({', '.join(applied)})" if applied else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+-- Таблица контактов (раньше создавалась init_db при первом запросе)
+CREATE TABLE IF NOT EXISTS contacts (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL
+);
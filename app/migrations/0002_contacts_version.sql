@@ -0,0 +1,19 @@
+-- Счётчик версии данных contacts для ETag в JSON API.
+-- Увеличивается триггером на каждую изменяющую команду.
+CREATE TABLE IF NOT EXISTS contacts_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO contacts_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_contacts_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE contacts_version SET version = version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS contacts_version_bump ON contacts;
+CREATE TRIGGER contacts_version_bump
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON contacts
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_contacts_version();
@@ -0,0 +1,8 @@
+-- migrate:no-transaction
+-- Индексы для фильтров "имя/email начинается с" в list_contacts.
+-- CONCURRENTLY не блокирует запись в contacts, но не работает внутри транзакции.
+-- DROP перед CREATE убирает невалидный индекс, оставшийся от прерванной попытки.
+DROP INDEX CONCURRENTLY IF EXISTS contacts_name_prefix_idx;
+CREATE INDEX CONCURRENTLY contacts_name_prefix_idx ON contacts (lower(name) text_pattern_ops);
+DROP INDEX CONCURRENTLY IF EXISTS contacts_email_prefix_idx;
+CREATE INDEX CONCURRENTLY contacts_email_prefix_idx ON contacts (lower(email) text_pattern_ops);
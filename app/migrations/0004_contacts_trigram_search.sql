@@ -0,0 +1,9 @@
+-- migrate:no-transaction
+-- migrate:requires-extension pg_trgm
+-- Триграммные GIN-индексы для поиска по подстроке и нечёткого поиска (search_contacts).
+-- pg_trgm — доверенное расширение: владелец БД может создать его без суперпользователя.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DROP INDEX CONCURRENTLY IF EXISTS contacts_name_trgm_idx;
+CREATE INDEX CONCURRENTLY contacts_name_trgm_idx ON contacts USING gin (lower(name) gin_trgm_ops);
+DROP INDEX CONCURRENTLY IF EXISTS contacts_email_trgm_idx;
+CREATE INDEX CONCURRENTLY contacts_email_trgm_idx ON contacts USING gin (lower(email) gin_trgm_ops);
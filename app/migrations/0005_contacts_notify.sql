@@ -0,0 +1,48 @@
+-- Уведомления об изменениях contacts через NOTIFY (канал contacts_changes).
+-- Одно уведомление на команду: {"op": "insert|update|delete", "ids": [...]}.
+-- Если затронуто больше 100 строк или выполнен TRUNCATE — {"op": "reload"}:
+-- клиенту дешевле перечитать страницу, чем применять тысячи изменений.
+CREATE OR REPLACE FUNCTION notify_contacts_changes() RETURNS trigger AS $$
+DECLARE
+    changed_ids INTEGER[];
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('contacts_changes', '{"op": "reload"}');
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id ORDER BY id) INTO changed_ids FROM (SELECT id FROM old_rows LIMIT 101) AS changed;
+    ELSE
+        SELECT array_agg(id ORDER BY id) INTO changed_ids FROM (SELECT id FROM new_rows LIMIT 101) AS changed;
+    END IF;
+    IF changed_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+    IF array_length(changed_ids, 1) > 100 THEN
+        PERFORM pg_notify('contacts_changes', '{"op": "reload"}');
+    ELSE
+        PERFORM pg_notify('contacts_changes', json_build_object('op', lower(TG_OP), 'ids', changed_ids)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS contacts_notify_insert ON contacts;
+CREATE TRIGGER contacts_notify_insert
+    AFTER INSERT ON contacts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_contacts_changes();
+
+DROP TRIGGER IF EXISTS contacts_notify_update ON contacts;
+CREATE TRIGGER contacts_notify_update
+    AFTER UPDATE ON contacts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_contacts_changes();
+
+DROP TRIGGER IF EXISTS contacts_notify_delete ON contacts;
+CREATE TRIGGER contacts_notify_delete
+    AFTER DELETE ON contacts REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_contacts_changes();
+
+DROP TRIGGER IF EXISTS contacts_notify_truncate ON contacts;
+CREATE TRIGGER contacts_notify_truncate
+    AFTER TRUNCATE ON contacts
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_contacts_changes();
@@ -0,0 +1,26 @@
+-- migrate:no-transaction
+-- Уникальность контактов по нормализованному email: lower(btrim(email)).
+-- Перед созданием индекса сливаются уже существующие дубли — по тому же
+-- правилу, что и python -m app.dedup (на больших таблицах лучше запустить его
+-- заранее, тогда эти команды ничего не изменят): остаётся строка с наименьшим
+-- id, ей достаются имя и email самой новой строки группы.
+-- Индекс от прерванного запуска удаляем сначала: даже недействительный
+-- уникальный индекс проверяется при изменениях и помешал бы слиянию.
+DROP INDEX CONCURRENTLY IF EXISTS contacts_email_unique_idx;
+UPDATE contacts AS c
+SET name = latest.name, email = latest.email
+FROM (
+    SELECT lower(btrim(email)) AS email_key, min(id) AS keep_id, max(id) AS latest_id
+    FROM contacts
+    GROUP BY lower(btrim(email))
+    HAVING count(*) > 1
+) AS groups
+JOIN contacts AS latest ON latest.id = groups.latest_id
+WHERE c.id = groups.keep_id;
+DELETE FROM contacts AS c
+USING (
+    SELECT id, row_number() OVER (PARTITION BY lower(btrim(email)) ORDER BY id) AS position
+    FROM contacts
+) AS ranked
+WHERE c.id = ranked.id AND ranked.position > 1;
+CREATE UNIQUE INDEX CONCURRENTLY contacts_email_unique_idx ON contacts (lower(btrim(email)));
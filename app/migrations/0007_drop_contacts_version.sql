@@ -0,0 +1,7 @@
+-- Удаление счётчика версии contacts (миграция 0002).
+-- Триггер обновлял одну общую строку на каждую изменяющую команду, и все
+-- пишущие транзакции ждали блокировку этой строки до своего коммита.
+-- ETag списка в JSON API теперь считается по содержимому страницы.
+DROP TRIGGER IF EXISTS contacts_version_bump ON contacts;
+DROP FUNCTION IF EXISTS bump_contacts_version();
+DROP TABLE IF EXISTS contacts_version;
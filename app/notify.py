@@ -0,0 +1,222 @@
+"""
+Живые уведомления об изменениях контактов через PostgreSQL LISTEN/NOTIFY.
+
+Триггеры из миграции 0005 отправляют в канал contacts_changes id изменённых
+строк. Один фоновый поток на процесс слушает канал на отдельном соединении
+(не из пула), дочитывает изменённые строки одним запросом и раздаёт события
+подписчикам: SSE-потокам веб-приложения или Tk-клиенту.
+
+Событие — словарь:
+    {"seq": 5, "op": "insert" | "update" | "delete" | "reload",
+     "ids": [...], "contacts": [...]}
+
+reload означает "перечитайте данные целиком": изменений слишком много,
+подписчик не успевал их забирать или соединение с БД прерывалось.
+"""
+import json
+import os
+import queue
+import select
+import threading
+
+import psycopg2
+
+from app import db
+from app.logger import app_logger
+
+CHANNEL = "contacts_changes"
+# Размер очереди одного подписчика; при переполнении он получит reload
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+# Как часто поток проверяет флаг остановки, секунды
+POLL_TIMEOUT = 1.0
+# Пауза перед переподключением растёт до этого предела, секунды
+MAX_RECONNECT_DELAY = 30.0
+
+_lock = threading.Lock()
+_listener = None
+_listener_pid = None
+
+
+class Subscription:
+    """
+    Очередь событий одного подписчика.
+    """
+
+    def __init__(self, listener, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self._listener = listener
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout: float = None):
+        """
+        Следующее событие или None, если за timeout ничего не пришло.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """
+        Все накопившиеся события без ожидания.
+        """
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self._listener.unsubscribe(self)
+
+    def _offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Подписчик не успевает: вместо потерянных изменений — одно событие reload
+            self.drain()
+            self._queue.put_nowait({"seq": event["seq"], "op": "reload", "ids": [], "contacts": []})
+
+
+class ChangeListener:
+    """
+    Поток, слушающий канал CHANNEL и раздающий события подписчикам.
+    """
+
+    def __init__(self, connect=None):
+        self._connect = connect or db._connect
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._seq = 0
+        self._thread = threading.Thread(target=self._run, name="contacts-notify", daemon=True)
+        self._connected = threading.Event()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        """
+        Ждёт, пока выполнится LISTEN (нужно тестам и скриптам).
+        """
+        return self._connected.wait(timeout)
+
+    def subscribe(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE) -> Subscription:
+        subscription = Subscription(self, maxsize)
+        with self._subscribers_lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._subscribers_lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._subscribers_lock:
+            return len(self._subscribers)
+
+    def publish(self, op: str, ids=(), contacts=()):
+        """
+        Раздаёт событие всем подписчикам.
+        """
+        self._seq += 1
+        event = {"seq": self._seq, "op": op, "ids": list(ids), "contacts": list(contacts)}
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._offer(event)
+
+    def handle_payload(self, payload: str):
+        """
+        Разбирает полезную нагрузку NOTIFY и публикует событие.
+        """
+        try:
+            message = json.loads(payload)
+            op = message["op"]
+            ids = [int(i) for i in message.get("ids") or []]
+        except (ValueError, KeyError, TypeError):
+            app_logger.warning("Некорректное уведомление %s: %r", CHANNEL, payload)
+            return
+        contacts = []
+        if op in ("insert", "update") and ids:
+            # Одно чтение на команду, а не на каждого подписчика; с основного
+            # сервера — реплика могла ещё не получить эти строки
+            with db.primary_reads():
+                contacts = [dict(row) for row in db.get_contacts_by_ids(ids)]
+        self.publish(op, ids, contacts)
+
+    def _run(self):
+        delay = 1.0
+        first = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                self._connected.set()
+                if not first:
+                    # Пока соединения не было, изменения могли быть пропущены
+                    self.publish("reload")
+                first = False
+                delay = 1.0
+                self._listen(conn)
+            except psycopg2.Error as e:
+                self._connected.clear()
+                app_logger.warning("Соединение LISTEN %s прервано: %s; повтор через %.0f с", CHANNEL, e, delay)
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    self.handle_payload(notify.payload)
+                except psycopg2.Error as e:
+                    # Строки не дочитались — пусть клиенты перечитают данные сами
+                    app_logger.warning("Не удалось прочитать изменённые контакты: %s", e)
+                    self.publish("reload")
+
+
+def get_listener() -> ChangeListener:
+    """
+    Слушатель текущего процесса; запускается при первом обращении.
+
+    После fork поток родителя в дочернем процессе не существует,
+    поэтому воркер gunicorn запускает собственный слушатель.
+    """
+    global _listener, _listener_pid
+    pid = os.getpid()
+    with _lock:
+        if _listener is None or _listener_pid != pid:
+            _listener = ChangeListener()
+            _listener_pid = pid
+            _listener.start()
+        return _listener
+
+
+def subscribe(maxsize: int = SUBSCRIBER_QUEUE_SIZE) -> Subscription:
+    """
+    Подписывает на изменения контактов. Подписку нужно закрыть через close().
+    """
+    return get_listener().subscribe(maxsize)
+
+
+def stop_listener():
+    global _listener, _listener_pid
+    with _lock:
+        listener, _listener, _listener_pid = _listener, None, None
+    if listener is not None:
+        listener.stop()
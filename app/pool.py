@@ -0,0 +1,257 @@
+"""
+Пул соединений с PostgreSQL в пределах одного процесса.
+"""
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """
+    Не удалось получить соединение из пула за отведённое время.
+    """
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений.
+
+    Args:
+        connect: Функция без аргументов, открывающая новое соединение
+        minconn: Сколько простаивающих соединений держать открытыми
+        maxconn: Максимальное число соединений (занятых + свободных)
+        timeout: Сколько секунд ждать свободного соединения
+        max_age: Возраст соединения в секундах, после которого оно пересоздаётся
+        max_idle: Сколько секунд лишнее (сверх minconn) соединение может простаивать
+        ping_interval: После скольких секунд простоя проверять соединение через SELECT 1
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=5, timeout=5.0,
+                 max_age=1800.0, max_idle=600.0, ping_interval=30.0):
+        if maxconn < 1:
+            raise ValueError("maxconn должен быть >= 1")
+        self._connect = connect
+        self.minconn = max(0, min(minconn, maxconn))
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        # Свободные соединения: (conn, created_at, last_used)
+        self._idle = deque()
+        # Выданные соединения: id(conn) -> created_at
+        self._in_use = {}
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "connections_recycled": 0,
+            "failed_checks": 0,
+        }
+
+    def prefill(self):
+        """
+        Открывает соединения до minconn, чтобы первые запросы не ждали подключения.
+        """
+        with self._cond:
+            to_open = max(0, self.minconn - self._size)
+            self._size += to_open
+        for opened in range(to_open):
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= to_open - opened
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """
+        Выдаёт живое соединение из пула, при необходимости открывая новое.
+
+        Raises:
+            PoolTimeoutError: если за timeout секунд соединение не освободилось
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Пул соединений закрыт")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Нет свободных соединений в пуле за {self.timeout} с "
+                            f"(max={self.maxconn})"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    # LIFO: горячие соединения используются чаще, лишние успевают устареть
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if entry is None:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at, last_used = entry
+                if not self._is_usable(conn, created_at, last_used):
+                    self._discard(conn)
+                    continue
+
+            with self._cond:
+                self._in_use[id(conn)] = created_at
+                self._stats["checkouts"] += 1
+                if waited:
+                    wait_time = time.monotonic() - started
+                    self._stats["waits"] += 1
+                    self._stats["wait_time_total"] += wait_time
+                    self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Возвращает соединение в пул. Незавершённая транзакция откатывается,
+        сломанные и устаревшие соединения закрываются.
+        """
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+        if created_at is None:
+            raise psycopg2.InterfaceError("Соединение не принадлежит пулу")
+
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        now = time.monotonic()
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        if self.max_age and now - created_at >= self.max_age:
+            self._discard(conn, recycled=True)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, now))
+            self._cond.notify()
+        self._trim_idle()
+
+    def closeall(self):
+        """
+        Закрывает все свободные соединения; занятые закрываются при возврате.
+        """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """
+        Возвращает снимок состояния пула.
+        """
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                size=self._size,
+                in_use=len(self._in_use),
+                idle=len(self._idle),
+                waiting=self._waiting,
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+            )
+        return snapshot
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _is_usable(self, conn, created_at, last_used):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_age and now - created_at >= self.max_age:
+            with self._cond:
+                self._stats["connections_recycled"] += 1
+            return False
+        if self.ping_interval is not None and now - last_used >= self.ping_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except psycopg2.Error:
+                with self._cond:
+                    self._stats["failed_checks"] += 1
+                return False
+        return True
+
+    def _trim_idle(self):
+        """
+        Закрывает соединения сверх minconn, которые простаивают дольше max_idle.
+        """
+        if not self.max_idle:
+            return
+        expired = []
+        now = time.monotonic()
+        with self._cond:
+            # Самые давно использованные — в начале очереди
+            while len(self._idle) > self.minconn and now - self._idle[0][2] >= self.max_idle:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self._discard(conn)
+
+    def _discard(self, conn, recycled=False):
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["connections_closed"] += 1
+            if recycled:
+                self._stats["connections_recycled"] += 1
+            self._cond.notify()
@@ -0,0 +1,281 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Выбранный запрос профилируется сэмплированием: отдельный поток каждые
+PROFILE_INTERVAL_MS миллисекунд снимает стек потока, который обрабатывает
+запрос. Учитывается настенное время, поэтому в профиль попадают и ожидание
+PostgreSQL в app.db, и рендеринг шаблонов. Результат пишется в каталог
+PROFILE_DIR в формате collapsed stacks ("кадр;кадр;кадр число") — его
+понимают flamegraph.pl, speedscope и inferno.
+
+Запрос профилируется, если:
+- заголовок X-Profile-Token совпадает с PROFILE_TOKEN, или
+- он попал в долю PROFILE_SAMPLE_RATE (0..1) случайно выбранных запросов.
+
+Если ни PROFILE_TOKEN, ни PROFILE_SAMPLE_RATE не заданы, install() ничего
+не регистрирует и накладных расходов нет. Список и загрузка профилей —
+/debug/profiles с тем же заголовком X-Profile-Token (без PROFILE_TOKEN
+маршрут не регистрируется).
+
+Время отдачи потоковых ответов (выгрузки, /events) в профиль не входит.
+"""
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import Blueprint, abort, g, jsonify, request, send_from_directory
+
+from app import metrics
+from app.logger import app_logger
+
+TOKEN_HEADER = "X-Profile-Token"
+PROFILE_SUFFIX = ".collapsed"
+# <время>-<pid>-<метод>-<endpoint>-<длительность>ms.collapsed
+_NAME_RE = re.compile(
+    r"^(?P<started>\d{8}T\d{6}\.\d{6})-(?P<pid>\d+)-(?P<method>[A-Z]+)-(?P<endpoint>[\w.]+)-(?P<duration_ms>\d+)ms"
+    + re.escape(PROFILE_SUFFIX) + "$"
+)
+
+
+def get_profiling_config():
+    """
+    Читает настройки профилирования из переменных окружения.
+
+    - PROFILE_TOKEN — секрет для заголовка X-Profile-Token и /debug/profiles
+    - PROFILE_SAMPLE_RATE — доля случайно профилируемых запросов (0 — выключено)
+    - PROFILE_DIR — каталог профилей
+    - PROFILE_MAX_FILES — сколько последних профилей хранить
+    - PROFILE_INTERVAL_MS — интервал снятия стека, миллисекунды
+    """
+    return {
+        "token": os.getenv("PROFILE_TOKEN", ""),
+        "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        "directory": os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "alvs-profiles"),
+        "max_files": int(os.getenv("PROFILE_MAX_FILES", "50")),
+        "interval": float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    }
+
+
+def _path_prefixes():
+    # Самые длинные пути первыми: site-packages внутри venv проекта важнее корня проекта
+    paths = {os.path.abspath(path) for path in sys.path + [os.getcwd()] if path}
+    return sorted((path + os.sep for path in paths), key=len, reverse=True)
+
+
+def _frame_label(code, prefixes) -> str:
+    # Функция и строка её начала: все строки одной функции сливаются в один кадр
+    filename = code.co_filename
+    for prefix in prefixes:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """
+    Сэмплирующий профилировщик одного потока.
+
+    Args:
+        thread_id: Идентификатор профилируемого потока (threading.get_ident())
+        interval: Интервал между снимками стека, секунды
+        root: Необязательный корневой кадр (например, "GET /")
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, root: str = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks = Counter()
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        """
+        Профиль в формате collapsed stacks, по строке на уникальный стек.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _run(self):
+        labels = {}
+        prefixes = _path_prefixes()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code, prefixes)
+                stack.append(label)
+                frame = frame.f_back
+            if self.root:
+                stack.append(self.root)
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+
+
+class ProfileStore:
+    """
+    Каталог профилей, в котором хранятся только max_files последних файлов.
+    """
+
+    def __init__(self, directory: str, max_files: int = 50):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, sampler: StackSampler, method: str, endpoint: str) -> str:
+        """
+        Записывает профиль и удаляет самые старые. Возвращает имя файла.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+        endpoint = re.sub(r"[^\w.]", "_", endpoint or "unmatched")
+        name = f"{started}-{os.getpid()}-{method}-{endpoint}-{sampler.duration * 1000:.0f}ms{PROFILE_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        # Запись через временный файл: список профилей не увидит недописанный
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(sampler.collapsed())
+        os.replace(path + ".tmp", path)
+        self.prune()
+        return name
+
+    def list(self):
+        """
+        Профили от новых к старым с разобранными из имени полями.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        profiles = []
+        for name in sorted(names, reverse=True):
+            match = _NAME_RE.match(name)
+            if match is None:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            info = match.groupdict()
+            info.update(name=name, size=size, pid=int(info["pid"]), duration_ms=int(info["duration_ms"]))
+            profiles.append(info)
+        return profiles
+
+    def prune(self):
+        for info in self.list()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, info["name"]))
+            except FileNotFoundError:
+                # Уже удалён другим воркером
+                pass
+
+
+def _token_matches(expected: str) -> bool:
+    supplied = request.headers.get(TOKEN_HEADER, "")
+    return bool(expected) and hmac.compare_digest(supplied.encode(), expected.encode())
+
+
+def create_debug_blueprint(store: ProfileStore, token: str) -> Blueprint:
+    """
+    Маршруты /debug/profiles: список профилей и загрузка файла.
+    """
+    debug = Blueprint("debug_profiles", __name__, url_prefix="/debug/profiles")
+
+    @debug.before_request
+    def require_token():
+        if not _token_matches(token):
+            abort(404)
+
+    @debug.route("", methods=["GET"])
+    def list_profiles():
+        return jsonify({"profiles": store.list()})
+
+    @debug.route("/<name>", methods=["GET"])
+    def download_profile(name: str):
+        if _NAME_RE.match(name) is None:
+            abort(404)
+        return send_from_directory(store.directory, name, mimetype="text/plain", as_attachment=True)
+
+    return debug
+
+
+def install(app, config: dict = None):
+    """
+    Подключает профилирование к приложению, если оно включено настройками.
+
+    Вызывается в create_app() первым, чтобы профиль охватывал остальные хуки.
+
+    Returns:
+        ProfileStore или None, если профилирование выключено
+    """
+    cfg = config or get_profiling_config()
+    if not cfg["token"] and cfg["sample_rate"] <= 0:
+        return None
+
+    store = ProfileStore(cfg["directory"], cfg["max_files"])
+    if cfg["token"]:
+        app.register_blueprint(create_debug_blueprint(store, cfg["token"]))
+
+    def _start_profile():
+        if request.path.startswith("/debug/profiles"):
+            return
+        if _token_matches(cfg["token"]) or random.random() < cfg["sample_rate"]:
+            g.profiler = StackSampler(
+                threading.get_ident(), cfg["interval"], root=f"{request.method} {metrics.route_label(request.url_rule)}"
+            ).start()
+
+    def _finish_profile():
+        sampler = g.pop("profiler", None)
+        if sampler is None:
+            return None
+        sampler.stop()
+        try:
+            name = store.save(sampler, request.method, request.endpoint)
+        except OSError as e:
+            app_logger.warning("Не удалось сохранить профиль запроса: %s", e)
+            return None
+        app_logger.info("Профиль запроса %s %s: %s (%d сэмплов)", request.method, request.path, name, sampler.samples)
+        return name
+
+    def _after_request(response):
+        name = _finish_profile()
+        if name is not None:
+            response.headers["X-Profile"] = name
+        return response
+
+    def _teardown(exc):
+        # Ответ не сформирован (исключение) — профиль всё равно сохраняем
+        _finish_profile()
+
+    app.before_request(_start_profile)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown)
+    return store
@@ -0,0 +1,214 @@
+"""
+Реплики PostgreSQL для чтения: выбор реплики, проверка задержки и LSN.
+
+Реплики — потоковые (streaming) реплики основного сервера с теми же
+PG_DB, PG_USER и PG_PASSWORD. Фоновый поток раз в PG_REPLICA_CHECK_INTERVAL
+секунд опрашивает каждую реплику: жива ли она, на сколько секунд отстаёт
+и до какой позиции журнала (LSN) дошло воспроизведение.
+
+Чтение уходит на реплику, только если она жива, отстаёт не больше
+PG_REPLICA_MAX_LAG секунд и уже воспроизвела последнюю запись текущей
+сессии (read-your-writes, см. app.db.get_session_lsn). Иначе — на основной сервер.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+
+from app import metrics
+
+logger = logging.getLogger("web_app.db")
+
+# Задержка реплики: 0, если она воспроизвела весь полученный журнал (на
+# простаивающем сервере время последней транзакции устаревает само по себе).
+# После перезапуска реплики receive_lsn начинается с границы сегмента и
+# может быть меньше replay_lsn, поэтому сравнение — не на равенство
+REPLICA_STATUS_SQL = """
+    SELECT pg_is_in_recovery() AS in_recovery,
+           CASE
+               WHEN NOT pg_is_in_recovery() THEN 0
+               WHEN pg_last_wal_replay_lsn() >= pg_last_wal_receive_lsn() THEN 0
+               ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+           END AS lag,
+           COALESCE(pg_last_wal_replay_lsn(), pg_current_wal_lsn())::text AS lsn;
+"""
+
+
+class ReplicaReadError(psycopg2.OperationalError):
+    """
+    Чтение с реплики оборвалось (реплика остановлена, соединение разорвано).
+    """
+
+
+def get_replica_config():
+    """
+    Читает настройки реплик из переменных окружения.
+
+    - PG_REPLICA_HOSTS — реплики через запятую: host[:port] (пусто — без реплик)
+    - PG_REPLICA_MAX_LAG — допустимая задержка реплики, секунды
+    - PG_REPLICA_CHECK_INTERVAL — как часто проверять реплики, секунды
+    - PG_REPLICA_CONNECT_TIMEOUT — таймаут подключения к реплике, секунды
+    - PG_REPLICA_STICKY_SECONDS — сколько живёт cookie с LSN последней записи сессии
+    """
+    hosts = []
+    for item in os.getenv("PG_REPLICA_HOSTS", "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(":")
+        hosts.append((host, port or os.getenv("PG_PORT", "5432")))
+    return {
+        "hosts": hosts,
+        "max_lag": float(os.getenv("PG_REPLICA_MAX_LAG", "5")),
+        "check_interval": float(os.getenv("PG_REPLICA_CHECK_INTERVAL", "1")),
+        "connect_timeout": int(os.getenv("PG_REPLICA_CONNECT_TIMEOUT", "2")),
+        "sticky_seconds": int(os.getenv("PG_REPLICA_STICKY_SECONDS", "60")),
+    }
+
+
+def parse_lsn(text) -> int:
+    """
+    Переводит LSN вида '0/16B3748' в число; None и пустая строка — 0.
+    """
+    if not text:
+        return 0
+    high, _, low = str(text).partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def format_lsn(lsn: int) -> str:
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+
+class Replica:
+    """
+    Состояние одной реплики по результатам последней проверки.
+
+    Args:
+        name: host:port, используется в логах и метриках
+        pool: Пул соединений (ConnectionPool) или функция подключения,
+              если пул выключен
+    """
+
+    def __init__(self, name: str, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False
+        self.lag = None
+        self.lsn = 0
+        self.checked_at = None
+        self.error = None
+
+    def acquire(self):
+        if callable(self.pool):
+            return self.pool()
+        return self.pool.getconn()
+
+    def release(self, conn, discard: bool = False):
+        if callable(self.pool):
+            conn.close()
+        else:
+            self.pool.putconn(conn, discard=discard)
+
+    def close(self):
+        if not callable(self.pool):
+            self.pool.closeall()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag": self.lag,
+            "lsn": format_lsn(self.lsn),
+            "error": self.error,
+        }
+
+
+class ReplicaSet:
+    """
+    Реплики процесса и фоновый поток, который их проверяет.
+    """
+
+    def __init__(self, replicas, max_lag: float = 5.0, check_interval: float = 1.0):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        for replica in self.replicas:
+            replica.close()
+
+    def choose(self, min_lsn: int = 0):
+        """
+        Реплика для чтения (по кругу среди подходящих) или None — читать с основного.
+        """
+        candidates = [
+            replica for replica in self.replicas
+            if replica.healthy and replica.lag is not None
+            and replica.lag <= self.max_lag and replica.lsn >= min_lsn
+        ]
+        if not candidates:
+            return None
+        return candidates[next(self._next) % len(candidates)]
+
+    def mark_down(self, replica: Replica, error):
+        """
+        Исключает реплику из выбора до следующей успешной проверки.
+        """
+        if replica.healthy:
+            logger.warning("Реплика %s недоступна, чтение идёт с основного сервера: %s", replica.name, error)
+        replica.healthy = False
+        replica.error = str(error).strip()
+        metrics.update_replica_metrics(replica)
+
+    def check(self, replica: Replica):
+        conn = None
+        try:
+            conn = replica.acquire()
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_STATUS_SQL)
+                row = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error as e:
+            if conn is not None:
+                replica.release(conn, discard=True)
+            self.mark_down(replica, e)
+            return
+        replica.release(conn)
+        if not replica.healthy:
+            logger.info("Реплика %s доступна для чтения", replica.name)
+            if not row["in_recovery"]:
+                logger.warning("Сервер %s из PG_REPLICA_HOSTS не является репликой", replica.name)
+        replica.lag = float(row["lag"]) if row["lag"] is not None else None
+        replica.lsn = parse_lsn(row["lsn"])
+        replica.checked_at = time.monotonic()
+        replica.error = None
+        replica.healthy = True
+        metrics.update_replica_metrics(replica)
+
+    def check_all(self):
+        for replica in self.replicas:
+            self.check(replica)
+
+    def stats(self):
+        return [replica.stats() for replica in self.replicas]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.check_interval)
@@ -0,0 +1,52 @@
+"""
+Учёт времени внутри одного запроса: сколько заняла БД и рендеринг шаблонов.
+
+Значения собираются в contextvar, поэтому параллельные запросы
+в потоках одного воркера не смешиваются.
+"""
+import contextvars
+
+# Фазы работы с БД в порядке вывода в Server-Timing
+DB_PHASES = ("connect", "execute", "fetch")
+
+_request_timing = contextvars.ContextVar("request_timing", default=None)
+
+
+def begin():
+    """
+    Начинает учёт для текущего запроса.
+    """
+    timing = {"db_" + phase: 0.0 for phase in DB_PHASES}
+    timing.update(db_ops=0, render=0.0)
+    _request_timing.set(timing)
+    return timing
+
+
+def end():
+    _request_timing.set(None)
+
+
+def current():
+    return _request_timing.get()
+
+
+def add(key: str, seconds: float):
+    """
+    Добавляет время к текущему запросу (если учёт включён).
+    """
+    timing = _request_timing.get()
+    if timing is not None:
+        timing[key] = timing.get(key, 0.0) + seconds
+
+
+def server_timing_header(timing, total: float) -> str:
+    """
+    Формирует значение заголовка Server-Timing (длительности в миллисекундах).
+    """
+    db_total = sum(timing["db_" + phase] for phase in DB_PHASES)
+    parts = [f'db;dur={db_total * 1000:.2f};desc="queries={timing["db_ops"]}"']
+    for phase in DB_PHASES:
+        parts.append(f"db-{phase};dur={timing['db_' + phase] * 1000:.2f}")
+    parts.append(f"render;dur={timing['render'] * 1000:.2f}")
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
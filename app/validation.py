@@ -0,0 +1,13 @@
+"""
+Валидация данных контактов.
+"""
+import re
+
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+
+
+def validate_email(email: str) -> bool:
+    """
+    Простая валидация email адреса.
+    """
+    return EMAIL_PATTERN.match(email) is not None
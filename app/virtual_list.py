@@ -0,0 +1,308 @@
+"""
+Фоновый исполнитель запросов к БД и кэш строк виртуального списка для Tk-клиента.
+
+Модуль не зависит от tkinter: главный поток Tk периодически (через after())
+вызывает BackgroundWorker.poll(), и колбэки выполняются уже в нём.
+"""
+import queue
+import threading
+from collections import OrderedDict
+
+from app import db
+
+# Размер блока строк, загружаемого одним запросом
+BLOCK_SIZE = 100
+# Сколько блоков держать в памяти (остальные вытесняются по LRU)
+MAX_BLOCKS = 50
+
+
+class BackgroundWorker:
+    """
+    Выполняет функции в одном фоновом потоке по порядку постановки.
+
+    Один поток гарантирует, что изменение и последующее чтение выполнятся
+    в том же порядке, в котором их запросил интерфейс.
+    """
+
+    def __init__(self, name: str = "db-worker"):
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, on_done=None, on_error=None, **kwargs):
+        """
+        Ставит вызов func(*args, **kwargs) в очередь.
+
+        on_done(результат) и on_error(исключение) будут вызваны из poll().
+        """
+        self._tasks.put((func, args, kwargs, on_done, on_error))
+
+    def poll(self, limit: int = 100) -> int:
+        """
+        Вызывает колбэки готовых задач в текущем потоке. Возвращает их число.
+        """
+        handled = 0
+        while handled < limit:
+            try:
+                callback, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            handled += 1
+            if callback is not None:
+                callback(value)
+        return handled
+
+    def stop(self, timeout: float = 1.0):
+        self._tasks.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            func, args, kwargs, on_done, on_error = task
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._results.put((on_error, e))
+            else:
+                self._results.put((on_done, result))
+
+
+class ContactWindow:
+    """
+    Строки виртуального списка, загруженные блоками по позициям.
+
+    Список показывает либо все контакты по возрастанию id (query=None), либо
+    результаты поиска. Блоки загружаются по требованию: следующий за
+    загруженным блоком — по курсору after_id, произвольный — по OFFSET.
+    После изменения данных строка правится на месте, а не перезагружается.
+
+    Каждое структурное изменение увеличивает generation: результаты запросов,
+    поставленных до него, отбрасываются.
+    """
+
+    def __init__(self, query: str = None, block_size: int = BLOCK_SIZE, max_blocks: int = MAX_BLOCKS):
+        self.query = query
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.total = 0
+        self.generation = 0
+        self._blocks = OrderedDict()
+        self._pending = set()
+        # Удаления, уже применённые локально: их уведомления из app.notify пропускаются
+        self._removed = set()
+        # id добавленных в конец строк: добавление и уведомление о нём
+        # могут прийти в любом порядке, строка должна появиться один раз
+        self._appended = set()
+
+    # --- чтение ---
+
+    def row(self, index: int):
+        """
+        Строка по позиции или None, если её блок ещё не загружен.
+        """
+        block_no, offset = divmod(index, self.block_size)
+        block = self._blocks.get(block_no)
+        if block is None or offset >= len(block):
+            return None
+        self._blocks.move_to_end(block_no)
+        return block[offset]
+
+    def missing_blocks(self, first: int, count: int):
+        """
+        Номера блоков в диапазоне позиций, которые нужно (до)загрузить.
+        """
+        last = min(first + count, self.total) - 1
+        if last < first:
+            return []
+        missing = []
+        for block_no in range(first // self.block_size, last // self.block_size + 1):
+            block = self._blocks.get(block_no)
+            if block_no in self._pending:
+                continue
+            if block is None or len(block) < self._expected_len(block_no):
+                missing.append(block_no)
+        return missing
+
+    def _expected_len(self, block_no: int) -> int:
+        return max(0, min(self.block_size, self.total - block_no * self.block_size))
+
+    # --- загрузка ---
+
+    def plan(self, block_no: int):
+        """
+        Описание запроса для блока; выполняется в фоне через load().
+        """
+        self._pending.add(block_no)
+        if self.query is not None:
+            kwargs = {"query": self.query, "limit": self.block_size, "page": block_no + 1}
+            return ("search", block_no, self.generation, kwargs)
+
+        block = self._blocks.get(block_no)
+        if block:
+            # Блок загружен не полностью (после удаления) — дочитываем хвост
+            kwargs = {"limit": self.block_size - len(block), "after_id": block[-1]["id"]}
+            return ("append", block_no, self.generation, kwargs)
+        previous = self._blocks.get(block_no - 1)
+        if previous is not None and len(previous) == self.block_size:
+            kwargs = {"limit": self.block_size, "after_id": previous[-1]["id"]}
+            return ("after", block_no, self.generation, kwargs)
+        kwargs = {"offset": block_no * self.block_size, "limit": self.block_size}
+        return ("offset", block_no, self.generation, kwargs)
+
+    @staticmethod
+    def load(plan):
+        """
+        Выполняет запрос блока (в фоновом потоке). Состояние окна не трогает.
+        """
+        kind, _, _, kwargs = plan
+        if kind == "search":
+            return db.search_contacts(**kwargs)
+        if kind == "offset":
+            return {"contacts": db.get_contacts_window(**kwargs)}
+        return db.list_contacts(use_cache=False, **kwargs)
+
+    def apply(self, plan, result) -> bool:
+        """
+        Сохраняет загруженный блок. Возвращает False, если результат устарел.
+        """
+        kind, block_no, generation, _ = plan
+        if generation != self.generation:
+            return False
+        self._pending.discard(block_no)
+        rows = [dict(row) for row in result["contacts"]]
+
+        if kind == "append":
+            block = self._blocks.get(block_no)
+            if block is None:
+                # Блок вытеснен, пока дочитывали хвост — загрузим его заново
+                return False
+            block.extend(rows)
+        else:
+            block = rows
+        self._blocks[block_no] = block
+        self._blocks.move_to_end(block_no)
+
+        if kind == "search":
+            reached = block_no * self.block_size + len(block)
+            # Общее число результатов поиска неизвестно: показываем одну
+            # строку-заглушку за последней, её появление догрузит следующий блок
+            if result.get("has_next"):
+                self.total = max(self.total, reached + 1)
+            else:
+                self.total = reached
+                self._drop_after(block_no)
+        elif len(block) < self._expected_len(block_no):
+            # Строк меньше, чем ожидалось (их удалили другие клиенты)
+            self.total = block_no * self.block_size + len(block)
+            self._drop_after(block_no)
+
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return True
+
+    def set_total(self, total: int):
+        self.total = total
+
+    # --- изменения ---
+
+    def find(self, contact_id: int):
+        """
+        Позиция загруженной строки с данным id или None.
+        """
+        for block_no, block in self._blocks.items():
+            for offset, row in enumerate(block):
+                if row["id"] == contact_id:
+                    return block_no * self.block_size + offset
+        return None
+
+    def patch(self, contact: dict):
+        """
+        Обновляет загруженную строку. Возвращает её позицию или None.
+        """
+        index = self.find(contact["id"])
+        if index is not None:
+            self._invalidate_pending()
+            self.row(index).update(contact)
+        return index
+
+    def remove(self, contact_id: int):
+        """
+        Удаляет строку: позиции после неё сдвигаются, поэтому следующие блоки
+        сбрасываются и будут загружены заново. Возвращает позицию или None.
+        """
+        self._invalidate_pending()
+        index = self.find(contact_id)
+        if index is None:
+            return None
+        block_no, offset = divmod(index, self.block_size)
+        del self._blocks[block_no][offset]
+        self.total = max(0, self.total - 1)
+        self._removed.add(contact_id)
+        self._drop_after(block_no)
+        return index
+
+    def append(self, contact: dict):
+        """
+        Добавляет новый контакт в конец списка (у нового контакта наибольший id).
+
+        В режиме поиска ничего не делает: подходит ли контакт под запрос,
+        знает только БД. Возвращает позицию строки или None.
+        """
+        if self.query is not None or contact["id"] in self._appended:
+            return None
+        self._invalidate_pending()
+        self._appended.add(contact["id"])
+        index = self.total
+        self.total += 1
+        block_no, offset = divmod(index, self.block_size)
+        block = self._blocks.get(block_no)
+        if block is not None and len(block) == offset:
+            block.append(dict(contact))
+        return index
+
+    def apply_change(self, event) -> bool:
+        """
+        Применяет событие из app.notify к загруженным строкам.
+
+        Returns:
+            False, если нужно перечитать список целиком (событие reload)
+        """
+        op = event["op"]
+        if op == "reload":
+            return False
+        if op == "update":
+            for contact in event["contacts"]:
+                self.patch(contact)
+        elif op == "insert":
+            for contact in event["contacts"]:
+                if self.find(contact["id"]) is None:
+                    self.append(contact)
+        elif op == "delete":
+            for contact_id in event["ids"]:
+                if contact_id in self._removed:
+                    continue
+                if self.remove(contact_id) is None:
+                    self._remove_unloaded(contact_id)
+        return True
+
+    def _remove_unloaded(self, contact_id: int):
+        if self.query is not None:
+            return
+        self._invalidate_pending()
+        self._removed.add(contact_id)
+        self.total = max(0, self.total - 1)
+        # Позиция строки неизвестна: сдвинулись все блоки со строками после неё
+        for number in [n for n, block in self._blocks.items() if not block or block[-1]["id"] > contact_id]:
+            del self._blocks[number]
+
+    def _drop_after(self, block_no: int):
+        for number in [n for n in self._blocks if n > block_no]:
+            del self._blocks[number]
+
+    def _invalidate_pending(self):
+        self.generation += 1
+        self._pending.clear()
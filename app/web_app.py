@@ -1,30 +1,53 @@
-import re
+import json
+import os
+import threading
 import time
-from flask import Flask, render_template, request, redirect, url_for, flash
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 
-from app import db
-from app.logger import app_logger
-
-# Метрики Prometheus
-http_requests_total = Counter(
-    'http_requests_total',
-    'Total number of HTTP requests',
-    ['method', 'path', 'status']
+import psycopg2
+from flask import (
+    Flask, Response, render_template, request, redirect, url_for, flash, jsonify,
+    before_render_template, template_rendered,
 )
 
-http_request_duration_seconds = Histogram(
-    'http_request_duration_seconds',
-    'Duration of HTTP requests in seconds',
-    ['method', 'path'],
-    buckets=[0.01, 0.05, 0.1, 0.5, 1, 2, 5]
+from app import (
+    admission, db, exporter, health, importer, metrics, notify, profiling, replicas, timing, write_behind,
 )
+from app.api import api
+from app.logger import accept_request_id, app_logger, set_request_id
+from app.validation import validate_email
 
-http_response_time_seconds = Gauge(
-    'http_response_time_seconds',
-    'Last HTTP response time in seconds',
-    ['method', 'path']
-)
+# Сообщения /add по результату write_behind.upsert_contact
+_ADD_MESSAGES = {
+    "created": "Контакт добавлен",
+    "updated": "Контакт с таким email уже был — данные обновлены",
+    "unchanged": "Такой контакт уже есть",
+    "queued": "Контакт принят и будет сохранён",
+}
+
+# Комментарий-пинг в SSE-потоке, чтобы прокси не закрывали простаивающее соединение
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Поток закрывается через это время, браузер переподключается сам (EventSource);
+# так долгие соединения не занимают потоки воркера надолго
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", "60"))
+# Сколько SSE-потоков воркер держит одновременно (0 — без предела). Под gthread
+# каждый клиент /events занимает поток воркера; лишние получают 503 с Retry-After,
+# чтобы потоки оставались обычным запросам (значение задаёт gunicorn.conf.py)
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "0"))
+# Пауза перед переподключением: поле retry потока и Retry-After отказа
+SSE_RETRY_SECONDS = 3
+SSE_BUSY_MESSAGE = "Слишком много подписчиков на изменения, повторите позже"
+
+# Cookie с LSN последней записи сессии: пока реплики до него не дошли,
+# чтение этого браузера идёт с основного сервера (см. app.replicas)
+DB_LSN_COOKIE = "db_lsn"
+
+# Служебные endpoint'ы не попадают в метрики запросов: пробы Kubernetes
+# и опрос Prometheus исказили бы статистику пользовательских запросов
+UNMETERED_ENDPOINTS = frozenset({"metrics_endpoint", "healthz", "readyz"})
+
+# Идентификатор запроса: берётся у клиента или прокси, иначе создаётся;
+# попадает во все строки лога запроса и возвращается в ответе
+REQUEST_ID_HEADER = "X-Request-ID"
 
 
 def create_app():
@@ -37,54 +60,149 @@ def create_app():
     app = Flask(__name__, template_folder=template_dir)
     # Для flash-сообщений нужен секретный ключ (для простоты — константа)
     app.config["SECRET_KEY"] = "dev-secret-key"
-
-    # Инициализация БД при первом запросе
-    @app.before_request
-    def _init_db():
-        if not hasattr(app, "_db_initialized"):
-            db.init_db()
-            app._db_initialized = True
+    app.register_blueprint(api)
+    # Профилирование запросов по требованию (PROFILE_TOKEN / PROFILE_SAMPLE_RATE);
+    # подключается первым, чтобы профиль охватывал остальные хуки
+    profiling.install(app)
 
     # Middleware для сбора метрик Prometheus
     @app.before_request
     def before_request():
         request.start_time = time.time()
+        request.request_id = accept_request_id(request.headers.get(REQUEST_ID_HEADER))
+        set_request_id(request.request_id)
+        timing.begin()
+        db.set_session_lsn(request.cookies.get(DB_LSN_COOKIE))
+
+    # Время рендеринга шаблонов для заголовка Server-Timing
+    def _render_started(sender, template, context, **extra):
+        request_timing = timing.current()
+        if request_timing is not None:
+            request_timing["render_started"] = time.perf_counter()
+
+    def _render_finished(sender, template, context, **extra):
+        request_timing = timing.current()
+        if request_timing is not None and "render_started" in request_timing:
+            timing.add("render", time.perf_counter() - request_timing.pop("render_started"))
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_finished, app, weak=False)
+
+    @app.teardown_request
+    def _end_timing(exc):
+        timing.end()
+        set_request_id(None)
+
+    sticky_seconds = replicas.get_replica_config()["sticky_seconds"]
 
     @app.after_request
     def after_request(response):
-        # Пропускаем метрики endpoint
-        if request.path == '/metrics':
+        lsn = db.get_session_lsn()
+        if lsn and lsn != request.cookies.get(DB_LSN_COOKIE):
+            response.set_cookie(DB_LSN_COOKIE, lsn, max_age=sticky_seconds, httponly=True, samesite="Lax")
+        if hasattr(request, "request_id"):
+            response.headers[REQUEST_ID_HEADER] = request.request_id
+
+        # Пропускаем служебные endpoint'ы
+        if request.endpoint in UNMETERED_ENDPOINTS:
             return response
 
         # Проверяем, что start_time был установлен (может отсутствовать при ошибках в before_request)
         if hasattr(request, 'start_time'):
             duration = time.time() - request.start_time
-            method = request.method
-            path = request.path
-            status = str(response.status_code)
-
-            # Обновляем метрики
-            http_requests_total.labels(method=method, path=path, status=status).inc()
-            http_request_duration_seconds.labels(method=method, path=path).observe(duration)
-            http_response_time_seconds.labels(method=method, path=path).set(duration)
+            request_timing = timing.current()
+            if request_timing is not None:
+                response.headers['Server-Timing'] = timing.server_timing_header(request_timing, duration)
+            # Метка path — шаблон маршрута, неизвестные пути сводятся в одну метку
+            metrics.observe_request(request.method, request.url_rule, response.status_code, duration)
+            # Состояние пула обновляем здесь: в многопроцессном режиме /metrics
+            # отвечает один воркер, а значения нужны от каждого
+            metrics.update_pool_metrics(db.pool_stats())
 
         return response
 
+    # Контроль допуска (ADMISSION_*): лишние запросы получают 503/429 до обращения к БД.
+    # Поток /events держит соединение минутами и не ограничивается
+    admission.install(app, exempt=UNMETERED_ENDPOINTS | {"events"})
+
     # Endpoint для метрик Prometheus
-    @app.route('/metrics')
-    def metrics():
-        return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    @app.route('/metrics', endpoint='metrics_endpoint')
+    def metrics_endpoint():
+        metrics.update_pool_metrics(db.pool_stats())
+        body, content_type = metrics.render_latest()
+        return body, 200, {'Content-Type': content_type}
+
+    @app.route("/healthz", methods=["GET"])
+    def healthz():
+        """
+        Liveness: процесс жив и обрабатывает запросы; БД не проверяется.
+        """
+        return jsonify({"status": "ok"})
+
+    @app.route("/readyz", methods=["GET"])
+    def readyz():
+        """
+        Readiness: БД отвечает (кэшируемый SELECT 1) и пул соединений не перегружен.
+        """
+        ready, body = health.readiness.status()
+        return jsonify(body), 200 if ready else 503
 
     @app.route("/", methods=["GET"])
     def index():
+        filters = {
+            "name_prefix": request.args.get("name_prefix", "").strip(),
+            "email_prefix": request.args.get("email_prefix", "").strip(),
+        }
+        page = {"contacts": [], "next_after": None, "prev_before": None}
         try:
-            contacts = db.get_all_contacts()
-            app_logger.info(f"Загружено контактов: {len(contacts)}")
+            page = db.list_contacts(
+                limit=request.args.get("limit", db.DEFAULT_PAGE_SIZE, type=int),
+                after_id=request.args.get("after", type=int),
+                before_id=request.args.get("before", type=int),
+                name_prefix=filters["name_prefix"] or None,
+                email_prefix=filters["email_prefix"] or None,
+                # Страница только выводит строки: Contact со __slots__ дешевле словаря
+                lean=True,
+            )
+            app_logger.info("Загружено контактов: %d", len(page["contacts"]), extra={"log_key": "contacts.loaded"})
         except Exception as e:
-            app_logger.error(f"Ошибка при загрузке контактов: {str(e)}")
+            app_logger.error("Ошибка при загрузке контактов: %s", e)
             flash(f"Ошибка при загрузке контактов: {str(e)}", "error")
-            contacts = []
-        return render_template("index.html", contacts=contacts)
+        # В ссылках пагинации передаём только непустые фильтры
+        filters = {key: value for key, value in filters.items() if value}
+        return render_template(
+            "index.html",
+            contacts=page["contacts"],
+            next_after=page["next_after"],
+            prev_before=page["prev_before"],
+            filters=filters,
+        )
+
+    @app.route("/search", methods=["GET"])
+    def search():
+        query = request.args.get("q", "").strip()
+        result = {"contacts": [], "page": 1, "has_next": False}
+        try:
+            result = db.search_contacts(
+                query,
+                limit=request.args.get("limit", db.DEFAULT_PAGE_SIZE, type=int),
+                page=request.args.get("page", 1, type=int),
+            )
+            app_logger.info(
+                "Поиск контактов: q='%s', найдено на странице: %d", query, len(result["contacts"]),
+                extra={"log_key": "contacts.search"},
+            )
+        except Exception as e:
+            app_logger.error("Ошибка при поиске контактов: q='%s', error=%s", query, e)
+            flash(f"Ошибка при поиске контактов: {str(e)}", "error")
+        return render_template(
+            "index.html",
+            contacts=result["contacts"],
+            filters={},
+            search_query=query,
+            page=result["page"],
+            has_next=result["has_next"],
+        )
 
     @app.route("/add", methods=["POST"])
     def add():
@@ -99,11 +217,13 @@ def create_app():
             return redirect(url_for("index"))
 
         try:
-            db.add_contact(name, email)
-            app_logger.info(f"Добавлен контакт: name='{name}', email='{email}'")
-            flash("Контакт добавлен", "success")
+            # Повторная отправка формы не создаёт дубль: контакт с тем же email обновляется.
+            # С WRITE_BEHIND запись идёт групповым коммитом фонового потока
+            contact_id, status = write_behind.upsert_contact(name, email)
+            app_logger.info("Добавлен контакт (%s): id=%s, name='%s', email='%s'", status, contact_id, name, email)
+            flash(_ADD_MESSAGES[status], "success")
         except Exception as e:
-            app_logger.error(f"Ошибка при добавлении контакта: name='{name}', email='{email}', error={str(e)}")
+            app_logger.error("Ошибка при добавлении контакта: name='%s', email='%s', error=%s", name, email, e)
             flash(f"Ошибка при добавлении контакта: {str(e)}", "error")
         return redirect(url_for("index"))
 
@@ -121,10 +241,15 @@ def create_app():
 
         try:
             db.update_contact(contact_id, name, email)
-            app_logger.info(f"Обновлён контакт: id={contact_id}, name='{name}', email='{email}'")
+            app_logger.info("Обновлён контакт: id=%s, name='%s', email='%s'", contact_id, name, email)
             flash("Контакт обновлён", "success")
+        except psycopg2.errors.UniqueViolation:
+            flash(f"Контакт с email {email} уже существует", "error")
         except Exception as e:
-            app_logger.error(f"Ошибка при обновлении контакта: id={contact_id}, name='{name}', email='{email}', error={str(e)}")
+            app_logger.error(
+                "Ошибка при обновлении контакта: id=%s, name='%s', email='%s', error=%s",
+                contact_id, name, email, e,
+            )
             flash(f"Ошибка при обновлении контакта: {str(e)}", "error")
         return redirect(url_for("index"))
 
@@ -132,22 +257,104 @@ def create_app():
     def delete(contact_id: int):
         try:
             db.delete_contact(contact_id)
-            app_logger.info(f"Удалён контакт: id={contact_id}")
+            app_logger.info("Удалён контакт: id=%s", contact_id)
             flash("Контакт удалён", "success")
         except Exception as e:
-            app_logger.error(f"Ошибка при удалении контакта: id={contact_id}, error={str(e)}")
+            app_logger.error("Ошибка при удалении контакта: id=%s, error=%s", contact_id, e)
             flash(f"Ошибка при удалении контакта: {str(e)}", "error")
         return redirect(url_for("index"))
 
-    return app
+    @app.route("/import", methods=["POST"])
+    def import_contacts():
+        """
+        Массовый импорт: multipart-поле file или тело запроса (text/csv, application/x-ndjson).
+        """
+        upload = request.files.get("file")
+        if upload is not None:
+            stream = upload.stream
+            fmt = request.form.get("format") or importer.detect_format(upload.filename, upload.mimetype)
+        else:
+            stream = request.stream
+            fmt = request.args.get("format") or importer.detect_format(content_type=request.mimetype)
 
+        try:
+            report = importer.import_stream(stream, fmt)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            app_logger.error("Ошибка при импорте контактов: %s", e)
+            return jsonify({"error": f"Ошибка при импорте контактов: {str(e)}"}), 500
 
-def validate_email(email: str) -> bool:
-    """
-    Простая валидация email адреса.
-    """
-    pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    return re.match(pattern, email) is not None
+        app_logger.info(
+            "Импорт контактов: прочитано=%d, загружено=%d, отклонено=%d, %s строк/с",
+            report["read"], report["imported"], report["rejected"], report["imported_per_sec"],
+        )
+        return jsonify(report)
+
+    @app.route("/export.csv", methods=["GET"])
+    def export_csv():
+        # ?method=copy — выгрузка через COPY TO STDOUT (быстрее, без разбора строк в Python)
+        use_copy = request.args.get("method") == "copy"
+        app_logger.info("Выгрузка контактов в CSV (copy=%s)", use_copy)
+        return Response(
+            exporter.export_csv(use_copy=use_copy),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=contacts.csv"},
+        )
+
+    @app.route("/export.ndjson", methods=["GET"])
+    def export_ndjson():
+        app_logger.info("Выгрузка контактов в NDJSON")
+        return Response(
+            exporter.export_ndjson(),
+            mimetype="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=contacts.ndjson"},
+        )
+
+    # Места для SSE-потоков в этом воркере
+    sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS) if SSE_MAX_STREAMS > 0 else None
+
+    @app.route("/events", methods=["GET"])
+    def events():
+        """
+        Server-Sent Events с изменениями контактов (см. app/notify.py).
+        """
+        if sse_slots is not None and not sse_slots.acquire(blocking=False):
+            metrics.admission_rejected_total.labels(reason="sse_streams").inc()
+            return SSE_BUSY_MESSAGE, 503, {
+                "Retry-After": str(SSE_RETRY_SECONDS),
+                "Content-Type": "text/plain; charset=utf-8",
+            }
+        subscription = notify.subscribe()
+        # Переподключение после обрыва: изменения за время разрыва неизвестны
+        reconnected = request.headers.get("Last-Event-ID") is not None
+
+        def stream():
+            try:
+                yield f"retry: {SSE_RETRY_SECONDS * 1000}\n\n"
+                if reconnected:
+                    yield 'event: reload\ndata: {"op": "reload"}\n\n'
+                deadline = time.monotonic() + SSE_MAX_SECONDS
+                while time.monotonic() < deadline:
+                    event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                    if event is None:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield f"id: {event['seq']}\nevent: {event['op']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            finally:
+                subscription.close()
+
+        response = Response(
+            stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        if sse_slots is not None:
+            # Место освобождается при закрытии ответа, даже если поток не начался
+            response.call_on_close(sse_slots.release)
+        return response
+
+    return app
 
 
 # Создаем экземпляр приложения для Gunicorn
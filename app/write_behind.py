@@ -0,0 +1,238 @@
+"""
+Отложенная запись контактов с групповым коммитом (write-behind).
+
+При всплесках /add каждый запрос сам берёт соединение и выполняет COMMIT,
+и узким местом становится fsync журнала PostgreSQL. В режиме write-behind
+запросы кладут контакт в очередь процесса, а фоновый поток собирает
+накопившиеся контакты (до WRITE_BEHIND_MAX_BATCH штук или в течение
+WRITE_BEHIND_WINDOW_MS миллисекунд после первого) и записывает их одной
+транзакцией через db.apply_batch: одна команда INSERT ... ON CONFLICT
+и один COMMIT на группу.
+
+Режимы (WRITE_BEHIND):
+- off — запись сразу в запросе (db.upsert_contact), по умолчанию;
+- durable — запрос ждёт коммита своей группы и получает id и статус;
+- fast — запрос получает ответ сразу после постановки в очередь. Контакты,
+  ещё не записанные к моменту падения процесса, теряются; ошибка записи
+  группы только попадает в лог.
+
+Если очередь заполнена, контакт записывается сразу, как в режиме off.
+При остановке воркера (хук worker_exit gunicorn, atexit) очередь
+дописывается до конца.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app import db, metrics
+from app.logger import app_logger
+
+WRITE_BEHIND_MODES = ("off", "durable", "fast")
+
+# Маркер остановки в очереди: всё, что лежит перед ним, будет записано
+_STOP = object()
+
+
+def get_write_behind_config():
+    """
+    Читает настройки отложенной записи из переменных окружения.
+
+    - WRITE_BEHIND — режим: off, durable или fast
+    - WRITE_BEHIND_WINDOW_MS — сколько ждать попутчиков после первого контакта группы
+    - WRITE_BEHIND_MAX_BATCH — наибольший размер группы
+    - WRITE_BEHIND_QUEUE_SIZE — наибольшая длина очереди процесса
+    - WRITE_BEHIND_TIMEOUT — сколько секунд запрос в режиме durable ждёт коммита
+    """
+    mode = os.getenv("WRITE_BEHIND", "off").lower()
+    if mode not in WRITE_BEHIND_MODES:
+        raise ValueError(f"WRITE_BEHIND должен быть одним из {', '.join(WRITE_BEHIND_MODES)}: {mode!r}")
+    return {
+        "mode": mode,
+        "window": float(os.getenv("WRITE_BEHIND_WINDOW_MS", "5")) / 1000,
+        "max_batch": int(os.getenv("WRITE_BEHIND_MAX_BATCH", "100")),
+        "queue_size": int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000")),
+        "timeout": float(os.getenv("WRITE_BEHIND_TIMEOUT", "10")),
+    }
+
+
+class _PendingWrite:
+    __slots__ = ("operation", "future", "enqueued")
+
+    def __init__(self, name: str, email: str):
+        self.operation = {"op": "create", "name": name, "email": email}
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class WriteBehindQueue:
+    """
+    Очередь контактов и поток, который записывает их группами.
+
+    Args:
+        flush: Функция записи группы операций (по умолчанию db.apply_batch)
+        window: Сколько секунд собирать группу после первого контакта
+        max_batch: Наибольший размер группы
+        maxsize: Наибольшая длина очереди
+    """
+
+    def __init__(self, flush=None, window: float = 0.005, max_batch: int = 100, maxsize: int = 10000):
+        self.flush = flush or db.apply_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, name: str, email: str) -> Future:
+        """
+        Ставит контакт в очередь.
+
+        Returns:
+            Future с результатом {"id", "status", "lsn"} после коммита группы
+
+        Raises:
+            queue.Full: очередь заполнена или остановлена
+        """
+        if self._stopped:
+            raise queue.Full
+        pending = _PendingWrite(name, email)
+        self._queue.put_nowait(pending)
+        metrics.write_behind_queue_depth.inc()
+        return pending.future
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Дописывает всё, что уже в очереди, и останавливает поток.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread.is_alive():
+            # Маркер кладётся и в заполненную очередь: поток её разбирает
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect(first)
+            self._write(batch)
+        # После маркера новых контактов нет, но могли остаться уже положенные
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        for start in range(0, len(leftover), self.max_batch):
+            self._write(leftover[start:start + self.max_batch])
+
+    def _write(self, batch):
+        metrics.write_behind_queue_depth.dec(len(batch))
+        started = time.perf_counter()
+        try:
+            results = self.flush([pending.operation for pending in batch])
+        except Exception as e:
+            app_logger.error("Ошибка групповой записи %d контактов: %s", len(batch), e)
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        metrics.observe_write_behind_flush(len(batch), finished - started, finished - batch[0].enqueued)
+        # LSN коммита группы — для read-your-writes в сессии, которая ждёт результат
+        lsn = db.get_session_lsn()
+        for pending, result in zip(batch, results):
+            pending.future.set_result({"id": result["id"], "status": result["status"], "lsn": lsn})
+
+
+_lock = threading.Lock()
+_queue = None
+_queue_pid = None
+
+
+def get_queue(cfg: dict = None):
+    """
+    Очередь текущего процесса или None, если режим off.
+
+    Как и пул соединений, привязана к PID: после fork воркер создаёт свою.
+    """
+    global _queue, _queue_pid
+    cfg = cfg or get_write_behind_config()
+    if cfg["mode"] == "off":
+        return None
+    pid = os.getpid()
+    with _lock:
+        if _queue is None or _queue_pid != pid:
+            _queue = WriteBehindQueue(
+                window=cfg["window"], max_batch=cfg["max_batch"], maxsize=cfg["queue_size"],
+            ).start()
+            _queue_pid = pid
+        return _queue
+
+
+def stop():
+    """
+    Дописывает очередь процесса и останавливает её поток.
+    """
+    global _queue, _queue_pid
+    with _lock:
+        write_queue = _queue if _queue_pid == os.getpid() else None
+        _queue, _queue_pid = None, None
+    if write_queue is not None:
+        write_queue.stop()
+
+
+atexit.register(stop)
+
+
+def upsert_contact(name: str, email: str):
+    """
+    Добавляет контакт с учётом режима WRITE_BEHIND.
+
+    Returns:
+        Пара (id, статус), как у db.upsert_contact; в режиме fast — (None, "queued")
+    """
+    cfg = get_write_behind_config()
+    write_queue = get_queue(cfg)
+    if write_queue is None:
+        return db.upsert_contact(name, email)
+    try:
+        future = write_queue.submit(name, email)
+    except queue.Full:
+        app_logger.warning("Очередь отложенной записи заполнена, контакт записывается сразу")
+        return db.upsert_contact(name, email)
+    if cfg["mode"] == "fast":
+        return None, "queued"
+    result = future.result(timeout=cfg["timeout"])
+    if result["lsn"]:
+        db.set_session_lsn(result["lsn"])
+    return result["id"], result["status"]
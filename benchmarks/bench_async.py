@@ -0,0 +1,296 @@
+"""
+Бенчмарк WSGI- и ASGI-вариантов приложения при медленной БД.
+
+Запускает по одному процессу каждого варианта:
+- sync: gunicorn (gthread, один воркер, --threads потоков) с app.web_app;
+- async: uvicorn (один воркер) с app.async_web_app.
+
+Оба подключаются к PostgreSQL через TCP-прокси, который задерживает каждый
+пакет от приложения к серверу на --db-latency-ms миллисекунд: так
+моделируется далёкая или перегруженная БД, а процессор сервера остаётся
+свободным. Затем --concurrency клиентов в потоках отправляют --requests
+запросов GET / (страницы в случайном месте таблицы) к каждому варианту.
+Для каждого считает p50/p95/p99 задержки, пропускную способность и ошибки.
+
+Пул соединений обоих вариантов — --pool-max; синхронный воркер не может
+обработать больше запросов одновременно, чем у него потоков, асинхронный —
+чем соединений в пуле.
+
+Внимание: таблица contacts в базе --dbname очищается перед прогоном.
+
+Запуск (нужны пакеты из requirements-async.txt):
+    python -m benchmarks.bench_async --concurrency 64 --db-latency-ms 20 --output bench_async.json
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_web import _ensure_database, _percentile, _seed
+
+MODES = ("sync", "async")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LatencyProxy:
+    """
+    TCP-прокси до PostgreSQL, который задерживает запросы приложения.
+
+    Работает в собственном потоке с циклом событий.
+    """
+
+    def __init__(self, upstream_host, upstream_port, latency):
+        self.upstream = (upstream_host, int(upstream_port))
+        self.latency = latency
+        self.port = _free_port()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="latency-proxy", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+
+    async def _pipe(self, reader, writer, delay):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection(*self.upstream)
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, server_writer, self.latency),
+            self._pipe(server_reader, client_writer, 0),
+        )
+
+
+def _server_command(mode, port, threads):
+    if mode == "sync":
+        return [
+            sys.executable, "-m", "gunicorn", "-c", "config/gunicorn/gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}", "--workers", "1", "--threads", str(threads),
+            "app.web_app:app",
+        ]
+    return [
+        sys.executable, "-m", "uvicorn", "app.async_web_app:app",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", "1", "--no-access-log",
+    ]
+
+
+def _wait_ready(port, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/readyz")
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Сервер на порту {port} не ответил за {timeout} с")
+
+
+def _run_load(port, lo, hi, concurrency, requests):
+    """
+    Выполняет requests запросов GET / в concurrency потоков-клиентов.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def run_client(count):
+        nonlocal errors
+        local_latencies, local_errors = [], 0
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                conn.request("GET", f"/?after={random.randint(lo, hi)}")
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            local_latencies.append((time.perf_counter() - started) * 1000)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_client, per_client))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+        },
+    }
+
+
+def _run_mode(mode, args, env, lo, hi):
+    port = _free_port()
+    process = subprocess.Popen(
+        _server_command(mode, port, args.threads), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(port, process)
+        # Прогрев: соединения пула открываются до замера
+        _run_load(port, lo, hi, args.concurrency, args.concurrency)
+        return _run_load(port, lo, hi, args.concurrency, args.requests)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=64, help="Число одновременных клиентов")
+    parser.add_argument("--requests", type=int, default=2000, help="Запросов на вариант")
+    parser.add_argument("--db-latency-ms", type=float, default=20.0, help="Задержка прокси до PostgreSQL, мс")
+    parser.add_argument("--pool-max", type=int, default=64, help="PG_POOL_MAX обоих вариантов")
+    parser.add_argument("--threads", type=int, default=16, help="Потоков синхронного воркера gunicorn")
+    parser.add_argument("--size", type=int, default=10000, help="Размер таблицы contacts")
+    parser.add_argument("--modes", default=",".join(MODES), help="Варианты через запятую: sync,async")
+    parser.add_argument("--dbname", default=os.getenv("BENCH_PG_DB", "contacts_bench"),
+                        help="База для бенчмарка (таблица contacts в ней очищается)")
+    parser.add_argument("--output", default="bench_async.json", help="Файл результатов JSON")
+    parser.add_argument("--seed", type=int, default=12345, help="Seed генератора случайных id")
+    args = parser.parse_args(argv)
+
+    os.environ["PG_DB"] = args.dbname
+    random.seed(args.seed)
+
+    from app import db
+    from app.logger import app_logger
+    from app.migrate import run_migrations
+
+    app_logger.setLevel(logging.WARNING)
+    _ensure_database(args.dbname)
+    run_migrations()
+    lo, hi = _seed(args.size)
+    db.close_pool()
+
+    cfg = db.get_db_config()
+    proxy = LatencyProxy(cfg["host"], cfg["port"], args.db_latency_ms / 1000).start()
+    log_dir = tempfile.mkdtemp(prefix="alvs-bench-logs-")
+    env = dict(
+        os.environ,
+        PG_HOST="127.0.0.1",
+        PG_PORT=str(proxy.port),
+        PG_POOL_MAX=str(args.pool_max),
+        PG_POOL_MIN="1",
+        PG_POOL_TIMEOUT="30",
+        # Журнал пишется фоновым потоком в отдельный каталог: запись файла
+        # в цикле событий или потоке запроса исказила бы замер
+        LOG_QUEUE="1",
+        LOG_DIR=log_dir,
+        DB_SLOW_QUERY_MS="0",
+        GUNICORN_PRELOAD="0",
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    results = []
+    try:
+        for mode in [m for m in args.modes.split(",") if m]:
+            print(f"Вариант {mode}", file=sys.stderr)
+            result = _run_mode(mode, args, env, lo, hi)
+            result["mode"] = mode
+            results.append(result)
+            latency = result["latency_ms"]
+            print(
+                f"  p50={latency['p50']:.1f} p95={latency['p95']:.1f} p99={latency['p99']:.1f} мс, "
+                f"{result['throughput_rps']:.0f} запр/с, ошибок {result['errors']}",
+                file=sys.stderr,
+            )
+    finally:
+        proxy.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "db_latency_ms": args.db_latency_ms,
+            "pool_max": args.pool_max,
+            "threads": args.threads,
+            "size": args.size,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Микробенчмарк накладных расходов логирования на один запрос.
+
+Сравнивает синхронные обработчики (RotatingFileHandler + StreamHandler)
+с режимом очереди (QueueHandler + фоновый поток) и f-строки с ленивым
+форматированием.
+
+Запуск:
+    python -m benchmarks.bench_logging --iterations 20000
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from app.logger import setup_logger, stop_log_listener
+
+
+def _per_request(logger, iterations, lazy, repeats=5):
+    """
+    Возвращает медиану (по повторам) времени одного вызова логгера в микросекундах.
+    """
+    name, email = "Test User", "test@example.com"
+    results = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for i in range(iterations):
+            if lazy:
+                logger.info("Добавлен контакт: name='%s', email='%s', id=%d", name, email, i)
+                logger.debug("Отладка: id=%d", i)
+            else:
+                logger.info(f"Добавлен контакт: name='{name}', email='{email}', id={i}")
+                logger.debug(f"Отладка: id={i}")
+        results.append((time.perf_counter() - started) / iterations * 1e6)
+    return statistics.median(results)
+
+
+def _make_logger(name, log_file, use_queue):
+    logger = setup_logger(name=name, log_file=log_file, use_queue=use_queue)
+    # Консольный вывод заглушаем, чтобы не мерить скорость терминала
+    handlers = logger.handlers
+    if use_queue:
+        handlers = handlers[0].listener.handlers
+    for handler in handlers:
+        if type(handler) is logging.StreamHandler:
+            handler.setStream(io.StringIO())
+    return logger
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+    # Очередь вмещает весь прогон, чтобы мерить запись, а не отбрасывание
+    os.environ.setdefault("LOG_QUEUE_SIZE", str(args.iterations * 10))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            ("sync, f-string", False, False),
+            ("sync, lazy", False, True),
+            ("queue, f-string", True, False),
+            ("queue, lazy", True, True),
+        ]
+        print(f"{'режим':<20}{'мкс/вызов':>12}")
+        for i, (title, use_queue, lazy) in enumerate(cases):
+            logger = _make_logger(f"bench_{i}", os.path.join(tmp, f"bench_{i}.log"), use_queue)
+            cost = _per_request(logger, args.iterations, lazy)
+            print(f"{title:<20}{cost:>12.2f}")
+        stop_log_listener()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Бенчмарк подготовленных операторов и лёгких строк (Contact) слоя app.db.
+
+Заполняет таблицу --size контактами и сравнивает три режима:
+- plain: обычный execute (разбор и планирование на каждом вызове), строки-словари;
+- prepared: PREPARE один раз на соединение и EXECUTE, строки-словари;
+- lean: подготовленные операторы и строки Contact со __slots__.
+
+Для каждого режима измеряются:
+- страницы list_contacts по --page-size строк (--pages вызовов, случайные
+  курсоры): задержка и её разбивка на db-execute (включает разбор и план
+  на сервере) и db-fetch (выборка и построение строк в Python);
+- полная выгрузка get_all_contacts: время и память на строку по tracemalloc.
+
+Внимание: таблица contacts в базе --dbname очищается.
+
+Запуск:
+    python -m benchmarks.bench_statements --size 100000 --pages 2000 --output bench_statements.json
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.bench_web import _ensure_database, _percentile, _seed
+
+MODES = {
+    "plain": {"prepared": "0", "lean": False},
+    "prepared": {"prepared": "1", "lean": False},
+    "lean": {"prepared": "1", "lean": True},
+}
+
+
+def _run_pages(db, timing, lo, hi, pages, page_size, lean):
+    latencies, execute_ms, fetch_ms = [], [], []
+    for _ in range(pages):
+        after = random.randint(lo, hi)
+        request_timing = timing.begin()
+        started = time.perf_counter()
+        db.list_contacts(limit=page_size, after_id=after, use_cache=False, lean=lean)
+        latencies.append((time.perf_counter() - started) * 1000)
+        execute_ms.append(request_timing["db_execute"] * 1000)
+        fetch_ms.append(request_timing["db_fetch"] * 1000)
+        timing.end()
+    latencies.sort()
+    return {
+        "calls": pages,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+        },
+        "execute_ms_mean": round(sum(execute_ms) / len(execute_ms), 4),
+        "fetch_ms_mean": round(sum(fetch_ms) / len(fetch_ms), 4),
+    }
+
+
+def _run_full_listing(db, lean, repeats):
+    # Первый вызов готовит оператор; память меряем на последнем
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        rows = db.get_all_contacts(lean=lean)
+        durations.append((time.perf_counter() - started) * 1000)
+        del rows
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = db.get_all_contacts(lean=lean)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(rows)
+    del rows
+    return {
+        "rows": count,
+        "ms_best": round(min(durations), 2),
+        "ms_mean": round(sum(durations) / len(durations), 2),
+        "bytes_per_row_retained": round((retained - before) / max(count, 1), 1),
+        "bytes_per_row_peak": round((peak - before) / max(count, 1), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100000, help="Размер таблицы contacts")
+    parser.add_argument("--pages", type=int, default=2000, help="Вызовов list_contacts на режим")
+    parser.add_argument("--page-size", type=int, default=200, help="Строк на странице")
+    parser.add_argument("--repeats", type=int, default=5, help="Повторов полной выгрузки на режим")
+    parser.add_argument("--modes", default=",".join(MODES), help="Режимы через запятую: plain,prepared,lean")
+    parser.add_argument("--dbname", default=os.getenv("BENCH_PG_DB", "contacts_bench"),
+                        help="База для бенчмарка (таблица contacts в ней очищается)")
+    parser.add_argument("--output", default="bench_statements.json", help="Файл результатов JSON")
+    parser.add_argument("--seed", type=int, default=12345, help="Seed генератора случайных курсоров")
+    args = parser.parse_args(argv)
+
+    os.environ["PG_DB"] = args.dbname
+    # Одно соединение: каждый оператор готовится ровно один раз
+    os.environ["PG_POOL_MAX"] = "1"
+    os.environ["CONTACTS_CACHE_TTL"] = "0"
+
+    from app import db, timing
+    from app.logger import app_logger
+    from app.migrate import run_migrations
+
+    app_logger.setLevel(logging.WARNING)
+    logging.getLogger("web_app.db").setLevel(logging.ERROR)
+    _ensure_database(args.dbname)
+    run_migrations()
+    lo, hi = _seed(args.size)
+
+    results = []
+    for mode in [m for m in args.modes.split(",") if m]:
+        settings = MODES[mode]
+        os.environ["PG_PREPARED_STATEMENTS"] = settings["prepared"]
+        # Новое соединение: операторы прошлого режима не в счёт
+        db.close_pool()
+        random.seed(args.seed)
+        print(f"Режим {mode}", file=sys.stderr)
+        pages = _run_pages(db, timing, lo, hi, args.pages, args.page_size, settings["lean"])
+        listing = _run_full_listing(db, settings["lean"], args.repeats)
+        results.append({"mode": mode, "pages": pages, "full_listing": listing})
+        print(
+            f"  страницы: p50={pages['latency_ms']['p50']:.3f} мс (execute {pages['execute_ms_mean']:.3f}, "
+            f"fetch {pages['fetch_ms_mean']:.3f}); выгрузка {listing['rows']} строк: "
+            f"{listing['ms_best']:.1f} мс, {listing['bytes_per_row_retained']:.0f} байт/строку",
+            file=sys.stderr,
+        )
+    db.close_pool()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "size": args.size,
+            "pages": args.pages,
+            "page_size": args.page_size,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Нагрузочный бенчмарк веб-приложения и слоя БД.
+
+Для каждого размера таблицы (по умолчанию 1k, 100k и 1M контактов) заполняет
+отдельную базу PostgreSQL синтетическими данными через COPY, затем гоняет
+маршруты /, /add, /edit и /delete приложения create_app() в несколько
+потоков-клиентов. Для каждого маршрута считает p50/p95/p99 задержки,
+пропускную способность и время в БД (из заголовка Server-Timing).
+
+Результаты пишутся в JSON. С --baseline прогон сравнивается с прошлым
+результатом и завершается с кодом 1, если p95 какого-либо маршрута
+вырос больше чем на --threshold.
+
+Внимание: таблица contacts в базе --dbname очищается перед каждым размером.
+
+Запуск:
+    python -m benchmarks.bench_web --sizes 1000,100000 --clients 8 --output bench.json
+    python -m benchmarks.bench_web --baseline bench.json --threshold 0.2
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+ROUTES = ("/", "/add", "/edit", "/delete")
+DEFAULT_SIZES = "1000,100000,1000000"
+
+
+def _percentile(sorted_values, q):
+    """
+    Процентиль по методу ближайшего ранга (значения уже отсортированы).
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def _db_time_ms(response):
+    """
+    Время в БД из заголовка Server-Timing (метрика db) в миллисекундах.
+    """
+    for part in response.headers.get("Server-Timing", "").split(","):
+        fields = part.strip().split(";")
+        if fields[0] == "db":
+            for field in fields[1:]:
+                if field.startswith("dur="):
+                    return float(field[4:])
+    return 0.0
+
+
+def _ensure_database(dbname):
+    from app import db
+
+    config = dict(db.get_db_config(), dbname="postgres")
+    conn = psycopg2.connect(**config)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (dbname,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{dbname}";')
+    finally:
+        conn.close()
+
+
+def _seed(size):
+    """
+    Очищает таблицу и загружает size синтетических контактов. Возвращает их id.
+    """
+    from app import db
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE contacts RESTART IDENTITY;")
+        conn.commit()
+    rows = ((f"Bench User {i}", f"bench{i}@example.com") for i in range(size))
+    started = time.perf_counter()
+    db.copy_contacts(rows)
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE contacts;")
+            cur.execute("SELECT min(id) AS lo, max(id) AS hi FROM contacts;")
+            bounds = cur.fetchone()
+        conn.commit()
+    print(f"  загружено {size} контактов за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+    return bounds["lo"], bounds["hi"]
+
+
+class _Workload:
+    """
+    Генерирует запросы к маршрутам. Удаляемые id не повторяются между клиентами.
+    """
+
+    def __init__(self, lo, hi, requests):
+        self.lo, self.hi = lo, hi
+        self._lock = threading.Lock()
+        self._delete_ids = iter(range(hi, max(lo, hi - requests) - 1, -1))
+        self._counter = 0
+
+    def next_delete_id(self):
+        with self._lock:
+            return next(self._delete_ids, self.lo)
+
+    def next_number(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def call(self, client, route):
+        if route == "/":
+            # Половина запросов — первая страница, половина — страница в середине таблицы
+            after = random.choice([None, random.randint(self.lo, self.hi)])
+            return client.get("/", query_string={"after": after} if after else None)
+        if route == "/add":
+            n = self.next_number()
+            return client.post("/add", data={"name": f"Added {n}", "email": f"added{n}@example.com"})
+        if route == "/edit":
+            contact_id = random.randint(self.lo, self.hi)
+            return client.post(
+                f"/edit/{contact_id}", data={"name": f"Edited {contact_id}", "email": f"edited{contact_id}@example.com"}
+            )
+        return client.post(f"/delete/{self.next_delete_id()}")
+
+
+def _run_route(app, workload, route, clients, requests):
+    """
+    Выполняет requests запросов к маршруту в clients потоков.
+    """
+    latencies, db_times = [], []
+    errors = 0
+    lock = threading.Lock()
+    per_client = [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+
+    def run_client(count):
+        nonlocal errors
+        local_latencies, local_db, local_errors = [], [], 0
+        client = app.test_client()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = workload.call(client, route)
+            local_latencies.append((time.perf_counter() - started) * 1000)
+            local_db.append(_db_time_ms(response))
+            if response.status_code >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            db_times.extend(local_db)
+            errors += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(run_client, per_client))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    db_times.sort()
+    return {
+        "route": route,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+        },
+        "db_ms": {
+            "p50": round(_percentile(db_times, 50), 3),
+            "p95": round(_percentile(db_times, 95), 3),
+            "mean": round(sum(db_times) / len(db_times), 3),
+        },
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Возвращает список регрессий: p95 вырос больше чем на threshold (доля).
+    """
+    previous = {(r["size"], r["route"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result["size"], result["route"]))
+        if old is None:
+            continue
+        old_p95, new_p95 = old["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        if old_p95 > 0 and new_p95 > old_p95 * (1 + threshold):
+            regressions.append(
+                f"{result['route']} @ {result['size']}: p95 {old_p95:.2f} -> {new_p95:.2f} мс "
+                f"(+{(new_p95 / old_p95 - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Размеры таблицы через запятую")
+    parser.add_argument("--clients", type=int, default=4, help="Число параллельных клиентов")
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на маршрут")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="Маршруты через запятую")
+    parser.add_argument("--dbname", default=os.getenv("BENCH_PG_DB", "contacts_bench"),
+                        help="База для бенчмарка (таблица contacts в ней очищается)")
+    parser.add_argument("--output", default="bench_web.json", help="Файл результатов JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимый рост p95 (0.2 = 20%%)")
+    parser.add_argument("--seed", type=int, default=12345, help="Seed генератора случайных id")
+    args = parser.parse_args(argv)
+
+    # Подключение настраивается до первого обращения к пулу
+    os.environ["PG_DB"] = args.dbname
+    os.environ.setdefault("PG_POOL_MAX", str(max(5, args.clients)))
+    random.seed(args.seed)
+
+    from app import db
+    from app.logger import app_logger
+    from app.migrate import run_migrations
+    from app.web_app import create_app
+
+    # Журнал каждого запроса в консоль искажает замеры
+    app_logger.setLevel(logging.WARNING)
+    _ensure_database(args.dbname)
+    run_migrations()
+    app = create_app()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    routes = [r for r in args.routes.split(",") if r]
+    results = []
+    for size in sizes:
+        print(f"Размер таблицы: {size}", file=sys.stderr)
+        lo, hi = _seed(size)
+        workload = _Workload(lo, hi, args.requests)
+        for route in routes:
+            result = _run_route(app, workload, route, args.clients, args.requests)
+            result["size"] = size
+            results.append(result)
+            latency = result["latency_ms"]
+            print(
+                f"  {route:<8} p50={latency['p50']:.2f} p95={latency['p95']:.2f} p99={latency['p99']:.2f} мс, "
+                f"{result['throughput_rps']:.0f} запр/с, БД p50={result['db_ms']['p50']:.2f} мс, "
+                f"ошибок {result['errors']}",
+                file=sys.stderr,
+            )
+    db.close_pool()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "clients": args.clients,
+            "requests_per_route": args.requests,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("Регрессии производительности:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print("Регрессий нет", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Конфигурация gunicorn для приложения.
+
+Запуск: gunicorn -c config/gunicorn/gunicorn.conf.py app.web_app:app
+
+Число воркеров и потоков считается по лимитам cgroup (v2 или v1) контейнера,
+а не по числу ядер узла: при limits.cpu=500m четыре процесса лишь делили бы
+пол-ядра, держа каждый свою память и свои соединения с БД. Любое значение
+можно задать явно переменными GUNICORN_*.
+"""
+import math
+import os
+import shutil
+
+CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+# Ожидаемая память одного воркера и доля лимита памяти, отдаваемая воркерам
+WORKER_MEMORY_MB = int(os.getenv("GUNICORN_WORKER_MEMORY_MB", "128"))
+MEMORY_FRACTION = 0.75
+# Сколько потоков-обработчиков держать на под суммарно (делятся между воркерами)
+TOTAL_THREADS = int(os.getenv("GUNICORN_TOTAL_THREADS", "16"))
+# Лимит памяти cgroup v1 без ограничения — огромное число, а не "max"
+_CGROUP_V1_UNLIMITED = 1 << 60
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def cpu_limit(root=CGROUP_ROOT, cpus=None):
+    """
+    Сколько ядер доступно процессу: квота CFS из cgroup, иначе число CPU.
+    """
+    cpus = cpus or _available_cpus()
+    cpu_max = _read(os.path.join(root, "cpu.max"))
+    if cpu_max:
+        # cgroup v2: "<квота> <период>" или "max <период>"
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            return min(cpus, int(quota) / int(period or 100000))
+        return cpus
+    for controller in ("cpu", "cpu,cpuacct"):
+        quota = _read(os.path.join(root, controller, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(root, controller, "cpu.cfs_period_us"))
+        if quota and period and int(quota) > 0:
+            return min(cpus, int(quota) / int(period))
+    return cpus
+
+
+def memory_limit(root=CGROUP_ROOT):
+    """
+    Лимит памяти cgroup в байтах или None, если он не задан.
+    """
+    value = _read(os.path.join(root, "memory.max"))
+    if value is None:
+        value = _read(os.path.join(root, "memory", "memory.limit_in_bytes"))
+    if not value or value == "max" or int(value) >= _CGROUP_V1_UNLIMITED:
+        return None
+    return int(value)
+
+
+def default_workers(cpus: float, memory: int = None) -> int:
+    """
+    Воркеров не больше, чем ядер по квоте (с округлением вверх), и столько,
+    сколько помещается в долю лимита памяти.
+    """
+    workers = max(1, math.ceil(cpus))
+    if memory:
+        workers = min(workers, max(1, int(memory * MEMORY_FRACTION) // (WORKER_MEMORY_MB * 1024 * 1024)))
+    return workers
+
+
+def default_threads(worker_class_name: str, workers_count: int) -> int:
+    if worker_class_name != "gthread":
+        return 1
+    return max(4, math.ceil(TOTAL_THREADS / workers_count))
+
+
+def _multiproc_dir():
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def _prepare_multiproc_dir():
+    # Метрики предыдущего запуска не должны попасть в суммы нового. Каталог
+    # готовится при чтении конфигурации: с preload_app приложение (и
+    # prometheus_client, сразу создающий файлы) импортируется до on_starting.
+    # Повторное чтение конфигурации по SIGHUP каталог работающих воркеров не трогает
+    path = _multiproc_dir()
+    marker = "_GUNICORN_MULTIPROC_PREPARED"
+    if path and os.environ.get(marker) != str(os.getpid()):
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        os.environ[marker] = str(os.getpid())
+
+
+_prepare_multiproc_dir()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+_cpus = cpu_limit()
+_memory = memory_limit()
+workers = int(os.getenv("GUNICORN_WORKERS") or default_workers(_cpus, _memory))
+# Потоки нужны для /events: каждый SSE-клиент занимает поток на время соединения
+# (до SSE_MAX_SECONDS, затем браузер переподключается). Чтобы подписчики не
+# заняли все потоки и не остановили обычные запросы, SSE-потоков в воркере не
+# больше SSE_MAX_STREAMS (по умолчанию — половина потоков), лишние получают 503
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS") or default_threads(worker_class, workers))
+# Приложение читает предел при импорте: в мастере (preload_app) или в воркере
+os.environ.setdefault("SSE_MAX_STREAMS", str(max(1, threads // 2)))
+# create_app() и импорт модулей выполняются один раз в мастере, воркеры
+# получают их после fork(). Пул соединений, потоки логирования и уведомлений
+# привязаны к PID и создаются в каждом воркере заново
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "no")
+# Воркер перезапускается после стольких запросов (против медленных утечек памяти);
+# разброс, чтобы воркеры не перезапускались одновременно
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Файл heartbeat воркеров — в памяти: запись на overlayfs контейнера может
+# подвисать и приводить к ложным таймаутам
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    server.log.info(
+        "CPU по квоте: %.2f, лимит памяти: %s; воркеров: %d (%s, потоков: %d), preload_app=%s",
+        _cpus, f"{_memory // (1024 * 1024)} МиБ" if _memory else "нет",
+        workers, worker_class, threads, preload_app,
+    )
+
+
+def post_fork(server, worker):
+    # Пул, реплики и потоки логирования сбрасываются после fork() в app.db и
+    # app.logger (os.register_at_fork); здесь воркер заранее открывает
+    # PG_POOL_MIN соединений, чтобы первые запросы не ждали подключения
+    from app import db, metrics
+
+    if not db.get_pool_config()["enabled"]:
+        return
+    try:
+        db.get_pool().prefill()
+    except Exception as e:
+        server.log.warning("Воркер %s: не удалось открыть соединения пула: %s", worker.pid, e)
+    metrics.update_pool_metrics(db.pool_stats())
+
+
+def worker_exit(server, worker):
+    # Дописываем очередь отложенной записи и логи и закрываем соединения
+    # воркера, пока процесс ещё жив
+    from app import db, notify, write_behind
+    from app.logger import stop_log_listener
+
+    notify.stop_listener()
+    write_behind.stop()
+    db.close_pool()
+    stop_log_listener()
+
+
+def child_exit(server, worker):
+    # Live-gauge завершившегося воркера больше не должны учитываться в /metrics.
+    # Файлы счётчиков и гистограмм остаются: их значения накопительные
+    if _multiproc_dir():
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,124 @@
+"""
+Тесты контроля допуска (без PostgreSQL).
+"""
+import threading
+
+from flask import Flask
+
+from app import admission, timing
+
+
+def _config(**overrides):
+    cfg = {
+        "max_inflight": 1,
+        "queue_size": 0,
+        "queue_timeout": 0.01,
+        "retry_after": 2,
+        "rate": 0,
+        "burst": 1,
+        "client_header": "",
+        "max_clients": 100,
+        "adaptive": False,
+        "target_db": 0.05,
+        "min_inflight": 1,
+        "adjust_interval": 1,
+    }
+    cfg.update(overrides)
+    return cfg
+
+
+def test_limiter_queue_and_timeout():
+    limiter = admission.ConcurrencyLimiter(1, queue_size=1, queue_timeout=0.05)
+    assert limiter.acquire() == (None, 0.0)
+
+    # Место освобождается, пока запрос ждёт в очереди
+    threading.Timer(0.01, limiter.release).start()
+    reason, waited = limiter.acquire()
+    assert reason is None and waited > 0
+
+    reason, waited = limiter.acquire()
+    assert reason == "queue_timeout" and waited >= 0.05
+
+    limiter.queue_size = 0
+    assert limiter.acquire()[0] == "queue_full"
+
+
+def test_token_buckets_per_client():
+    now = [0.0]
+    buckets = admission.TokenBuckets(rate=2, burst=2, clock=lambda: now[0])
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0.5]
+    assert buckets.take("b") == 0
+    now[0] += 0.5
+    assert buckets.take("a") == 0
+
+
+def test_adaptive_limit_follows_db_latency():
+    now = [0.0]
+    limiter = admission.ConcurrencyLimiter(8, 0, 0)
+    adaptive = admission.AdaptiveLimit(limiter, 2, 8, target=0.05, interval=1, clock=lambda: now[0])
+    now[0] = 1
+    adaptive.observe(0.2, 2)
+    assert limiter.limit == 6
+    now[0] = 2
+    adaptive.observe(0.01, 1)
+    assert limiter.limit == 7
+    # Запросы без операций БД не влияют на предел
+    now[0] = 3
+    adaptive.observe(0.0, 0)
+    assert limiter.limit == 7
+
+
+def _app(cfg):
+    app = Flask(__name__)
+    started = threading.Event()
+    release = threading.Event()
+
+    @app.before_request
+    def begin():
+        timing.begin()
+
+    @app.teardown_request
+    def end(exc):
+        timing.end()
+
+    @app.route("/slow")
+    def slow():
+        started.set()
+        release.wait(5)
+        return "ok"
+
+    @app.route("/fast")
+    def fast():
+        return "ok"
+
+    @app.route("/healthz")
+    def healthz():
+        return "ok"
+
+    admission.install(app, exempt={"healthz"}, config=cfg)
+    return app, started, release
+
+
+def test_overload_returns_503_with_retry_after():
+    app, started, release = _app(_config())
+    slow = threading.Thread(target=lambda: app.test_client().get("/slow"))
+    slow.start()
+    try:
+        assert started.wait(5)
+        resp = app.test_client().get("/fast")
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"] == "2"
+        assert app.test_client().get("/healthz").status_code == 200
+    finally:
+        release.set()
+        slow.join()
+    assert app.test_client().get("/fast").status_code == 200
+
+
+def test_rate_limit_returns_429():
+    app, _, _ = _app(_config(max_inflight=0, rate=1, burst=2))
+    client = app.test_client()
+    statuses = [client.get("/fast").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert int(client.get("/fast").headers["Retry-After"]) >= 1
+    assert client.get("/fast", environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
@@ -0,0 +1,64 @@
+"""
+Тесты ASGI-варианта приложения (app.async_web_app) и слоя app.async_db.
+Тест маршрутов требует наличия настроенной PostgreSQL БД.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("quart")
+
+from app import async_db  # noqa: E402
+from app.db import get_connection, init_db  # noqa: E402
+
+
+@pytest.fixture(scope="function")
+def setup_db():
+    init_db()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE contacts RESTART IDENTITY;")
+        conn.commit()
+    yield
+
+
+def test_async_routes(setup_db):
+    """Добавление, список, поиск, изменение и удаление через ASGI-приложение."""
+    from app.async_web_app import create_app
+
+    async def scenario():
+        app = create_app()
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+
+            response = await client.post("/add", form={"name": "Async User", "email": "async@example.com"})
+            assert response.status_code == 302
+            response = await client.post("/add", form={"name": "Async User", "email": "async@example.com"})
+            assert response.status_code == 302
+
+            response = await client.get("/")
+            body = await response.get_data(as_text=True)
+            assert response.status_code == 200
+            assert "async@example.com" in body
+            assert "Такой контакт уже есть" in body
+            assert response.headers["Server-Timing"].startswith("db;dur=")
+
+            response = await client.get("/search", query_string={"q": "as"})
+            assert "async@example.com" in await response.get_data(as_text=True)
+
+            contact = (await async_db.list_contacts())["contacts"][0]
+            await client.post(f"/edit/{contact['id']}", form={"name": "Renamed", "email": "renamed@example.com"})
+            assert (await async_db.get_contact(contact["id"]))["name"] == "Renamed"
+
+            await client.post(f"/delete/{contact['id']}")
+            assert await async_db.count_contacts() == 0
+
+            response = await client.get("/readyz")
+            assert response.status_code == 200
+            assert (await response.get_json())["checks"]["database"]["ok"] is True
+
+            response = await client.get("/metrics")
+            assert 'path="/add"' in await response.get_data(as_text=True)
+
+    asyncio.run(scenario())
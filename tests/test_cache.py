@@ -0,0 +1,62 @@
+"""
+Тесты кэша чтения контактов.
+"""
+import time
+
+from app.cache import TTLCache
+
+
+def test_disabled_cache_always_loads():
+    cache = TTLCache(ttl=0)
+    calls = []
+    cache.get_or_load("k", lambda: calls.append(1) or [])
+    cache.get_or_load("k", lambda: calls.append(1) or [])
+    assert len(calls) == 2
+
+
+def test_hit_until_ttl_expires():
+    cache = TTLCache(ttl=0.05)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return [{"id": 1}]
+
+    assert cache.get_or_load("k", loader) == [{"id": 1}]
+    cache.get_or_load("k", loader)
+    assert len(calls) == 1
+    time.sleep(0.06)
+    cache.get_or_load("k", loader)
+    assert len(calls) == 2
+
+
+def test_invalidate_drops_entries():
+    cache = TTLCache(ttl=60)
+    cache.get_or_load("k", lambda: [1])
+    cache.invalidate()
+    assert cache.get_or_load("k", lambda: [2]) == [2]
+
+
+def test_read_started_before_write_is_not_cached():
+    cache = TTLCache(ttl=60)
+
+    def stale_loader():
+        # Запись в БД завершилась, пока шло чтение
+        cache.invalidate()
+        return ["stale"]
+
+    assert cache.get_or_load("k", stale_loader) == ["stale"]
+    assert cache.get_or_load("k", lambda: ["fresh"]) == ["fresh"]
+
+
+def test_lru_and_row_limits():
+    cache = TTLCache(ttl=60, max_entries=2, max_rows=5)
+    cache.get_or_load("a", lambda: [1])
+    cache.get_or_load("b", lambda: [1])
+    cache.get_or_load("a", lambda: [1])  # "a" становится самым свежим
+    cache.get_or_load("c", lambda: [1])
+    assert cache.get_or_load("a", lambda: ["reloaded"]) == [1]
+    assert cache.get_or_load("b", lambda: ["reloaded"]) == ["reloaded"]
+
+    cache.get_or_load("big", lambda: [0] * 4)
+    assert cache.stats()["rows"] <= 5
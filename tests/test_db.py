@@ -2,8 +2,12 @@
 Тесты для работы с базой данных PostgreSQL.
 Эти тесты требуют наличия настроенной PostgreSQL БД.
 """
+import io
+import os
+import time
+
 import pytest
-from app.db import init_db, get_all_contacts, add_contact, update_contact, delete_contact
+from app.db import init_db, get_all_contacts, list_contacts, add_contact, update_contact, delete_contact
 
 
 @pytest.fixture(scope="function")
@@ -12,6 +16,12 @@ def setup_db():
     Фикстура для инициализации БД перед каждым тестом.
     """
     init_db()
+    # Email уникален, поэтому каждый тест начинает с пустой таблицы
+    from app.db import get_connection
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE contacts RESTART IDENTITY;")
+        conn.commit()
     yield
     # Очистка после теста (опционально)
     # Можно добавить очистку таблицы, если нужно
@@ -109,3 +119,409 @@ def test_delete_contact(setup_db):
             break
     
     assert deleted_contact is None
+
+
+def test_list_contacts_keyset_pagination(setup_db):
+    """Тест постраничной выборки и фильтра по префиксу."""
+    for i in range(3):
+        add_contact(f"Page User {i}", f"page{i}@example.com")
+
+    first = list_contacts(limit=2, email_prefix="page")
+    assert len(first["contacts"]) == 2
+    assert first["next_after"] is not None
+
+    second = list_contacts(limit=2, after_id=first["next_after"], email_prefix="page")
+    ids_first = {c["id"] for c in first["contacts"]}
+    assert ids_first.isdisjoint(c["id"] for c in second["contacts"])
+    assert second["prev_before"] == second["contacts"][0]["id"]
+
+    back = list_contacts(limit=2, before_id=second["prev_before"], email_prefix="page")
+    assert [c["id"] for c in back["contacts"]][-1] < second["prev_before"]
+
+
+def test_search_contacts(setup_db):
+    """Тест поиска: короткий запрос по началу строки, длинный — по подстроке с ранжированием."""
+    from app.db import search_contacts
+
+    add_contact("Zq Search", "zq-search@example.com")
+    short = search_contacts("zq", use_cache=False)
+    assert any(c["email"] == "zq-search@example.com" for c in short["contacts"])
+
+    add_contact("Another Zqsearch", "another@example.com")
+    result = search_contacts("zq search", limit=1, use_cache=False)
+    assert result["contacts"][0]["name"] == "Zq Search"
+    found = search_contacts("search", use_cache=False)
+    assert {c["name"] for c in found["contacts"]} >= {"Zq Search", "Another Zqsearch"}
+
+
+def test_search_without_trigram_uses_like(setup_db, monkeypatch):
+    """Без pg_trgm длинный запрос ищется по подстроке, начало строки — выше."""
+    from app import db
+
+    monkeypatch.setattr(db, "_trigram", {"available": False, "checked": time.monotonic()})
+    add_contact("My Searchable", "my@example.com")
+    add_contact("Searchable First", "first@example.com")
+    found = db.search_contacts("searchable", use_cache=False)
+    assert [c["name"] for c in found["contacts"]] == ["Searchable First", "My Searchable"]
+    assert db.search_contacts("serchable", use_cache=False)["contacts"] == []
+
+
+def test_count_and_window(setup_db):
+    """Тест подсчёта контактов и выборки окна по позиции."""
+    from app.db import count_contacts, get_contacts_window
+
+    for i in range(3):
+        add_contact(f"Window User {i}", f"window{i}@example.com")
+    total = count_contacts()
+    assert total >= 3
+    window = get_contacts_window(offset=total - 2, limit=5)
+    assert [c["email"] for c in window] == ["window1@example.com", "window2@example.com"]
+
+
+def test_change_notifications(setup_db):
+    """Тест уведомлений LISTEN/NOTIFY о добавлении, изменении и удалении."""
+    from app import notify
+
+    listener = notify.get_listener()
+    assert listener.wait_connected(timeout=5)
+    subscription = notify.subscribe()
+    try:
+        # Строки дочитываются после уведомления, поэтому ждём каждое событие
+        contact_id = add_contact("Notify User", "notify@example.com")
+        events = [subscription.get(timeout=5)]
+        update_contact(contact_id, "Notify User 2", "notify@example.com")
+        events.append(subscription.get(timeout=5))
+        delete_contact(contact_id)
+        events.append(subscription.get(timeout=5))
+    finally:
+        subscription.close()
+        notify.stop_listener()
+
+    assert [e["op"] for e in events] == ["insert", "update", "delete"]
+    assert events[0]["contacts"][0]["name"] == "Notify User"
+    assert events[1]["contacts"][0]["name"] == "Notify User 2"
+    assert events[2]["ids"] == [contact_id]
+
+
+def test_apply_batch_single_transaction(setup_db):
+    """Тест пакета операций: группировка по типу, результаты по каждой операции, откат при ошибке."""
+    import psycopg2
+    from app.db import apply_batch, get_contact
+
+    first = add_contact("Batch User", "batch@example.com")
+    results = apply_batch([
+        {"op": "create", "name": "Batch A", "email": "batch-a@example.com"},
+        {"op": "create", "name": "Batch B", "email": "batch-b@example.com"},
+        {"op": "update", "id": first, "name": "Batch User 2", "email": "batch@example.com"},
+        {"op": "update", "id": first, "name": "Batch User 3", "email": "batch@example.com"},
+        {"op": "delete", "id": first},
+        {"op": "delete", "id": first},
+    ])
+    assert [r["status"] for r in results] == ["created", "created", "updated", "updated", "deleted", "not_found"]
+    assert results[0]["id"] < results[1]["id"]
+    assert get_contact(results[1]["id"])["name"] == "Batch B"
+    assert get_contact(first) is None
+
+    # Повтор создания: как upsert_contact — unchanged без перезаписи строки
+    again = apply_batch([
+        {"op": "create", "name": "Batch A", "email": " BATCH-A@example.com"},
+        {"op": "create", "name": "Batch B 2", "email": "batch-b@example.com"},
+        {"op": "create", "name": "Batch C", "email": "batch-c@example.com"},
+    ])
+    assert [(r["id"], r["status"]) for r in again][:2] == [
+        (results[0]["id"], "updated"), (results[1]["id"], "updated"),
+    ]
+    assert again[2]["status"] == "created"
+    version = get_contact(results[0]["id"])["row_version"]
+    again = apply_batch([{"op": "create", "name": "Batch A", "email": " BATCH-A@example.com"}])
+    assert again == [{"op": "create", "id": results[0]["id"], "status": "unchanged"}]
+    assert get_contact(results[0]["id"])["row_version"] == version
+
+    with pytest.raises(psycopg2.Error):
+        apply_batch([
+            {"op": "create", "name": "Rolled Back", "email": "rollback@example.com"},
+            {"op": "create", "name": None, "email": "null@example.com"},
+        ])
+    assert not any(c["email"] == "rollback@example.com" for c in get_all_contacts())
+
+    # Изменение email на занятый другим контактом откатывает весь пакет
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        apply_batch([
+            {"op": "create", "name": "Rolled Back", "email": "rollback@example.com"},
+            {"op": "update", "id": results[1]["id"], "name": "Batch B", "email": " BATCH-A@example.com"},
+        ])
+    assert not any(c["email"] == "rollback@example.com" for c in get_all_contacts())
+
+
+def test_upsert_contact_is_idempotent(setup_db):
+    """Тест upsert по нормализованному email."""
+    import psycopg2
+    from app.db import upsert_contact
+
+    contact_id, status = upsert_contact("Upsert User", "upsert@example.com")
+    assert status == "created"
+    assert upsert_contact("Upsert User", "upsert@example.com") == (contact_id, "unchanged")
+    assert upsert_contact("Upsert User 2", " Upsert@Example.com") == (contact_id, "updated")
+    assert [c["name"] for c in get_all_contacts()] == ["Upsert User 2"]
+
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        add_contact("Duplicate", "UPSERT@example.com")
+
+
+def test_import_merges_duplicates(setup_db):
+    """Тест импорта: повторы в файле и уже существующие email сливаются."""
+    from app.importer import import_stream
+
+    add_contact("Existing", "existing@example.com")
+    data = "name,email\nFirst,dup@example.com\nSecond,DUP@example.com\nRenamed,existing@example.com\n"
+    reports = [import_stream(io.BytesIO(data.encode("utf-8")), "csv") for _ in range(2)]
+    # Повтор внутри файла сливается, повторный импорт ничего не меняет
+    assert [(r["read"], r["imported"]) for r in reports] == [(3, 2), (3, 0)]
+    contacts = {c["email"].lower(): c["name"] for c in get_all_contacts()}
+    assert contacts == {"existing@example.com": "Renamed", "dup@example.com": "Second"}
+
+
+def test_dedup_merges_existing_duplicates(setup_db):
+    """Тест разового слияния дублей (без уникального индекса)."""
+    from app import dedup
+    from app.db import get_connection
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP INDEX contacts_email_unique_idx;")
+        conn.commit()
+    try:
+        first = add_contact("Old", "same@example.com")
+        add_contact("Other", "other@example.com")
+        add_contact("New", " SAME@example.com")
+        assert dedup.find_duplicate_groups() == [[first, first + 2]]
+        assert dedup.merge_groups(dedup.find_duplicate_groups()) == 1
+        assert {c["id"]: c["name"] for c in get_all_contacts()} == {first: "New", first + 1: "Other"}
+    finally:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS contacts_email_unique_idx ON contacts (lower(btrim(email)));")
+            conn.commit()
+
+
+def test_copy_import_stream(setup_db):
+    """Тест потокового импорта через COPY."""
+    from app.importer import import_stream
+
+    data = "name,email\nCopy User,copy@example.com\nBroken,broken\n".encode("utf-8")
+    report = import_stream(io.BytesIO(data), "csv")
+    assert report["imported"] == 1
+    assert report["rejected"] == 1
+    assert any(c["email"] == "copy@example.com" for c in get_all_contacts())
+
+
+def test_export_server_cursor_and_copy(setup_db):
+    """Тест выгрузки через серверный курсор и COPY TO STDOUT."""
+    from app.db import copy_contacts_out, iter_contacts
+
+    add_contact("Export User", "export@example.com")
+    streamed = list(iter_contacts(batch_size=1))
+    assert any(c["email"] == "export@example.com" for c in streamed)
+
+    copied = b"".join(copy_contacts_out(chunk_size=16)).decode("utf-8")
+    assert copied.startswith("id,name,email")
+    assert "export@example.com" in copied
+
+
+def test_contact_versions_change_on_write(setup_db):
+    """Тест версий для ETag: версия страницы и row_version строки."""
+    from app.db import get_contact, get_page_version
+
+    first = add_contact("Version First", "version-first@example.com")
+    version = get_page_version(limit=10)
+    assert get_page_version(limit=10) == version
+    contact_id = add_contact("Version User", "version@example.com")
+    assert get_page_version(limit=10) != version
+    # Строки за пределами страницы её версию не меняют
+    other_page = get_page_version(limit=1)
+    add_contact("Version Later", "version-later@example.com")
+    assert get_page_version(limit=1) == other_page
+    # Перед курсором пусто — версия первой страницы, как и у list_contacts
+    assert get_page_version(limit=1, before_id=first) == get_page_version(limit=1)
+
+    version = get_page_version(limit=10)
+    before = get_contact(contact_id)["row_version"]
+    assert update_contact(contact_id, "Version User 2", "version@example.com")
+    assert get_contact(contact_id)["row_version"] != before
+    assert get_page_version(limit=10) != version
+    version = get_page_version(limit=10)
+    assert delete_contact(contact_id)
+    assert get_page_version(limit=10) != version
+    assert get_contact(contact_id) is None
+
+
+@pytest.mark.skipif(not os.getenv("PG_TEST_REPLICA_HOSTS"), reason="нужна потоковая реплика (PG_TEST_REPLICA_HOSTS)")
+def test_replica_reads_see_own_writes(setup_db, monkeypatch):
+    """Тест чтения с реплики: своя запись видна сразу, потом чтение уходит на реплику."""
+    from prometheus_client import REGISTRY
+    from app import db
+
+    monkeypatch.setenv("PG_REPLICA_HOSTS", os.environ["PG_TEST_REPLICA_HOSTS"])
+    db.close_replicas()
+    token = db._session_lsn.set(0)
+    try:
+        replica_set = db.get_replicas()
+        contact_id = add_contact("Replica User", "replica@example.com")
+        assert db.get_session_lsn()
+        assert db.get_contact(contact_id)["name"] == "Replica User"
+
+        deadline = time.monotonic() + 10
+        while replica_set.choose(db._session_lsn.get()) is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+        replica_reads = REGISTRY.get_sample_value("db_reads_total", {"target": "replica"}) or 0
+        assert db.get_contact(contact_id)["name"] == "Replica User"
+        assert REGISTRY.get_sample_value("db_reads_total", {"target": "replica"}) == replica_reads + 1
+    finally:
+        db.close_replicas()
+        db._session_lsn.reset(token)
+
+
+def test_operations_are_timed(setup_db, caplog):
+    """Тест учёта времени операций и лога медленных запросов."""
+    from app import db, timing
+
+    request_timing = timing.begin()
+    try:
+        add_contact("Timed User", "timed@example.com")
+        list_contacts(limit=5, use_cache=False)
+    finally:
+        timing.end()
+    assert request_timing["db_ops"] == 2
+    assert request_timing["db_execute"] > 0
+
+    old_threshold = db.SLOW_QUERY_MS
+    db.SLOW_QUERY_MS = 0.000001
+    try:
+        with caplog.at_level("WARNING", logger="web_app.db"):
+            get_all_contacts()
+    finally:
+        db.SLOW_QUERY_MS = old_threshold
+    assert "get_all_contacts" in caplog.text
+
+
+def test_migrations_are_idempotent(setup_db):
+    """Повторный запуск миграций ничего не применяет."""
+    from app.migrate import migration_status, run_migrations
+
+    assert run_migrations() == []
+    assert all(state != "pending" for _, _, state in migration_status())
+
+
+def test_check_schema_reports_pending_migrations(setup_db, tmp_path):
+    """Проверка схемы не применяет миграции, а сообщает о неприменённых."""
+    import shutil
+
+    from app.migrate import MIGRATIONS_DIR, SchemaOutdatedError, check_schema
+
+    check_schema()
+    shutil.copytree(MIGRATIONS_DIR, tmp_path, dirs_exist_ok=True)
+    (tmp_path / "9002_pending.sql").write_text("SELECT 1;\n", encoding="utf-8")
+    with pytest.raises(SchemaOutdatedError, match="9002_pending"):
+        check_schema(str(tmp_path))
+
+
+def test_migration_requiring_missing_extension_is_skipped(setup_db, tmp_path):
+    """Миграция с недоступным расширением пропускается и не считается ожидающей."""
+    from app.migrate import check_schema, load_migrations, run_migrations
+
+    (tmp_path / "9003_optional.sql").write_text(
+        "-- migrate:requires-extension alvs_no_such_extension\nCREATE EXTENSION alvs_no_such_extension;\n",
+        encoding="utf-8",
+    )
+    (migration,) = load_migrations(str(tmp_path))
+    assert migration.required_extension == "alvs_no_such_extension"
+    assert run_migrations(str(tmp_path)) == []
+    check_schema(str(tmp_path))
+
+
+def test_migration_waiter_does_not_block_concurrent_index(setup_db, tmp_path, monkeypatch):
+    """Процесс, ждущий блокировку миграций, не мешает CREATE INDEX CONCURRENTLY владельца."""
+    import threading
+
+    from app import db, migrate
+
+    monkeypatch.setattr(migrate, "LOCK_POLL_SECONDS", 0.05)
+    (tmp_path / "9001_noop.sql").write_text("SELECT 1;\n", encoding="utf-8")
+    holder = db._connect()
+    holder.autocommit = True
+    result = {}
+    try:
+        with holder.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (migrate.LOCK_KEY,))
+        waiter = threading.Thread(target=lambda: result.update(applied=migrate.run_migrations(str(tmp_path))))
+        waiter.start()
+        time.sleep(0.3)
+        with holder.cursor() as cur:
+            cur.execute("SET lock_timeout = '5s';")
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS contacts_migrate_test_idx ON contacts (name);")
+            cur.execute("DROP INDEX CONCURRENTLY contacts_migrate_test_idx;")
+            cur.execute("SELECT pg_advisory_unlock(%s);", (migrate.LOCK_KEY,))
+        waiter.join(10)
+        assert result["applied"] == ["9001"]
+    finally:
+        with holder.cursor() as cur:
+            cur.execute("DELETE FROM schema_migrations WHERE version = '9001';")
+        holder.close()
+
+
+def test_no_transaction_migration_is_split_into_statements(tmp_path):
+    """Миграция вне транзакции выполняется по одной команде."""
+    from app.migrate import load_migrations
+
+    (tmp_path / "0001_indexes.sql").write_text(
+        "-- migrate:no-transaction\n"
+        "-- комментарий\n"
+        "CREATE INDEX CONCURRENTLY a_idx ON t (a);\n"
+        "CREATE INDEX CONCURRENTLY b_idx\n    ON t (b);\n",
+        encoding="utf-8",
+    )
+    (migration,) = load_migrations(str(tmp_path))
+    assert not migration.transactional
+    assert migration.statements() == [
+        "CREATE INDEX CONCURRENTLY a_idx ON t (a);",
+        "CREATE INDEX CONCURRENTLY b_idx\n    ON t (b);",
+    ]
+
+
+def test_convert_query():
+    """Плейсхолдеры psycopg2 переводятся в нумерованные параметры."""
+    from app.db import convert_query
+
+    assert convert_query("SELECT %s, %s;", ("a", 1)) == ("SELECT $1, $2;", ["a", 1])
+    sql, args = convert_query("SELECT 1 WHERE a LIKE %(q)s OR b %% %(q)s LIMIT %(limit)s;", {"limit": 5, "q": "x"})
+    assert sql == "SELECT 1 WHERE a LIKE $1 OR b % $1 LIMIT $2;"
+    assert args == ["x", 5]
+
+
+def test_prepared_statements_and_lean_rows(setup_db, monkeypatch):
+    """Запросы готовятся один раз на соединение; лёгкий режим возвращает Contact."""
+    from app import db
+
+    for i in range(3):
+        add_contact(f"User {i}", f"user{i}@example.com")
+    page = list_contacts(limit=2, use_cache=False)
+    lean_page = list_contacts(limit=2, use_cache=False, lean=True)
+    assert [c.as_dict() for c in lean_page["contacts"]] == page["contacts"]
+    assert lean_page["next_after"] == page["next_after"]
+    assert lean_page["contacts"][0]["email"] == lean_page["contacts"][0].email == "user0@example.com"
+    monkeypatch.setenv("PG_PREPARED_STATEMENTS", "0")
+    assert list_contacts(limit=2, use_cache=False, lean=True) == lean_page
+    monkeypatch.delenv("PG_PREPARED_STATEMENTS")
+    assert db.search_contacts("us", use_cache=False)["contacts"][0]["email"] == "user0@example.com"
+    assert update_contact(1, "Renamed", "renamed@example.com") is True
+    assert delete_contact(99) is False
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT statement FROM pg_prepared_statements;")
+            statements = [row["statement"] for row in cur.fetchall()]
+        conn.rollback()
+    # Пул из одного соединения: каждый вариант запроса подготовлен ровно один раз
+    if db.get_pool_config()["maxconn"] == 1:
+        assert len(statements) == len(set(statements))
+    assert any("ORDER BY id ASC LIMIT $1" in statement for statement in statements)
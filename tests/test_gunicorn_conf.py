@@ -0,0 +1,59 @@
+"""
+Тесты расчёта воркеров gunicorn по лимитам cgroup (на поддельных файлах cgroup).
+"""
+import importlib.util
+import os
+from unittest import mock
+
+import pytest
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "gunicorn", "gunicorn.conf.py")
+
+
+@pytest.fixture(scope="module")
+def conf():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # Конфигурация выставляет переменные окружения для приложения (SSE_MAX_STREAMS)
+    with mock.patch.dict(os.environ):
+        spec.loader.exec_module(module)
+    return module
+
+
+def _write(root, name, value):
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(value + "\n")
+
+
+def test_cgroup_v2_limits(conf, tmp_path):
+    _write(tmp_path, "cpu.max", "50000 100000")
+    _write(tmp_path, "memory.max", str(512 * 1024 * 1024))
+    assert conf.cpu_limit(str(tmp_path), cpus=8) == 0.5
+    assert conf.memory_limit(str(tmp_path)) == 512 * 1024 * 1024
+    # limits.cpu=500m: один воркер, а не четыре
+    assert conf.default_workers(0.5, 512 * 1024 * 1024) == 1
+
+    _write(tmp_path, "cpu.max", "max 100000")
+    _write(tmp_path, "memory.max", "max")
+    assert conf.cpu_limit(str(tmp_path), cpus=8) == 8
+    assert conf.memory_limit(str(tmp_path)) is None
+
+
+def test_cgroup_v1_limits(conf, tmp_path):
+    _write(tmp_path, "cpu,cpuacct/cpu.cfs_quota_us", "250000")
+    _write(tmp_path, "cpu,cpuacct/cpu.cfs_period_us", "100000")
+    _write(tmp_path, "memory/memory.limit_in_bytes", "9223372036854771712")
+    assert conf.cpu_limit(str(tmp_path), cpus=8) == 2.5
+    assert conf.memory_limit(str(tmp_path)) is None
+    assert conf.default_workers(2.5) == 3
+
+    _write(tmp_path, "cpu,cpuacct/cpu.cfs_quota_us", "-1")
+    assert conf.cpu_limit(str(tmp_path), cpus=2) == 2
+
+
+def test_memory_caps_workers_and_threads_follow(conf):
+    assert conf.default_workers(8, 256 * 1024 * 1024) == 1
+    assert conf.default_threads("gthread", 1) == conf.TOTAL_THREADS
+    assert conf.default_threads("gthread", 8) == 4
+    assert conf.default_threads("sync", 2) == 1
@@ -0,0 +1,106 @@
+"""
+Тесты режима очереди логирования, прореживания и JSON-формата.
+"""
+import json
+import logging
+import queue
+
+import pytest
+
+from app.logger import (
+    BoundedQueueHandler, JsonFormatter, RequestIdFilter, SamplingFilter, parse_sampling_rules, set_request_id,
+)
+
+
+def _record(level=logging.INFO, msg="msg %s", args=("x",)):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_drop_policy_counts_and_reports_dropped_records():
+    log_queue = queue.Queue(maxsize=2)
+    handler = BoundedQueueHandler(log_queue, policy="drop")
+
+    for _ in range(3):
+        handler.handle(_record())
+    assert handler.dropped == 1
+
+    log_queue.get_nowait()
+    log_queue.get_nowait()
+    handler.handle(_record())
+    assert log_queue.get_nowait().getMessage() == "msg x"
+    warning = log_queue.get_nowait()
+    assert warning.levelno == logging.WARNING
+    assert warning.getMessage().endswith(": 1")
+
+
+def test_errors_wait_for_space_instead_of_dropping():
+    log_queue = queue.Queue(maxsize=1)
+    handler = BoundedQueueHandler(log_queue, policy="drop", block_timeout=0.01)
+    handler.handle(_record())
+    handler.handle(_record(level=logging.ERROR))
+    # Ждали block_timeout и только потом отбросили
+    assert handler.dropped == 1
+
+
+def test_record_is_formatted_lazily():
+    log_queue = queue.Queue()
+    handler = BoundedQueueHandler(log_queue)
+    handler.handle(_record(msg="id=%d", args=(5,)))
+    record = log_queue.get_nowait()
+    assert record.msg == "id=%d"
+    assert record.getMessage() == "id=5"
+
+
+def test_parse_sampling_rules():
+    assert parse_sampling_rules("contacts.loaded=1/100, *=5/s") == {
+        "contacts.loaded": ("every", 100),
+        "*": ("per_second", 5),
+    }
+    assert parse_sampling_rules("") == {}
+    with pytest.raises(ValueError):
+        parse_sampling_rules("contacts.loaded=2/100")
+
+
+def test_sampling_one_in_n_reports_suppressed():
+    sampling = SamplingFilter({"msg %s": ("every", 3)})
+    records = [_record() for _ in range(7)]
+    passed = [record for record in records if sampling.filter(record)]
+    assert passed == [records[0], records[3], records[6]]
+    assert [getattr(record, "suppressed", 0) for record in passed] == [0, 2, 2]
+
+
+def test_rate_limit_per_key_and_errors_never_sampled():
+    now = [100.0]
+    sampling = SamplingFilter({"*": ("per_second", 2)}, clock=lambda: now[0])
+    assert [sampling.filter(_record()) for _ in range(4)] == [True, True, False, False]
+    # Свой счётчик у каждого ключа
+    assert sampling.filter(_record(msg="other %s"))
+    assert sampling.filter(_record(level=logging.ERROR))
+    now[0] += 1.0
+    record = _record()
+    assert sampling.filter(record)
+    assert record.suppressed == 2
+
+
+def test_decision_is_shared_between_handlers():
+    sampling = SamplingFilter({"msg %s": ("every", 2)})
+    first, second = _record(), _record()
+    assert sampling.filter(first) and sampling.filter(first)
+    assert not sampling.filter(second) and not sampling.filter(second)
+
+
+def test_json_formatter_includes_request_id():
+    record = _record(msg="Загружено контактов: %d", args=(3,))
+    record.log_key = "contacts.loaded"
+    set_request_id("req-1")
+    try:
+        RequestIdFilter().filter(record)
+    finally:
+        set_request_id(None)
+    record.suppressed = 4
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Загружено контактов: 3"
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "req-1"
+    assert entry["log_key"] == "contacts.loaded"
+    assert entry["suppressed"] == 4
@@ -0,0 +1,48 @@
+"""
+Тесты раздачи уведомлений об изменениях (без PostgreSQL).
+"""
+import json
+
+from app import db
+from app.notify import ChangeListener
+
+
+def test_payload_is_enriched_and_fanned_out(monkeypatch):
+    calls = []
+
+    def get_contacts_by_ids(ids):
+        calls.append(ids)
+        return [{"id": i, "name": f"User {i}", "email": f"u{i}@example.com"} for i in ids]
+
+    monkeypatch.setattr(db, "get_contacts_by_ids", get_contacts_by_ids)
+    listener = ChangeListener()
+    first, second = listener.subscribe(), listener.subscribe()
+
+    listener.handle_payload(json.dumps({"op": "update", "ids": [1, 2]}))
+    listener.handle_payload(json.dumps({"op": "delete", "ids": [3]}))
+
+    assert calls == [[1, 2]]
+    for subscription in (first, second):
+        update, delete = subscription.drain()
+        assert update["op"] == "update" and [c["id"] for c in update["contacts"]] == [1, 2]
+        assert delete == {"seq": 2, "op": "delete", "ids": [3], "contacts": []}
+
+    second.close()
+    assert listener.subscriber_count() == 1
+
+
+def test_slow_subscriber_gets_reload():
+    listener = ChangeListener()
+    subscription = listener.subscribe(maxsize=2)
+    for i in range(5):
+        listener.publish("delete", [i])
+    events = subscription.drain()
+    assert events[0]["op"] == "reload"
+    assert len(events) <= 2
+
+
+def test_malformed_payload_is_ignored():
+    listener = ChangeListener()
+    subscription = listener.subscribe()
+    listener.handle_payload("not json")
+    assert subscription.drain() == []
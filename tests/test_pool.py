@@ -0,0 +1,141 @@
+"""
+Тесты пула соединений на поддельных соединениях (без PostgreSQL).
+"""
+import threading
+import time
+import types
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from app.pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.info = types.SimpleNamespace(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture()
+def connections():
+    return []
+
+
+@pytest.fixture()
+def make_pool(connections):
+    def factory(**kwargs):
+        def connect():
+            conn = FakeConnection()
+            connections.append(conn)
+            return conn
+        return ConnectionPool(connect, **kwargs)
+    return factory
+
+
+def test_connection_is_reused(make_pool, connections):
+    pool = make_pool(maxconn=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connections) == 1
+
+
+def test_checkout_timeout(make_pool):
+    pool = make_pool(maxconn=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_released_connection(make_pool):
+    pool = make_pool(maxconn=1, timeout=2)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["wait_time_total"] > 0
+
+
+def test_open_transaction_is_rolled_back(make_pool):
+    pool = make_pool()
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+
+
+def test_broken_connection_is_replaced_on_checkout(make_pool, connections):
+    pool = make_pool(ping_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert conn.closed
+    assert pool.stats()["failed_checks"] == 1
+
+
+def test_old_connection_is_recycled(make_pool):
+    pool = make_pool(max_age=0.01)
+    conn = pool.getconn()
+    time.sleep(0.02)
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["size"] == 0
+
+
+def test_stats_and_prefill(make_pool):
+    pool = make_pool(minconn=2, maxconn=4)
+    pool.prefill()
+    conn = pool.getconn()
+    stats = pool.stats()
+    assert stats["size"] == 2
+    assert stats["in_use"] == 1
+    assert stats["idle"] == 1
+    pool.putconn(conn)
+
+
+def test_get_pool_is_recreated_after_fork(monkeypatch):
+    from app import db
+
+    monkeypatch.setattr(db, "_connect", FakeConnection)
+    monkeypatch.setattr(db, "_pool", None)
+    parent_pool = db.get_pool()
+    # Эмулируем дочерний процесс: другой PID
+    monkeypatch.setattr(db, "_pool_pid", -1)
+    child_pool = db.get_pool()
+    assert child_pool is not parent_pool
+    assert parent_pool in db._inherited_pools
+    db._inherited_pools.remove(parent_pool)
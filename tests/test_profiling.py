@@ -0,0 +1,77 @@
+"""
+Тесты профилирования запросов по требованию (без PostgreSQL).
+"""
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from app import profiling
+
+
+def _busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture()
+def make_app(tmp_path):
+    def factory(**overrides):
+        config = {"token": "secret", "sample_rate": 0.0, "directory": str(tmp_path),
+                  "max_files": 2, "interval": 0.001}
+        config.update(overrides)
+        app = Flask(__name__)
+        store = profiling.install(app, config)
+
+        @app.route("/slow")
+        def slow():
+            _busy_wait(0.05)
+            return "ok"
+
+        return app, store
+    return factory
+
+
+def test_sampler_collects_collapsed_stacks():
+    sampler = profiling.StackSampler(threading.get_ident(), interval=0.001, root="GET /slow").start()
+    _busy_wait(0.05)
+    sampler.stop()
+    assert sampler.samples > 0
+    line = sampler.collapsed().splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert stack.startswith("GET /slow;") and "_busy_wait (" in stack
+    assert int(count) > 0
+
+
+def test_disabled_profiling_registers_nothing(make_app):
+    app, store = make_app(token="", sample_rate=0.0)
+    assert store is None
+    assert not app.before_request_funcs and not app.after_request_funcs
+    assert app.test_client().get("/debug/profiles").status_code == 404
+
+
+def test_token_request_is_profiled_and_downloadable(make_app):
+    app, store = make_app()
+    client = app.test_client()
+    assert "X-Profile" not in client.get("/slow").headers
+
+    resp = client.get("/slow", headers={profiling.TOKEN_HEADER: "secret"})
+    name = resp.headers["X-Profile"]
+    assert client.get("/debug/profiles").status_code == 404
+    listed = client.get("/debug/profiles", headers={profiling.TOKEN_HEADER: "secret"}).get_json()
+    assert listed["profiles"][0]["name"] == name
+    assert listed["profiles"][0]["endpoint"] == "slow"
+
+    body = client.get(f"/debug/profiles/{name}", headers={profiling.TOKEN_HEADER: "secret"}).get_data(as_text=True)
+    assert body.startswith("GET /slow;")
+    assert client.get("/debug/profiles/..%2Fsecret", headers={profiling.TOKEN_HEADER: "secret"}).status_code == 404
+
+
+def test_sampled_profiles_are_bounded(make_app):
+    app, store = make_app(token="", sample_rate=1.0)
+    client = app.test_client()
+    for _ in range(4):
+        client.get("/slow")
+    assert len(store.list()) == 2
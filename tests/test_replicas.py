@@ -0,0 +1,143 @@
+"""
+Тесты маршрутизации чтения на реплики на поддельных соединениях (без PostgreSQL).
+"""
+import os
+import types
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from app import db, replicas
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.conn.queries.append(sql)
+
+    def fetchone(self):
+        return {"lsn": self.conn.server_lsn, "in_recovery": True, "lag": 0}
+
+
+class FakeConnection:
+    def __init__(self, name, server_lsn="0/0"):
+        self.name = name
+        self.server_lsn = server_lsn
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+        self.info = types.SimpleNamespace(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def _replica(name, healthy=True, lag=0.0, lsn="0/100"):
+    replica = replicas.Replica(name, lambda: FakeConnection(name))
+    replica.healthy, replica.lag, replica.lsn = healthy, lag, replicas.parse_lsn(lsn)
+    return replica
+
+
+@pytest.fixture()
+def routed(monkeypatch):
+    """
+    Одна реплика и основной сервер без пула; возвращает (ReplicaSet, реплика).
+    """
+    replica = _replica("replica")
+    replica_set = replicas.ReplicaSet([replica], max_lag=5.0)
+    monkeypatch.setattr(db, "_pool_enabled", lambda: False)
+    monkeypatch.setattr(db, "_connect", lambda: FakeConnection("primary", server_lsn="0/200"))
+    monkeypatch.setattr(db, "_replicas", replica_set)
+    monkeypatch.setattr(db, "_replicas_pid", os.getpid())
+    token = db._session_lsn.set(0)
+    yield replica_set, replica
+    db._session_lsn.reset(token)
+
+
+def test_lsn_parse_and_format():
+    assert replicas.parse_lsn("0/16B3748") == 0x16B3748
+    assert replicas.parse_lsn("1/0") == 1 << 32
+    assert replicas.parse_lsn(None) == 0
+    assert replicas.format_lsn(replicas.parse_lsn("A/FF")) == "A/FF"
+
+
+def test_choose_skips_down_lagging_and_behind_replicas():
+    good = _replica("good", lsn="0/300")
+    replica_set = replicas.ReplicaSet([
+        _replica("down", healthy=False),
+        _replica("lagging", lag=30.0),
+        _replica("behind", lsn="0/100"),
+        good,
+    ], max_lag=5.0)
+    assert replica_set.choose(replicas.parse_lsn("0/200")) is good
+    assert replica_set.choose(replicas.parse_lsn("0/400")) is None
+    assert len({replica_set.choose().name for _ in range(4)}) == 2
+
+
+def test_reads_go_to_replica_and_writes_to_primary(routed):
+    with db.get_connection(read_only=True) as conn:
+        assert conn.name == "replica"
+    with db.get_connection() as conn:
+        assert conn.name == "primary"
+    # После записи сессия ждёт, пока реплика дойдёт до её LSN
+    assert db.get_session_lsn() == "0/200"
+    with db.get_connection(read_only=True) as conn:
+        assert conn.name == "primary"
+    with db.primary_reads():
+        db.set_session_lsn(None)
+        with db.get_connection(read_only=True) as conn:
+            assert conn.name == "primary"
+
+
+def test_failed_replica_falls_back_to_primary(routed):
+    replica_set, replica = routed
+    broken = FakeConnection("replica")
+    broken.broken = True
+    replica.pool = lambda: broken
+
+    @db._primary_fallback
+    def read():
+        with db.get_connection(read_only=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return conn.name
+
+    assert read() == "primary"
+    assert not replica.healthy and broken.closed
+    assert replica_set.choose() is None
+
+
+def test_unreachable_replica_is_marked_down(routed):
+    replica_set, replica = routed
+
+    def refuse():
+        raise psycopg2.OperationalError("connection refused")
+
+    replica.pool = refuse
+    with db.get_connection(read_only=True) as conn:
+        assert conn.name == "primary"
+    assert replica.error == "connection refused"
+    # Проверка монитора возвращает реплику, когда она снова отвечает
+    replica.pool = lambda: FakeConnection("replica")
+    replica_set.check(replica)
+    assert replica.healthy
@@ -0,0 +1,141 @@
+"""
+Тесты фонового исполнителя и окна строк Tk-клиента (без tkinter и PostgreSQL).
+"""
+import threading
+import time
+
+import pytest
+
+from app import db
+from app.virtual_list import BackgroundWorker, ContactWindow
+
+
+@pytest.fixture()
+def fake_rows(monkeypatch):
+    """
+    Подменяет запросы чтения: таблица из 25 контактов с id 1..25.
+    """
+    rows = [{"id": i, "name": f"User {i}", "email": f"u{i}@example.com"} for i in range(1, 26)]
+    calls = []
+
+    def get_contacts_window(offset, limit):
+        calls.append(("offset", offset))
+        return rows[offset:offset + limit]
+
+    def list_contacts(limit, after_id=None, use_cache=True):
+        calls.append(("after", after_id))
+        tail = [r for r in rows if r["id"] > after_id]
+        return {"contacts": tail[:limit]}
+
+    monkeypatch.setattr(db, "get_contacts_window", get_contacts_window)
+    monkeypatch.setattr(db, "list_contacts", list_contacts)
+    return rows, calls
+
+
+def _load(window, block_no):
+    plan = window.plan(block_no)
+    return window.apply(plan, ContactWindow.load(plan))
+
+
+def test_worker_runs_in_background_and_polls_on_caller_thread():
+    worker = BackgroundWorker()
+    results, errors = [], []
+    worker.submit(threading.current_thread, on_done=results.append)
+    worker.submit(int, "x", on_error=errors.append)
+    deadline = time.monotonic() + 2
+    while len(results) + len(errors) < 2 and time.monotonic() < deadline:
+        worker.poll()
+        time.sleep(0.01)
+    worker.stop()
+    assert results[0] is not threading.current_thread()
+    assert isinstance(errors[0], ValueError)
+
+
+def test_blocks_load_by_offset_then_keyset(fake_rows):
+    rows, calls = fake_rows
+    window = ContactWindow(block_size=10)
+    window.set_total(len(rows))
+    assert window.missing_blocks(0, 15) == [0, 1]
+
+    _load(window, 0)
+    _load(window, 1)
+    _load(window, 2)
+    assert calls == [("offset", 0), ("after", 10), ("after", 20)]
+    assert window.row(24)["id"] == 25
+    assert window.missing_blocks(0, 25) == []
+
+
+def test_remove_patch_and_append_update_only_loaded_rows(fake_rows):
+    rows, calls = fake_rows
+    window = ContactWindow(block_size=10)
+    window.set_total(len(rows))
+    _load(window, 0)
+    _load(window, 1)
+
+    assert window.patch({"id": 3, "name": "Patched", "email": "p@example.com"}) == 2
+    assert window.row(2)["name"] == "Patched"
+
+    del rows[4]
+    assert window.remove(5) == 4
+    assert window.total == 24
+    # Следующие блоки сброшены, текущий дочитывается по курсору
+    assert window.missing_blocks(0, 24) == [0, 1, 2]
+    _load(window, 0)
+    assert calls[-1] == ("after", 10)
+    assert [window.row(i)["id"] for i in range(10)] == [1, 2, 3, 4, 6, 7, 8, 9, 10, 11]
+
+    _load(window, 1)
+    _load(window, 2)
+    rows.append({"id": 26, "name": "New", "email": "new@example.com"})
+    assert window.append(rows[-1]) == 24
+    assert window.row(24)["id"] == 26
+
+
+def test_stale_results_are_ignored(fake_rows):
+    window = ContactWindow(block_size=10)
+    window.set_total(25)
+    plan = window.plan(0)
+    result = ContactWindow.load(plan)
+    window.remove(1)
+    assert not window.apply(plan, result)
+    assert window.row(0) is None
+
+
+def test_search_total_grows_with_loaded_pages(monkeypatch):
+    def search_contacts(query, limit, page):
+        has_next = page < 2
+        return {"contacts": [{"id": page * 100 + i, "name": query, "email": "s@example.com"} for i in range(limit)],
+                "page": page, "has_next": has_next}
+
+    monkeypatch.setattr(db, "search_contacts", search_contacts)
+    window = ContactWindow(query="abc", block_size=5)
+    window.set_total(1)
+    _load(window, 0)
+    assert window.total == 6
+    _load(window, 1)
+    assert window.total == 10
+    assert window.append({"id": 1, "name": "x", "email": "x@example.com"}) is None
+
+
+def test_change_events_apply_once(fake_rows):
+    rows, _ = fake_rows
+    window = ContactWindow(block_size=10)
+    window.set_total(len(rows))
+    _load(window, 0)
+    _load(window, 1)
+    _load(window, 2)
+
+    new = {"id": 26, "name": "New", "email": "new@example.com"}
+    # Уведомление о собственном добавлении может прийти раньше ответа и позже него
+    assert window.apply_change({"op": "insert", "ids": [26], "contacts": [new]})
+    assert window.append(new) is None
+    assert window.total == 26
+
+    window.apply_change({"op": "update", "ids": [2], "contacts": [{"id": 2, "name": "Changed", "email": "c@e.com"}]})
+    assert window.row(1)["name"] == "Changed"
+
+    assert window.remove(3) == 2
+    window.apply_change({"op": "delete", "ids": [3], "contacts": []})
+    assert window.total == 25
+
+    assert not window.apply_change({"op": "reload", "ids": [], "contacts": []})
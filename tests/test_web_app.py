@@ -1,5 +1,9 @@
+import io
+import json
 import types
+from contextlib import contextmanager
 
+import psycopg2
 import pytest
 
 from app.web_app import create_app
@@ -15,6 +19,7 @@ class DummyDB:
         self.contacts = []
         self._next_id = 1
         self._initialized = False
+        self.version = 0
 
     def init_db(self):
         # В реальном коде создаётся таблица, здесь — только при первом вызове
@@ -26,21 +31,112 @@ class DummyDB:
     def get_all_contacts(self):
         return list(self.contacts)
 
+    def list_contacts(self, limit=50, after_id=None, before_id=None, name_prefix=None, email_prefix=None,
+                      use_cache=True, lean=False):
+        rows = [
+            c for c in self.contacts
+            if (not name_prefix or c.name.lower().startswith(name_prefix.lower()))
+            and (not email_prefix or c.email.lower().startswith(email_prefix.lower()))
+        ]
+        if before_id is not None:
+            before = [c for c in rows if c.id < before_id]
+            page = before[-limit:]
+            prev_before = page[0].id if len(before) > limit else None
+            next_after = page[-1].id if page else None
+        else:
+            after = [c for c in rows if after_id is None or c.id > after_id]
+            page = after[:limit]
+            next_after = page[-1].id if len(after) > limit else None
+            prev_before = page[0].id if after_id is not None and page else None
+        return {"contacts": [vars(c).copy() for c in page], "next_after": next_after, "prev_before": prev_before}
+
+    def get_page_version(self, limit=50, after_id=None, before_id=None, name_prefix=None, email_prefix=None):
+        return str(self.version)
+
+    def search_contacts(self, query, limit=50, page=1, use_cache=True):
+        query = query.strip().lower()
+        rows = [c for c in self.contacts if query and (query in c.name.lower() or query in c.email.lower())]
+        start = (page - 1) * limit
+        return {
+            "contacts": [vars(c).copy() for c in rows[start:start + limit]],
+            "page": page,
+            "has_next": len(rows) > start + limit,
+        }
+
     def add_contact(self, name, email):
         self.contacts.append(
             types.SimpleNamespace(id=self._next_id, name=name, email=email)
         )
         self._next_id += 1
+        self.version += 1
+        return self._next_id - 1
+
+    def upsert_contact(self, name, email):
+        for c in self.contacts:
+            if c.email.strip().lower() == email.strip().lower():
+                if (c.name, c.email) == (name, email):
+                    return c.id, "unchanged"
+                c.name, c.email = name, email
+                self.version += 1
+                return c.id, "updated"
+        return self.add_contact(name, email), "created"
+
+    def get_contact(self, contact_id):
+        for c in self.contacts:
+            if c.id == contact_id:
+                return {"id": c.id, "name": c.name, "email": c.email, "row_version": str(self.version)}
+        return None
+
+    def copy_contacts(self, rows):
+        count = 0
+        for name, email in rows:
+            self.add_contact(name, email)
+            count += 1
+        return count
+
+    def iter_contacts(self, batch_size=2000):
+        for c in self.contacts:
+            yield {"id": c.id, "name": c.name, "email": c.email}
+
+    def apply_batch(self, operations):
+        # Как одна транзакция: при ошибке состояние восстанавливается
+        snapshot = [types.SimpleNamespace(**vars(c)) for c in self.contacts]
+        try:
+            return self._apply_batch(operations)
+        except psycopg2.Error:
+            self.contacts = snapshot
+            raise
+
+    def _apply_batch(self, operations):
+        results = []
+        for o in operations:
+            if o["op"] == "create":
+                results.append({"op": "create", "id": self.add_contact(o["name"], o["email"]), "status": "created"})
+            elif o["op"] == "update":
+                found = self.update_contact(o["id"], o["name"], o["email"])
+                results.append({"op": "update", "id": o["id"], "status": "updated" if found else "not_found"})
+            else:
+                found = self.delete_contact(o["id"])
+                results.append({"op": "delete", "id": o["id"], "status": "deleted" if found else "not_found"})
+        return results
 
     def update_contact(self, contact_id, name, email):
+        key = email.strip().lower()
+        if any(c.id != contact_id and c.email.strip().lower() == key for c in self.contacts):
+            raise psycopg2.errors.UniqueViolation("duplicate key value violates unique constraint")
         for c in self.contacts:
             if c.id == contact_id:
                 c.name = name
                 c.email = email
-                break
+                self.version += 1
+                return True
+        return False
 
     def delete_contact(self, contact_id):
+        before = len(self.contacts)
         self.contacts = [c for c in self.contacts if c.id != contact_id]
+        self.version += 1
+        return len(self.contacts) < before
 
 
 @pytest.fixture()
@@ -55,9 +151,17 @@ def dummy_db(monkeypatch):
 
     monkeypatch.setattr(db_module, "init_db", db.init_db)
     monkeypatch.setattr(db_module, "get_all_contacts", db.get_all_contacts)
+    monkeypatch.setattr(db_module, "list_contacts", db.list_contacts)
+    monkeypatch.setattr(db_module, "search_contacts", db.search_contacts)
+    monkeypatch.setattr(db_module, "apply_batch", db.apply_batch)
+    monkeypatch.setattr(db_module, "upsert_contact", db.upsert_contact)
     monkeypatch.setattr(db_module, "add_contact", db.add_contact)
+    monkeypatch.setattr(db_module, "copy_contacts", db.copy_contacts)
+    monkeypatch.setattr(db_module, "iter_contacts", db.iter_contacts)
     monkeypatch.setattr(db_module, "update_contact", db.update_contact)
     monkeypatch.setattr(db_module, "delete_contact", db.delete_contact)
+    monkeypatch.setattr(db_module, "get_contact", db.get_contact)
+    monkeypatch.setattr(db_module, "get_page_version", db.get_page_version)
 
     return db
 
@@ -118,3 +222,336 @@ def test_delete_contact(client, dummy_db):
     assert resp.status_code == 200
     assert dummy_db.contacts == []
 
+
+def test_index_pagination_links(client, dummy_db):
+    client.get("/")
+    for i in range(3):
+        dummy_db.add_contact(f"User {i}", f"user{i}@example.com")
+
+    resp = client.get("/?limit=2")
+    html = resp.get_data(as_text=True)
+    assert "user0@example.com" in html
+    assert "user2@example.com" not in html
+    assert "after=2" in html
+
+    resp = client.get("/?limit=2&after=2")
+    html = resp.get_data(as_text=True)
+    assert "user2@example.com" in html
+    assert "before=3" in html
+
+
+def test_index_prefix_filter(client, dummy_db):
+    client.get("/")
+    dummy_db.add_contact("Alice", "alice@example.com")
+    dummy_db.add_contact("Bob", "bob@example.com")
+
+    resp = client.get("/?name_prefix=al")
+    html = resp.get_data(as_text=True)
+    assert "alice@example.com" in html
+    assert "bob@example.com" not in html
+
+
+def test_import_csv_upload(client, dummy_db):
+    client.get("/")
+    data = "name,email\nAlice,alice@example.com\nBad,not-an-email\n,empty@example.com\n"
+    resp = client.post(
+        "/import",
+        data={"file": (io.BytesIO(data.encode("utf-8")), "contacts.csv")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    report = resp.get_json()
+    assert report["read"] == report["imported"] == 1
+    assert report["rejected"] == 2
+    assert "imported_per_sec" in report
+    assert [c.email for c in dummy_db.contacts] == ["alice@example.com"]
+
+
+def test_import_ndjson_body(client, dummy_db):
+    client.get("/")
+    lines = [json.dumps({"name": "Bob", "email": "bob@example.com"}), "{broken"]
+    resp = client.post(
+        "/import", data="\n".join(lines), content_type="application/x-ndjson"
+    )
+    report = resp.get_json()
+    assert report["imported"] == 1
+    assert report["rejected"] == 1
+
+
+def test_export_csv_and_ndjson(client, dummy_db):
+    client.get("/")
+    dummy_db.add_contact("Alice", "alice@example.com")
+    dummy_db.add_contact("Bob", "bob@example.com")
+
+    resp = client.get("/export.csv")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    lines = resp.get_data(as_text=True).splitlines()
+    assert lines == ["id,name,email", "1,Alice,alice@example.com", "2,Bob,bob@example.com"]
+
+    resp = client.get("/export.ndjson")
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [r["email"] for r in rows] == ["alice@example.com", "bob@example.com"]
+
+
+def test_api_crud(client, dummy_db):
+    client.get("/")
+    resp = client.post("/api/contacts", json={"name": "Api User", "email": "api@example.com"})
+    assert resp.status_code == 201
+    contact_id = resp.get_json()["id"]
+
+    resp = client.get(f"/api/contacts/{contact_id}")
+    assert resp.get_json()["email"] == "api@example.com"
+
+    resp = client.put(f"/api/contacts/{contact_id}", json={"name": "Renamed", "email": "api@example.com"})
+    assert resp.status_code == 200
+    assert dummy_db.contacts[0].name == "Renamed"
+
+    assert client.post("/api/contacts", json={"name": "X", "email": "bad"}).status_code == 400
+    assert client.delete(f"/api/contacts/{contact_id}").status_code == 204
+    assert client.get(f"/api/contacts/{contact_id}").status_code == 404
+
+
+def test_api_list_conditional_get(client, dummy_db, monkeypatch):
+    client.get("/")
+    dummy_db.add_contact("Alice", "alice@example.com")
+
+    resp = client.get("/api/contacts")
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert [c["email"] for c in resp.get_json()["contacts"]] == ["alice@example.com"]
+
+    # На 304 страница не загружается и не сериализуется
+    from app import db as db_module
+    monkeypatch.setattr(db_module, "list_contacts", lambda **kwargs: pytest.fail("страница загружена для 304"))
+    resp = client.get("/api/contacts", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.get_data() == b""
+    monkeypatch.setattr(db_module, "list_contacts", dummy_db.list_contacts)
+
+    dummy_db.add_contact("Bob", "bob@example.com")
+    resp = client.get("/api/contacts", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+
+def test_metrics_use_route_templates(client, dummy_db):
+    client.get("/")
+    dummy_db.add_contact("User", "user@example.com")
+    client.post("/delete/1")
+    client.get("/no/such/page")
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'path="/delete/<int:contact_id>"' in body
+    assert 'path="/delete/1"' not in body
+    assert 'path="<unmatched>"' in body
+
+
+def test_server_timing_header(client, dummy_db):
+    resp = client.get("/")
+    header = resp.headers["Server-Timing"]
+    assert "db;dur=" in header
+    assert "render;dur=" in header
+    assert "total;dur=" in header
+
+
+def test_request_id_header(client, dummy_db):
+    resp = client.get("/", headers={"X-Request-ID": "abc-123"})
+    assert resp.headers["X-Request-ID"] == "abc-123"
+    # Непохожий на идентификатор заголовок заменяется новым
+    resp = client.get("/", headers={"X-Request-ID": "bad id\""})
+    assert len(resp.headers["X-Request-ID"]) == 32
+
+
+def test_search_page(client, dummy_db):
+    for i in range(3):
+        dummy_db.add_contact(f"Мария {i}", f"maria{i}@example.com")
+    dummy_db.add_contact("Иван", "ivan@example.com")
+
+    resp = client.get("/search?q=мар&limit=2")
+    html = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert "Мария 0" in html and "Мария 1" in html
+    assert "Иван" not in html
+    assert "page=2" in html
+
+    resp = client.get("/search?q=мар&limit=2&page=2")
+    html = resp.get_data(as_text=True)
+    assert "Мария 2" in html
+    assert "page=1" in html
+
+    resp = client.get("/search?q=nobody")
+    assert "Ничего не найдено." in resp.get_data(as_text=True)
+
+
+def test_events_stream_pushes_changes(client, monkeypatch):
+    from app import notify
+
+    class FakeSubscription:
+        closed = False
+
+        def __init__(self):
+            self.events = [{"seq": 1, "op": "delete", "ids": [7], "contacts": []}]
+
+        def get(self, timeout=None):
+            return self.events.pop(0) if self.events else None
+
+        def close(self):
+            FakeSubscription.closed = True
+
+    monkeypatch.setattr(notify, "subscribe", FakeSubscription)
+    resp = client.get("/events", buffered=False)
+    assert resp.mimetype == "text/event-stream"
+    chunks = resp.response
+    assert next(chunks).startswith(b"retry:")
+    event = next(chunks).decode("utf-8")
+    assert "event: delete" in event and '"ids": [7]' in event
+    assert next(chunks) == b": keepalive\n\n"
+    resp.close()
+    assert FakeSubscription.closed
+
+
+def test_api_batch(client, dummy_db):
+    dummy_db.add_contact("Old", "old@example.com")
+    resp = client.post("/api/contacts/batch", json={"operations": [
+        {"op": "create", "name": "New", "email": "new@example.com"},
+        {"op": "update", "id": 1, "name": "Old 2", "email": "old@example.com"},
+        {"op": "delete", "id": 99},
+    ]})
+    assert resp.status_code == 200
+    assert [r["status"] for r in resp.get_json()["results"]] == ["created", "updated", "not_found"]
+    assert [c.name for c in dummy_db.contacts] == ["Old 2", "New"]
+
+    resp = client.post("/api/contacts/batch", json={"operations": [
+        {"op": "create", "name": "Bad", "email": "bad"},
+        {"op": "delete", "id": "1"},
+        {"op": "merge"},
+    ]})
+    assert resp.status_code == 400
+    assert [e["index"] for e in resp.get_json()["errors"]] == [0, 1, 2]
+    assert len(dummy_db.contacts) == 2
+
+
+def test_api_batch_email_conflict_rolls_back(client, dummy_db):
+    dummy_db.add_contact("First", "first@example.com")
+    dummy_db.add_contact("Second", "second@example.com")
+    resp = client.post("/api/contacts/batch", json={"operations": [
+        {"op": "create", "name": "Third", "email": "third@example.com"},
+        {"op": "update", "id": 2, "name": "Second", "email": " FIRST@example.com"},
+    ]})
+    assert resp.status_code == 409
+    assert "пакет не выполнен" in resp.get_json()["error"]
+    assert [(c.name, c.email) for c in dummy_db.contacts] == [
+        ("First", "first@example.com"), ("Second", "second@example.com"),
+    ]
+
+
+def test_add_retry_does_not_duplicate(client, dummy_db):
+    form = {"name": "Retry User", "email": "retry@example.com"}
+    client.post("/add", data=form)
+    resp = client.post("/add", data=form, follow_redirects=True)
+    assert "Такой контакт уже есть" in resp.get_data(as_text=True)
+    assert len(dummy_db.contacts) == 1
+
+    resp = client.post("/api/contacts", json={"name": "Retry User 2", "email": " RETRY@example.com"})
+    assert resp.status_code == 200
+    assert resp.get_json()["status"] == "updated"
+    assert len(dummy_db.contacts) == 1
+
+
+def test_write_sets_session_lsn_cookie(client, dummy_db, monkeypatch):
+    from app import db, replicas
+
+    monkeypatch.setattr(db, "get_replicas", lambda: object())
+    upsert = dummy_db.upsert_contact
+
+    def upsert_on_primary(name, email):
+        db._session_lsn.set(replicas.parse_lsn("0/3000060"))
+        return upsert(name, email)
+
+    monkeypatch.setattr(db, "upsert_contact", upsert_on_primary)
+    resp = client.post("/add", data={"name": "Sticky", "email": "sticky@example.com"})
+    assert "db_lsn=0/3000060" in resp.headers["Set-Cookie"]
+
+    seen = []
+    monkeypatch.setattr(
+        db, "list_contacts", lambda **kwargs: seen.append(db.get_session_lsn()) or dummy_db.list_contacts(**kwargs)
+    )
+    resp = client.get("/")
+    assert seen == ["0/3000060"]
+    assert "db_lsn" not in resp.headers.get("Set-Cookie", "")
+
+
+def test_health_endpoints(client, monkeypatch):
+    from app import db, health
+
+    pings = []
+
+    def ping():
+        pings.append(1)
+        return {"ok": True, "latency_ms": 0.1}
+
+    check = health.ReadinessCheck(interval=60)
+    monkeypatch.setattr(check, "_ping", ping)
+    monkeypatch.setattr(health, "readiness", check)
+    stats = {"in_use": 5, "idle": 0, "maxconn": 5, "waiting": 0, "wait_time_total": 0.0}
+    monkeypatch.setattr(db, "pool_stats", lambda: stats)
+
+    assert client.get("/healthz").get_json() == {"status": "ok"}
+    for _ in range(3):
+        resp = client.get("/readyz")
+        assert resp.status_code == 200
+    # SELECT 1 кэшируется, а не выполняется на каждую пробу
+    assert len(pings) == 1
+
+    stats["waiting"] = 6
+    resp = client.get("/readyz")
+    assert resp.status_code == 503
+    assert resp.get_json()["checks"]["pool"]["ok"] is False
+
+    assert "/healthz" not in client.get("/metrics").get_data(as_text=True)
+    assert "/readyz" not in client.get("/metrics").get_data(as_text=True)
+
+
+def test_readyz_reports_database_error(client, monkeypatch):
+    from app import db, health
+
+    @contextmanager
+    def broken_connection():
+        raise psycopg2.OperationalError("could not connect to server")
+        yield
+
+    monkeypatch.setattr(health, "readiness", health.ReadinessCheck(interval=0))
+    monkeypatch.setattr(db, "pool_stats", lambda: None)
+    monkeypatch.setattr(db, "get_connection", broken_connection)
+    resp = client.get("/readyz")
+    assert resp.status_code == 503
+    assert "could not connect" in resp.get_json()["checks"]["database"]["error"]
+
+
+def test_events_streams_are_capped(dummy_db, monkeypatch):
+    from app import notify, web_app
+
+    class FakeSubscription:
+        def get(self, timeout=None):
+            return None
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(notify, "subscribe", FakeSubscription)
+    monkeypatch.setattr(web_app, "SSE_MAX_STREAMS", 1)
+    app = create_app()
+    app.config.update({"TESTING": True})
+    client = app.test_client()
+
+    first = client.get("/events", buffered=False)
+    assert first.status_code == 200
+    busy = client.get("/events")
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == str(web_app.SSE_RETRY_SECONDS)
+    # Закрытый поток освобождает место
+    first.close()
+    second = client.get("/events", buffered=False)
+    assert second.status_code == 200
+    second.close()
@@ -0,0 +1,90 @@
+"""
+Тесты отложенной записи с групповым коммитом (без PostgreSQL: запись группы подменяется).
+"""
+import queue
+import threading
+
+import psycopg2
+import pytest
+
+from app import db, write_behind
+
+
+class RecordingFlush:
+    """
+    Запоминает группы и отвечает как db.apply_batch.
+    """
+
+    def __init__(self, release: threading.Event = None):
+        self.batches = []
+        self.release = release
+
+    def __call__(self, operations):
+        if self.release is not None:
+            self.release.wait(5)
+        self.batches.append([o["email"] for o in operations])
+        start = sum(len(batch) for batch in self.batches[:-1])
+        return [{"op": "create", "id": start + i + 1, "status": "created"} for i in range(len(operations))]
+
+
+def test_submissions_are_committed_in_groups():
+    release = threading.Event()
+    flush = RecordingFlush(release)
+    write_queue = write_behind.WriteBehindQueue(flush, window=0.05, max_batch=3).start()
+    try:
+        # Первая группа ждёт release, пока в очереди копятся следующие контакты
+        futures = [write_queue.submit(f"User {i}", f"user{i}@example.com") for i in range(7)]
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        write_queue.stop()
+    assert [result["id"] for result in results] == list(range(1, 8))
+    assert sum(len(batch) for batch in flush.batches) == 7
+    assert max(len(batch) for batch in flush.batches) == 3
+    assert len(flush.batches) < 7
+
+
+def test_stop_drains_queue():
+    release = threading.Event()
+    flush = RecordingFlush(release)
+    write_queue = write_behind.WriteBehindQueue(flush, window=0, max_batch=2).start()
+    futures = [write_queue.submit(f"User {i}", f"user{i}@example.com") for i in range(5)]
+    release.set()
+    write_queue.stop()
+    assert all(future.done() for future in futures)
+    assert [email for batch in flush.batches for email in batch] == [f"user{i}@example.com" for i in range(5)]
+    with pytest.raises(queue.Full):
+        write_queue.submit("Late", "late@example.com")
+
+
+def test_failed_group_fails_every_request():
+    def failing_flush(operations):
+        raise psycopg2.OperationalError("server closed the connection")
+
+    write_queue = write_behind.WriteBehindQueue(failing_flush, window=0).start()
+    try:
+        future = write_queue.submit("User", "user@example.com")
+        with pytest.raises(psycopg2.OperationalError):
+            future.result(timeout=5)
+    finally:
+        write_queue.stop()
+
+
+@pytest.mark.parametrize("mode, expected", [("durable", (1, "created")), ("fast", (None, "queued"))])
+def test_upsert_contact_modes(monkeypatch, mode, expected):
+    flush = RecordingFlush()
+    monkeypatch.setenv("WRITE_BEHIND", mode)
+    monkeypatch.setattr(db, "apply_batch", flush)
+    monkeypatch.setattr(write_behind, "_queue", None)
+    try:
+        assert write_behind.upsert_contact("User", "user@example.com") == expected
+    finally:
+        write_behind.stop()
+    assert flush.batches == [["user@example.com"]]
+
+
+def test_off_mode_writes_directly(monkeypatch):
+    monkeypatch.setenv("WRITE_BEHIND", "off")
+    monkeypatch.setattr(db, "upsert_contact", lambda name, email: (5, "unchanged"))
+    assert write_behind.upsert_contact("User", "user@example.com") == (5, "unchanged")
+    assert write_behind.get_queue() is None